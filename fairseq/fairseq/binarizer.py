@@ -6,6 +6,7 @@
 import os
 from collections import Counter
 
+from fairseq import edit_distance
 from fairseq.tokenizer import tokenize_line
 import torch
 
@@ -20,6 +21,58 @@ def safe_readline(f):
             f.seek(pos)  # search where this character begins
 
 
+# number of lines encoded at once by Dictionary.encode_lines
+CHUNK_SIZE = 10000
+
+
+def read_chunks(f, end=-1, chunk_size=CHUNK_SIZE):
+    """Yield lists of up to *chunk_size* lines of *f*, from its current
+    position to the line ending after *end* (or to the end of file if
+    *end* <= 0)."""
+    chunk = []
+    # next(f) breaks f.tell(), hence readline() must be used
+    line = safe_readline(f)
+    while line:
+        if end > 0 and f.tell() > end:
+            break
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+        line = f.readline()
+    if len(chunk) > 0:
+        yield chunk
+
+
+def encode_noise_lines(
+    f, f_noise, f_pos, end, dict, tokenize=tokenize_line,
+    append_eos=True, reverse_order=False, replaced=None,
+):
+    """Yield ``(line_pos, ids, ids_noise)`` for every line of the clean,
+    noisy and pos files read by :func:`Binarizer.binarize_noise`.
+
+    *ids_noise* is ``None`` for lines without noise (empty *line_pos*).
+    Lines are encoded one chunk at a time with
+    :func:`Dictionary.encode_lines`.
+    """
+    kwargs = {
+        'line_tokenizer': tokenize,
+        'append_eos': append_eos,
+        'reverse_order': reverse_order,
+        'replaced': replaced,
+    }
+    for lines in read_chunks(f, end):
+        lines_noise = [f_noise.readline().strip() for _ in lines]
+        lines_pos = [f_pos.readline().strip() for _ in lines]
+        ids = dict.split_encoded_lines(*dict.encode_lines(lines, **kwargs))
+        ids_noise = iter(dict.split_encoded_lines(*dict.encode_lines(
+            [noise for noise, pos in zip(lines_noise, lines_pos) if len(pos) > 0],
+            **kwargs
+        )))
+        for line_pos, line_ids in zip(lines_pos, ids):
+            yield line_pos, line_ids, next(ids_noise) if len(line_pos) > 0 else None
+
+
 class Binarizer:
     @staticmethod
     def binarize(
@@ -32,44 +85,39 @@ class Binarizer:
         offset=0,
         end=-1,
         already_numberized=False,
+        duplicate=True,
     ):
         nseq, ntok = 0, 0
         replaced = Counter()
 
-        def replaced_consumer(word, idx):
-            if idx == dict.unk_index and word != dict.unk_word:
-                replaced.update([word])
-
         with open(filename, "r", encoding="utf-8") as f:
             f.seek(offset)
-            # next(f) breaks f.tell(), hence readline() must be used
-            line = safe_readline(f)
-            while line:
-                if end > 0 and f.tell() > end:
-                    break
+            for lines in read_chunks(f, end):
                 if already_numberized:
-                    id_strings = line.strip().split()
-                    id_list = [int(id_string) for id_string in id_strings]
-                    if reverse_order:
-                        id_list.reverse()
-                    if append_eos:
-                        id_list.append(dict.eos())
-                    ids = torch.IntTensor(id_list)
+                    ids_list = []
+                    for line in lines:
+                        id_strings = line.strip().split()
+                        id_list = [int(id_string) for id_string in id_strings]
+                        if reverse_order:
+                            id_list.reverse()
+                        if append_eos:
+                            id_list.append(dict.eos())
+                        ids_list.append(torch.IntTensor(id_list))
                 else:
-                    ids = dict.encode_line(
-                        line=line,
+                    ids_list = dict.split_encoded_lines(*dict.encode_lines(
+                        lines,
                         line_tokenizer=tokenize,
-                        add_if_not_exist=False,
-                        consumer=replaced_consumer,
                         append_eos=append_eos,
                         reverse_order=reverse_order,
-                    )
-                nseq += 1
-                ntok += len(ids)
-                # noisy input repeat
-                consumer(ids)
-                consumer(ids)
-                line = f.readline()
+                        replaced=replaced,
+                    ))
+                for ids in ids_list:
+                    nseq += 1
+                    ntok += len(ids)
+                    consumer(ids)
+                    # noisy input repeat, see binarize_noise()
+                    if duplicate:
+                        consumer(ids)
         return {
             "nseq": nseq,
             "nunk": sum(replaced.values()),
@@ -103,47 +151,37 @@ class Binarizer:
         reverse_order=False,
         offset=0,
         end=-1,
+        noise_offset=0,
+        pos_offset=0,
+        duplicate=True,
     ):
         nseq, ntok = 0, 0
         replaced = Counter()
+        # insertion labels, to build the insert shortlist
+        inserted = Counter()
 
-        def replaced_consumer(word, idx):
-            if idx == dict.unk_index and word != dict.unk_word:
-                replaced.update([word])
-
-        with open(filename, "r", encoding="utf-8") as f:
+        with open(filename, "r", encoding="utf-8") as f, \
+                open(filename_noise, 'r', encoding='utf-8') as f_noise, \
+                open(filename_pos, 'r', encoding='utf-8') as f_pos:
             f.seek(offset)
-            # next(f) breaks f.tell(), hence readline() must be used
-            line = safe_readline(f)
-
-            f_noise = open(filename_noise, 'r', encoding='utf-8')
-            f_pos = open(filename_pos, 'r', encoding='utf-8')
-
-            line_num = 1
-            while line:
-                print(line_num)
-                line_num += 1
-                if end > 0 and f.tell() > end:
-                    break
-
-                # noise 输入
-                line_noise = f_noise.readline().strip()
-                # 错误标示
-                # <Wrong-[竞争对手]-[竞争@@|怼@@|手]-[1]>|30 <DropPunc-[。]>|32
-                line_pos = f_pos.readline().strip()
-                line = line.strip()
-
+            # the noise and pos files are line-aligned with *filename*, see
+            # find_aligned_offsets()
+            f_noise.seek(noise_offset)
+            f_pos.seek(pos_offset)
+            # 错误标示
+            # <Wrong-[竞争对手]-[竞争@@|怼@@|手]-[1]>|30 <DropPunc-[。]>|32
+            lines = encode_noise_lines(
+                f, f_noise, f_pos, end, dict,
+                tokenize=tokenize,
+                append_eos=append_eos,
+                reverse_order=reverse_order,
+                replaced=replaced,
+            )
+            for line_pos, ids_line, ids_noise in lines:
                 if len(line_pos) == 0:
                     # no error
                     # assert line == line_noise
-                    ids_src1 = dict.encode_line(
-                        line=line,
-                        line_tokenizer=tokenize,
-                        add_if_not_exist=False,
-                        consumer=replaced_consumer,
-                        append_eos=append_eos,
-                        reverse_order=reverse_order,
-                    )
+                    ids_src1 = ids_line
                     ids_ref1 = torch.zeros_like(ids_src1)
                     ids_src2 = ids_src1
                     ids_ref2 = ids_ref1
@@ -151,16 +189,7 @@ class Binarizer:
 
                 else:
                     # line 正确的输入
-                    line_noise_tokens = line_noise.split()
-                    line_noise_tokens.append('<eos>')
-                    ids_src1 = dict.encode_line(
-                        line=line_noise,
-                        line_tokenizer=tokenize,
-                        add_if_not_exist=False,
-                        consumer=replaced_consumer,
-                        append_eos=append_eos,
-                        reverse_order=reverse_order,
-                    )
+                    ids_src1 = ids_noise
                     ids_ref1 = torch.zeros_like(ids_src1)
                     pos_all = line_pos.split()
                     ids_ref1_list = torch.zeros_like(ids_src1)
@@ -196,17 +225,14 @@ class Binarizer:
                     ids_ref2 = ids_ref1_list.index_select(dim=-1, index=indices)
 
                     
-                    ids_src3 = dict.encode_line(
-                        line=line,
-                        line_tokenizer=tokenize,
-                        add_if_not_exist=False,
-                        consumer=replaced_consumer,
-                        append_eos=append_eos,
-                        reverse_order=reverse_order,
-                    )
+                    ids_src3 = ids_line
      
-                nseq += 2
-                ntok += len(ids_src1*2)
+                # the examples written, with the noisy input repeat
+                copies = 2 if duplicate else 1
+                nseq += copies
+                ntok += copies * len(ids_src1)
+
+                inserted.update(ids_ref2[ids_ref2.ne(0)].tolist())
 
                 consumer_src1(ids_src1)
                 consumer_ref1(ids_ref1)
@@ -215,20 +241,113 @@ class Binarizer:
                 consumer_src3(ids_src3)
 
                 # exist errors, add noisy input -> clean output
-                #if len(line_pos) != 0:
-                consumer_src1(ids_src1)
-                consumer_ref1(ids_ref1)
-                consumer_src2(ids_src2)
-                consumer_ref2(ids_ref2)
-                consumer_src3(ids_src1)
+                # without *duplicate* this copy is left to
+                # DuplicateViewDataset at load time
+                if duplicate:
+                    consumer_src1(ids_src1)
+                    consumer_ref1(ids_ref1)
+                    consumer_src2(ids_src2)
+                    consumer_ref2(ids_ref2)
+                    consumer_src3(ids_src1)
+        return {
+            "nseq": nseq,
+            "nunk": sum(replaced.values()),
+            "ntok": ntok,
+            "replaced": replaced,
+            "inserted": inserted,
+        }
+
+    @staticmethod
+    def binarize_withref(
+        filename, filename_noise,
+        dict,
+        consumer_src1, consumer_ref1, consumer_src2, consumer_ref2, consumer_src3,
+        tokenize=tokenize_line,
+        append_eos=True,
+        reverse_order=False,
+        offset=0,
+        end=-1,
+        noise_offset=0,
+        duplicate=True,
+        labels=True,
+    ):
+        """Like :func:`binarize_noise`, with the edit labels derived from the
+        edits turning the lines of *filename_noise* into the clean lines of
+        *filename*, see :mod:`fairseq.edit_distance`.
 
+        Without *labels*, only *consumer_src1* and *consumer_src3* are called
+        and the labels are left to :class:`LanguagePairDataset`.
+        """
+        nseq, ntok = 0, 0
+        replaced = Counter()
+        inserted = Counter()
+        kwargs = {
+            'line_tokenizer': tokenize,
+            'append_eos': append_eos,
+            'reverse_order': reverse_order,
+            'replaced': replaced,
+        }
 
-                line = f.readline()
+        with open(filename, "r", encoding="utf-8") as f, \
+                open(filename_noise, 'r', encoding='utf-8') as f_noise:
+            f.seek(offset)
+            f_noise.seek(noise_offset)
+            for lines in read_chunks(f, end):
+                lines_noise = [f_noise.readline() for _ in lines]
+                ids_list = dict.split_encoded_lines(*dict.encode_lines(lines, **kwargs))
+                ids_noise_list = dict.split_encoded_lines(
+                    *dict.encode_lines(lines_noise, **kwargs)
+                )
+                if labels:
+                    xs = [ids.tolist() for ids in ids_noise_list]
+                    ys = [ids.tolist() for ids in ids_list]
+                    labels_list = [
+                        edit_distance.edit_labels(ops, x, y)
+                        for ops, x, y in zip(edit_distance.batch_edit_ops(xs, ys), xs, ys)
+                    ]
+                else:
+                    labels_list = [None] * len(ids_list)
+                for ids_src1, ids_src3, line_labels in zip(
+                    ids_noise_list, ids_list, labels_list
+                ):
+                    # counted like binarize_noise()
+                    copies = 2 if duplicate else 1
+                    nseq += copies
+                    ntok += copies * len(ids_src1)
+
+                    if line_labels is None:
+                        consumer_src1(ids_src1)
+                        consumer_src3(ids_src3)
+                        if duplicate:
+                            consumer_src1(ids_src1)
+                            consumer_src3(ids_src1)
+                        continue
+
+                    ref1, src2, ref2 = line_labels
+                    ids_ref1 = ids_src1.new_tensor(ref1)
+                    ids_src2 = ids_src1.new_tensor(src2)
+                    ids_ref2 = ids_src1.new_tensor(ref2)
+                    inserted.update(r for r in ref2 if r != 0)
+
+                    consumer_src1(ids_src1)
+                    consumer_ref1(ids_ref1)
+                    consumer_src2(ids_src2)
+                    consumer_ref2(ids_ref2)
+                    consumer_src3(ids_src3)
+
+                    # noisy input -> clean output, see binarize_noise()
+                    if duplicate:
+                        consumer_src1(ids_src1)
+                        consumer_ref1(ids_ref1)
+                        consumer_src2(ids_src2)
+                        consumer_ref2(ids_ref2)
+                        consumer_src3(ids_src1)
         return {
             "nseq": nseq,
             "nunk": sum(replaced.values()),
             "ntok": ntok,
             "replaced": replaced,
+            "inserted": inserted,
         }
 
     @staticmethod
@@ -242,3 +361,51 @@ class Binarizer:
                 safe_readline(f)
                 offsets[i] = f.tell()
             return offsets
+
+    @staticmethod
+    def find_aligned_offsets(filename, aligned_filenames, num_chunks):
+        """Split *filename* into *num_chunks* chunks and return the offsets of
+        the same line boundaries in each of *aligned_filenames*.
+
+        The files must have the same number of lines. Returns a list with the
+        offsets of *filename* followed by those of every aligned file, each in
+        the format of :func:`find_offsets`.
+        """
+        offsets = Binarizer.find_offsets(filename, num_chunks)
+        if num_chunks == 1:
+            return [offsets] + [list(offsets) for _ in aligned_filenames]
+
+        # line number at which each chunk starts
+        chunk_lines = [0 for _ in range(num_chunks + 1)]
+        with open(filename, "rb") as f:
+            pos, lineno, i = 0, 0, 1
+            for line in f:
+                while i < num_chunks and offsets[i] <= pos:
+                    chunk_lines[i] = lineno
+                    i += 1
+                if i == num_chunks:
+                    break
+                pos += len(line)
+                lineno += 1
+            while i < num_chunks:
+                chunk_lines[i] = lineno
+                i += 1
+
+        all_offsets = [offsets]
+        for aligned_filename in aligned_filenames:
+            aligned_offsets = [0 for _ in range(num_chunks + 1)]
+            with open(aligned_filename, "rb") as f:
+                pos, lineno, i = 0, 0, 1
+                for line in f:
+                    while i < num_chunks and chunk_lines[i] <= lineno:
+                        aligned_offsets[i] = pos
+                        i += 1
+                    if i == num_chunks:
+                        break
+                    pos += len(line)
+                    lineno += 1
+                while i < num_chunks:
+                    aligned_offsets[i] = pos
+                    i += 1
+            all_offsets.append(aligned_offsets)
+        return all_offsets
@@ -6,6 +6,7 @@
 import os
 from collections import Counter
 
+from fairseq.binarizer import encode_noise_lines, read_chunks
 from fairseq.tokenizer import tokenize_line
 import torch
 
@@ -32,44 +33,39 @@ class Binarizer:
         offset=0,
         end=-1,
         already_numberized=False,
+        duplicate=True,
     ):
         nseq, ntok = 0, 0
         replaced = Counter()
 
-        def replaced_consumer(word, idx):
-            if idx == dict.unk_index and word != dict.unk_word:
-                replaced.update([word])
-
         with open(filename, "r", encoding="utf-8") as f:
             f.seek(offset)
-            # next(f) breaks f.tell(), hence readline() must be used
-            line = safe_readline(f)
-            while line:
-                if end > 0 and f.tell() > end:
-                    break
+            for lines in read_chunks(f, end):
                 if already_numberized:
-                    id_strings = line.strip().split()
-                    id_list = [int(id_string) for id_string in id_strings]
-                    if reverse_order:
-                        id_list.reverse()
-                    if append_eos:
-                        id_list.append(dict.eos())
-                    ids = torch.IntTensor(id_list)
+                    ids_list = []
+                    for line in lines:
+                        id_strings = line.strip().split()
+                        id_list = [int(id_string) for id_string in id_strings]
+                        if reverse_order:
+                            id_list.reverse()
+                        if append_eos:
+                            id_list.append(dict.eos())
+                        ids_list.append(torch.IntTensor(id_list))
                 else:
-                    ids = dict.encode_line(
-                        line=line,
+                    ids_list = dict.split_encoded_lines(*dict.encode_lines(
+                        lines,
                         line_tokenizer=tokenize,
-                        add_if_not_exist=False,
-                        consumer=replaced_consumer,
                         append_eos=append_eos,
                         reverse_order=reverse_order,
-                    )
-                nseq += 1
-                ntok += len(ids)
-                # noisy input repeat
-                consumer(ids)
-                consumer(ids)
-                line = f.readline()
+                        replaced=replaced,
+                    ))
+                for ids in ids_list:
+                    nseq += 1
+                    ntok += len(ids)
+                    consumer(ids)
+                    # noisy input repeat, see binarize_noise()
+                    if duplicate:
+                        consumer(ids)
         return {
             "nseq": nseq,
             "nunk": sum(replaced.values()),
@@ -103,50 +99,37 @@ class Binarizer:
         reverse_order=False,
         offset=0,
         end=-1,
+        noise_offset=0,
+        pos_offset=0,
+        duplicate=True,
     ):
         nseq, ntok = 0, 0
         replaced = Counter()
+        # insertion labels, to build the insert shortlist
+        inserted = Counter()
 
-        def replaced_consumer(word, idx):
-            if idx == dict.unk_index and word != dict.unk_word:
-                replaced.update([word])
-
-        with open(filename, "r", encoding="utf-8") as f:
+        with open(filename, "r", encoding="utf-8") as f, \
+                open(filename_noise, 'r', encoding='utf-8') as f_noise, \
+                open(filename_pos, 'r', encoding='utf-8') as f_pos:
             f.seek(offset)
-            # next(f) breaks f.tell(), hence readline() must be used
-            line = safe_readline(f)
-
-            f_noise = open(filename_noise, 'r', encoding='utf-8')
-            f_pos = open(filename_pos, 'r', encoding='utf-8')
-
-            line_num = 1
-            while line:
-                print(line_num)
-                line_num += 1
-                if end > 0 and f.tell() > end:
-                    break
-
-                # noise 输入
-                line_noise = f_noise.readline().strip()
-                print(line_noise)
-                # 错误标示
-                # <Wrong-[竞争对手]-[竞争@@|怼@@|手]-[1]>|30 <DropPunc-[。]>|32
-                line_pos = f_pos.readline().strip()
-                print(line_pos)
-                line = line.strip()
-                print(line)
-
+            # the noise and pos files are line-aligned with *filename*, see
+            # find_aligned_offsets()
+            f_noise.seek(noise_offset)
+            f_pos.seek(pos_offset)
+            # 错误标示
+            # <Wrong-[竞争对手]-[竞争@@|怼@@|手]-[1]>|30 <DropPunc-[。]>|32
+            lines = encode_noise_lines(
+                f, f_noise, f_pos, end, dict,
+                tokenize=tokenize,
+                append_eos=append_eos,
+                reverse_order=reverse_order,
+                replaced=replaced,
+            )
+            for line_pos, ids_line, ids_noise in lines:
                 if len(line_pos) == 0:
                     # no error
                     # assert line == line_noise
-                    ids_src1 = dict.encode_line(
-                        line=line,
-                        line_tokenizer=tokenize,
-                        add_if_not_exist=False,
-                        consumer=replaced_consumer,
-                        append_eos=append_eos,
-                        reverse_order=reverse_order,
-                    )
+                    ids_src1 = ids_line
                     ids_ref1 = torch.zeros_like(ids_src1)
                     ids_src2 = ids_src1
                     ids_ref2 = ids_ref1
@@ -154,16 +137,7 @@ class Binarizer:
 
                 else:
                     # line 正确的输入
-                    line_noise_tokens = line_noise.split()
-                    line_noise_tokens.append('<eos>')
-                    ids_src1 = dict.encode_line(
-                        line=line_noise,
-                        line_tokenizer=tokenize,
-                        add_if_not_exist=False,
-                        consumer=replaced_consumer,
-                        append_eos=append_eos,
-                        reverse_order=reverse_order,
-                    )
+                    ids_src1 = ids_noise
                     ids_ref1 = torch.zeros_like(ids_src1)
                     pos_all = line_pos.split()
                     ids_ref1_list = torch.zeros_like(ids_src1)
@@ -198,17 +172,14 @@ class Binarizer:
                     ids_ref2 = ids_ref1_list.index_select(dim=-1, index=indices)
 
                     
-                    ids_src3 = dict.encode_line(
-                        line=line,
-                        line_tokenizer=tokenize,
-                        add_if_not_exist=False,
-                        consumer=replaced_consumer,
-                        append_eos=append_eos,
-                        reverse_order=reverse_order,
-                    )
+                    ids_src3 = ids_line
+
+                # the examples written, with the noisy input repeat
+                copies = 2 if duplicate else 1
+                nseq += copies
+                ntok += copies * len(ids_src1)
 
-                nseq += 2
-                ntok += len(ids_src1*2)
+                inserted.update(ids_ref2[ids_ref2.ne(0)].tolist())
 
                 consumer_src1(ids_src1)
                 consumer_ref1(ids_ref1)
@@ -217,20 +188,20 @@ class Binarizer:
                 consumer_src3(ids_src3)
 
                 # exist errors, add noisy input -> clean output
-                #if len(line_pos) != 0:
-                consumer_src1(ids_src1)
-                consumer_ref1(ids_ref1)
-                consumer_src2(ids_src2)
-                consumer_ref2(ids_ref2)
-                consumer_src3(ids_src1)
-
-
-                line = f.readline()
+                # without *duplicate* this copy is left to
+                # DuplicateViewDataset at load time
+                if duplicate:
+                    consumer_src1(ids_src1)
+                    consumer_ref1(ids_ref1)
+                    consumer_src2(ids_src2)
+                    consumer_ref2(ids_ref2)
+                    consumer_src3(ids_src1)
         return {
             "nseq": nseq,
             "nunk": sum(replaced.values()),
             "ntok": ntok,
             "replaced": replaced,
+            "inserted": inserted,
         }
 
     @staticmethod
@@ -221,6 +221,73 @@ vector<vector<vector<uint32_t>>> suggested_ed2_path_with_delete(
   return seq;
 }
 
+vector<uint32_t> edit_distance_backtracking_with_substitute(
+    vector<uint32_t>& x,
+    vector<uint32_t>& y) {
+  /*
+  unit cost edit script turning x into y:
+  0 keep, 1 delete (x), 2 substitute (x by y), 3 insert (y)
+  ties are broken like the backtrace of generate_data_withref/edit.py,
+  see fairseq/edit_distance.py
+  */
+  uint32_t lx = x.size();
+  uint32_t ly = y.size();
+  // d[i * (lx + 1) + j]: distance between x[:j] and y[:i]
+  vector<uint32_t> d((lx + 1) * (ly + 1));
+  for (uint32_t j = 0; j < lx + 1; j++) {
+    d[j] = j;
+  }
+  for (uint32_t i = 1; i < ly + 1; i++) {
+    uint32_t* row = d.data() + i * (lx + 1);
+    uint32_t* prev = row - (lx + 1);
+    row[0] = i;
+    for (uint32_t j = 1; j < lx + 1; j++) {
+      if (y[i - 1] == x[j - 1]) {
+        row[j] = prev[j - 1];
+      } else {
+        row[j] = min(min(prev[j - 1], row[j - 1]), prev[j]) + 1;
+      }
+    }
+  }
+
+  vector<uint32_t> ops;
+  uint32_t i = ly;
+  uint32_t j = lx;
+  while ((i > 0) || (j > 0)) {
+    uint32_t cur = d[i * (lx + 1) + j];
+    if ((i > 0) && (j > 0) && (cur == d[(i - 1) * (lx + 1) + j - 1]) &&
+        (y[i - 1] == x[j - 1])) {
+      ops.push_back(0); // keep
+      i--;
+      j--;
+    } else if ((j > 0) && (cur == d[i * (lx + 1) + j - 1] + 1)) {
+      ops.push_back(1); // delete
+      j--;
+    } else if (
+        (i > 0) && (j > 0) && (cur == d[(i - 1) * (lx + 1) + j - 1] + 1)) {
+      ops.push_back(2); // substitute
+      i--;
+      j--;
+    } else {
+      ops.push_back(3); // insert
+      i--;
+    }
+  }
+  reverse(ops.begin(), ops.end());
+  return ops;
+}
+
+vector<vector<uint32_t>> suggested_ed_ops(
+    vector<vector<uint32_t>>& xs,
+    vector<vector<uint32_t>>& ys) {
+  vector<vector<uint32_t>> ops(xs.size());
+  for (uint32_t i = 0; i < xs.size(); i++) {
+    ops.at(i) =
+        edit_distance_backtracking_with_substitute(xs.at(i), ys.at(i));
+  }
+  return ops;
+}
+
 PYBIND11_MODULE(libnat, m) {
   m.def("compute_ed2", &compute_ed2, "compute_ed2");
   m.def("suggested_ed2_path", &suggested_ed2_path, "suggested_ed2_path");
@@ -228,4 +295,5 @@ PYBIND11_MODULE(libnat, m) {
       "suggested_ed2_path_with_delete",
       &suggested_ed2_path_with_delete,
       "suggested_ed2_path_with_delete");
+  m.def("suggested_ed_ops", &suggested_ed_ops, "suggested_ed_ops");
 }
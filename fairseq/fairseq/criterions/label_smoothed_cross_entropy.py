@@ -87,28 +87,45 @@ class LabelSmoothedCrossEntropyCriterion(FairseqCriterion):
             lprobs_translation, target, self.eps, ignore_index=self.padding_idx, reduce=reduce,
         )
 
-        # delete
-        outputs = net_output['delete']['out'].view(-1, net_output['delete']['out'].size(-1))
+        # delete, the heads are only applied to the non-pad positions
         masks = ~(net_output['delete']['mask'].view(-1))
-        targets = sample['ref1'].view(-1, 1)
-        outputs,targets = outputs[masks], targets[masks]
+        targets = sample['ref1'].view(-1, 1)[masks]
         nll_loss_delete = nll_loss(
-            outputs, targets, reduce=reduce
+            net_output['delete']['out'], targets, reduce=reduce
         )
 
-        # insert
-        outputs = net_output['insert']['out'].view(-1, net_output['insert']['out'].size(-1))
-        masks = ~(net_output['insert']['mask'].view(-1))
-        targets = sample['ref2'].view(-1, 1)
-        outputs, targets = outputs[masks], targets[masks]
-        nll_loss_insert = nll_loss(
-            outputs, targets, reduce=reduce
-        )
+        # insert, the targets are the classes of the non-pad positions
+        insert_out = net_output['insert']
+        targets = insert_out['targets'].view(-1, 1)
+        if insert_out['gate'] is None:
+            # tokens outside the insert shortlist can not be predicted
+            known = targets.view(-1).ge(0)
+            nll_loss_insert = nll_loss(
+                insert_out['out'], targets[known], reduce=reduce
+            )
+        else:
+            nll_loss_insert = self.compute_factorized_insert_loss(
+                insert_out, targets, reduce=reduce
+            )
 
         return loss_translation+nll_loss_delete+nll_loss_insert, \
                     loss_translation.data, nll_loss_translation.data, \
                         nll_loss_delete.data, nll_loss_insert.data
 
+    def compute_factorized_insert_loss(self, insert_out, targets, reduce=True):
+        """Loss of the factorized insertion head: the gate is trained at every
+        position and the vocabulary only scored (teacher-forced) where *targets*
+        insert a token, see :func:`TransformerModel.forward_insert_heads`."""
+        gated = targets.view(-1).ne(0)
+        loss = nll_loss(insert_out['gate'], gated.long(), reduce=False)
+        # tokens outside the insert shortlist only train the gate
+        scored = targets.view(-1).gt(0)
+        token_loss = nll_loss(insert_out['out'], targets[scored], reduce=False)
+        loss = loss.masked_scatter(scored, loss[scored] + token_loss)
+        if reduce:
+            loss = loss.sum()
+        return loss
+
     @staticmethod
     def reduce_metrics(logging_outputs) -> None:
         """Aggregate logging outputs from data parallel training."""
@@ -16,8 +16,17 @@ from .colorize_dataset import ColorizeDataset
 from .concat_dataset import ConcatDataset
 from .concat_sentences_dataset import ConcatSentencesDataset
 from .denoising_dataset import DenoisingDataset
+from .duplicate_view_dataset import DuplicateViewDataset
+from .edit_noising import EditNoisingDataset
 from .id_dataset import IdDataset
-from .indexed_dataset import IndexedCachedDataset, IndexedDataset, IndexedRawTextDataset, MMapIndexedDataset
+from .indexed_dataset import (
+    EditAnnotatedDataset,
+    IndexedCachedDataset,
+    IndexedDataset,
+    IndexedRawTextDataset,
+    IndexedSharedMemoryDataset,
+    MMapIndexedDataset,
+)
 from .language_pair_dataset import LanguagePairDataset
 from .list_dataset import ListDataset
 from .lm_context_window_dataset import LMContextWindowDataset
@@ -63,6 +72,9 @@ __all__ = [
     'CountingIterator',
     'DenoisingDataset',
     'Dictionary',
+    'DuplicateViewDataset',
+    'EditAnnotatedDataset',
+    'EditNoisingDataset',
     'EpochBatchIterator',
     'FairseqDataset',
     'FairseqIterableDataset',
@@ -71,6 +83,7 @@ __all__ = [
     'IndexedCachedDataset',
     'IndexedDataset',
     'IndexedRawTextDataset',
+    'IndexedSharedMemoryDataset',
     'LanguagePairDataset',
     'LeftPadDataset',
     'ListDataset',
@@ -49,6 +49,62 @@ def collate_tokens(values, pad_idx, eos_idx=None, left_pad=False, move_eos_to_be
     return res
 
 
+def collate_tokens_fused(
+    streams, pad_idx, eos_idx=None, left_pad=None, move_eos_to_beginning=None,
+):
+    """Convert several lists of 1d tensors into padded 2d LongTensors.
+
+    Unlike calling :func:`collate_tokens` for each list, all outputs are
+    contiguous views of a single buffer, which is filled with one indexed
+    copy.
+
+    Args:
+        streams (List[List[Tensor]]): the lists of 1d tensors to collate, with
+            the same number of tensors
+        pad_idx (int): padding index
+        eos_idx (int, optional): end of sentence index
+        left_pad (List[bool], optional): whether to pad each stream on the
+            left (default: False)
+        move_eos_to_beginning (List[bool], optional): whether to move the
+            final eos of each tensor of a stream to its beginning
+            (default: False)
+
+    Returns:
+        List[LongTensor]: the ``(len(streams[i][0]), max len)`` padded tensors
+    """
+    import torch
+
+    left_pad = left_pad or [False] * len(streams)
+    move_eos_to_beginning = move_eos_to_beginning or [False] * len(streams)
+    bsz = len(streams[0])
+    rows = torch.arange(bsz)
+
+    shapes, dst_idxs, src_values = [], [], []
+    offset = 0
+    for values, left, move_eos in zip(streams, left_pad, move_eos_to_beginning):
+        lengths = torch.LongTensor([v.numel() for v in values])
+        size = int(lengths.max()) if bsz > 0 else 0
+        flat = torch.cat(values).long()
+        # position of each token in its tensor
+        starts = lengths.cumsum(0) - lengths
+        pos = torch.arange(flat.numel()) - starts.repeat_interleave(lengths)
+        if move_eos:
+            assert flat[starts + lengths - 1].eq(eos_idx).all()
+            rep_lengths = lengths.repeat_interleave(lengths)
+            flat = flat[starts.repeat_interleave(lengths) + (pos - 1 + rep_lengths) % rep_lengths]
+        row_starts = offset + rows * size
+        if left:
+            row_starts = row_starts + size - lengths
+        dst_idxs.append(row_starts.repeat_interleave(lengths) + pos)
+        src_values.append(flat)
+        shapes.append((offset, size))
+        offset += bsz * size
+
+    buf = torch.full((offset,), pad_idx, dtype=torch.long)
+    buf[torch.cat(dst_idxs)] = torch.cat(src_values)
+    return [buf[start:start + bsz * size].view(bsz, size) for start, size in shapes]
+
+
 def load_indexed_dataset(path, dictionary, dataset_impl=None, combine=False, default='cached'):
     """A helper function for loading indexed datasets.
 
@@ -161,6 +217,41 @@ def _filter_by_size_dynamic(indices, size_fn, max_positions, raise_exception=Fal
     return indices, ignored
 
 
+def filter_by_size_vectorized(indices, sizes, max_positions):
+    """
+    Vectorized equivalent of :func:`_filter_by_size_dynamic` for datasets
+    whose sizes are precomputed.
+
+    Args:
+        indices (np.array): ordered array of dataset indices
+        sizes (np.array): sizes of all the examples of the dataset, either
+            a 1d array of scalar sizes or a ``(len(dataset), k)`` array whose
+            rows are the tuples returned by ``dataset.size``
+        max_positions (int, float or tuple): filter elements larger than
+            this size. Tuples are compared component-wise and ``None``
+            components are ignored.
+
+    Returns:
+        tuple: the kept indices and the list of ignored indices
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    sizes = np.asarray(sizes)[indices]
+    if isinstance(max_positions, float) or isinstance(max_positions, int):
+        keep = sizes <= max_positions
+        if keep.ndim > 1:
+            keep = keep.all(axis=1)
+    else:
+        keep = np.ones(len(indices), dtype=np.bool_)
+        for i, max_size in enumerate(max_positions):
+            if max_size is None:
+                continue
+            if sizes.ndim == 1:
+                keep &= sizes <= max_size
+            elif i < sizes.shape[1]:
+                keep &= sizes[:, i] <= max_size
+    return indices[keep], indices[~keep].tolist()
+
+
 def filter_by_size(indices, dataset, max_positions, raise_exception=False):
     """
     Filter indices based on their size.
@@ -173,17 +264,7 @@ def filter_by_size(indices, dataset, max_positions, raise_exception=False):
         raise_exception (bool, optional): if ``True``, raise an exception if
             any elements are filtered (default: False).
     """
-    if isinstance(max_positions, float) or isinstance(max_positions, int):
-        if hasattr(dataset, 'sizes') and isinstance(dataset.sizes, np.ndarray):
-            ignored = indices[dataset.sizes[indices] > max_positions].tolist()
-            indices = indices[dataset.sizes[indices] <= max_positions]
-        elif hasattr(dataset, 'sizes') and isinstance(dataset.sizes, list) and len(dataset.sizes) == 1:
-            ignored = indices[dataset.sizes[0][indices] > max_positions].tolist()
-            indices = indices[dataset.sizes[0][indices] <= max_positions]
-        else:
-            indices, ignored = _filter_by_size_dynamic(indices, dataset.size, max_positions)
-    else:
-        indices, ignored = _filter_by_size_dynamic(indices, dataset.size, max_positions)
+    indices, ignored = dataset.filter_indices_by_size(indices, max_positions)
 
     if len(ignored) > 0 and raise_exception:
         raise Exception((
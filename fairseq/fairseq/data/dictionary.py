@@ -5,8 +5,10 @@
 
 import os
 from collections import Counter
+from itertools import compress, repeat
 from multiprocessing import Pool
 
+import numpy as np
 import torch
 from fairseq.binarizer import safe_readline
 from fairseq.data import data_utils
@@ -298,6 +300,64 @@ class Dictionary(object):
             ids[nwords] = self.eos_index
         return ids
 
+    def encode_lines(
+        self,
+        lines,
+        line_tokenizer=tokenize_line,
+        append_eos=True,
+        reverse_order=False,
+        replaced=None,
+    ):
+        """Encode *lines* at once without adding new symbols.
+
+        Returns:
+            tuple: a flat ``np.int32`` array with the ids of all lines and a
+            ``np.int64`` array of ``len(lines) + 1`` offsets into it, line
+            ``i`` is ``ids[offsets[i]:offsets[i + 1]]``. Words mapped to
+            unk are counted in the *replaced* Counter, if given.
+        """
+        words = []
+        sizes = np.empty(len(lines), dtype=np.int64)
+        for i, line in enumerate(lines):
+            line_words = line_tokenizer(line)
+            if reverse_order:
+                line_words = list(reversed(line_words))
+            words.extend(line_words)
+            sizes[i] = len(line_words)
+
+        ids = np.fromiter(
+            map(self.indices.get, words, repeat(self.unk_index)),
+            dtype=np.int32, count=len(words),
+        )
+        if replaced is not None:
+            unk = ids == self.unk_index
+            if unk.any():
+                replaced.update(
+                    word for word in compress(words, unk.tolist())
+                    if word != self.unk_word
+                )
+
+        if append_eos:
+            sizes += 1
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        if append_eos:
+            is_eos = np.zeros(offsets[-1], dtype=np.bool_)
+            is_eos[offsets[1:] - 1] = True
+            ids_with_eos = np.empty(offsets[-1], dtype=np.int32)
+            ids_with_eos[is_eos] = self.eos_index
+            ids_with_eos[~is_eos] = ids
+            ids = ids_with_eos
+        return ids, offsets
+
+    @staticmethod
+    def split_encoded_lines(ids, offsets):
+        """Split the output of :func:`encode_lines` into one
+        ``torch.IntTensor`` per line."""
+        ids = torch.from_numpy(ids)
+        offsets = offsets.tolist()
+        return [ids[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
     @staticmethod
     def _add_file_to_dictionary_single_worker(
         filename, tokenize, eos_word, worker_id=0, num_workers=1
@@ -0,0 +1,81 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+
+from . import BaseWrapperDataset, data_utils
+
+
+def interleave(even, odd):
+    """Array whose rows ``2 * i`` and ``2 * i + 1`` are ``even[i]`` and
+    ``odd[i]``."""
+    return np.stack([even, odd], axis=1).reshape(-1, *even.shape[1:])
+
+
+class DuplicateViewDataset(BaseWrapperDataset):
+    """Exposes every example of a :class:`LanguagePairDataset` twice without
+    storing it twice.
+
+    Example ``2 * i`` is example ``i`` unchanged (noisy input -> clean
+    source), example ``2 * i + 1`` is example ``i`` with ``src3`` replaced by
+    the noisy input ``src1``. This is the layout written by
+    :func:`Binarizer.binarize_noise` without ``--virtual-duplication``.
+
+    The number of tokens and the size of each view are those of its own
+    ``src3``, see :func:`LanguagePairDataset.token_costs`.
+
+    Args:
+        dataset (~fairseq.data.LanguagePairDataset): dataset to wrap
+        shuffle (bool, optional): shuffle dataset elements before batching
+            (default: the *shuffle* of *dataset*).
+    """
+
+    def __init__(self, dataset, shuffle=None):
+        super().__init__(dataset)
+        self.shuffle = shuffle if shuffle is not None else dataset.shuffle
+        self.src_sizes = np.repeat(dataset.src_sizes, 2)
+        self.tgt_sizes = (
+            np.repeat(dataset.tgt_sizes, 2) if dataset.tgt_sizes is not None else None
+        )
+        costs, size_matrix = dataset.token_costs(dataset.src_sizes)
+        self.costs = interleave(dataset.costs, costs)
+        self.size_matrix = interleave(dataset.size_matrix, size_matrix)
+
+    def __getitem__(self, index):
+        example = dict(self.dataset[index // 2])
+        example['id'] = index
+        if index % 2 == 1 and 'src3' in example:
+            example['src3'] = example['src1']
+        return example
+
+    def __len__(self):
+        return 2 * len(self.dataset)
+
+    @property
+    def sizes(self):
+        return self.src_sizes
+
+    def num_tokens(self, index):
+        return self.costs[index]
+
+    def size(self, index):
+        return tuple(self.size_matrix[index])
+
+    def filter_indices_by_size(self, indices, max_sizes):
+        if isinstance(max_sizes, dict):
+            return super().filter_indices_by_size(indices, max_sizes)
+        return data_utils.filter_by_size_vectorized(indices, self.size_matrix, max_sizes)
+
+    def ordered_indices(self):
+        if self.shuffle:
+            indices = np.random.permutation(len(self))
+        else:
+            indices = np.arange(len(self))
+        if self.tgt_sizes is not None:
+            indices = indices[np.argsort(self.tgt_sizes[indices], kind='mergesort')]
+        return indices[np.argsort(self.src_sizes[indices], kind='mergesort')]
+
+    def prefetch(self, indices):
+        self.dataset.prefetch(np.unique(np.asarray(indices) // 2))
@@ -0,0 +1,386 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+import torch
+
+from fairseq.data import data_utils, FairseqDataset
+
+
+class EditNoising(object):
+    """Generate a noisy version of a clean sentence together with the edits
+    that restore it.
+
+    This is the token id counterpart of the ``generate_data_*/rule.py``
+    scripts: subclasses decide per clean token whether it is kept, dropped,
+    replaced or followed by extra tokens, see :func:`noising`.
+    """
+
+    KEEP, DROP, REPLACE, INSERT = 0, 1, 2, 3
+
+    def __init__(self, dictionary, bpe_cont_marker="@@"):
+        self.dictionary = dictionary
+        self.is_bpe = np.array([
+            bpe_cont_marker is not None and self.dictionary[i].endswith(bpe_cont_marker)
+            for i in range(len(self.dictionary))
+        ])
+
+    def _indices(self, words):
+        """Map *words* to ids, skipping the ones not in the dictionary."""
+        ids = [self.dictionary.index(w) for w in words]
+        return np.array([i for i in ids if i != self.dictionary.unk()], dtype=np.int64)
+
+    def _mask(self, words):
+        mask = np.zeros(len(self.dictionary), dtype=np.bool_)
+        mask[self._indices(words)] = True
+        return mask
+
+    def _bpe_masks(self, x):
+        """Return whether each token and its predecessor are BPE
+        continuations."""
+        present_bpe = self.is_bpe[x]
+        prev_bpe = np.concatenate([[False], present_bpe[:-1]])
+        return present_bpe, prev_bpe
+
+    def edits(self, x):
+        """Decide the edit of each token of *x*.
+
+        Args:
+            x (np.ndarray): clean token ids, without eos
+
+        Returns:
+            tuple: an ``int`` op per token, the replacement id per token (for
+            ``REPLACE``) and a list with the ids following each token (for
+            ``INSERT``)
+        """
+        raise NotImplementedError()
+
+    def noising(self, tokens):
+        """Apply noise to a clean sentence.
+
+        Args:
+            tokens (LongTensor): clean token ids ending with eos
+
+        Returns:
+            tuple: ``(src1, ref1, src2, ref2)``: the noisy tokens, their delete
+            labels, the noisy tokens without the deleted ones and the id to
+            insert before each of those (0 if none)
+        """
+        x = tokens.numpy()
+        has_eos = len(x) > 0 and x[-1] == self.dictionary.eos()
+        return self._apply(x, has_eos, *self.edits(x[:-1] if has_eos else x))
+
+    def noising_with_annotations(self, tokens, words):
+        """Apply noise to a clean sentence, also returning its noisy words
+        and the annotations of the edits.
+
+        Annotations are in the ``<Tag-[...]>|position`` format written by
+        ``generate_data_*/export_for_task.py``, see :func:`annotation`.
+
+        Args:
+            tokens (LongTensor): clean token ids ending with eos
+            words (List[str]): the clean words of *tokens*, without eos
+
+        Returns:
+            tuple: the streams returned by :func:`noising`, the list of noisy
+            words and the list of annotations
+        """
+        x = tokens.numpy()
+        has_eos = len(x) > 0 and x[-1] == self.dictionary.eos()
+        body = x[:-1] if has_eos else x
+        assert len(words) == len(body), 'words do not match the tokens'
+        ops, replacements, insertions = self.edits(body)
+
+        noisy, annotations = [], []
+        for i, word in enumerate(words):
+            op = ops[i]
+            new_words = []
+            if op == self.REPLACE:
+                new_words = [self.dictionary[replacements[i]]]
+            elif op == self.INSERT:
+                new_words = [self.dictionary[t] for t in insertions[i]]
+            if op == self.KEEP or op == self.INSERT:
+                noisy.append(word)
+            if op != self.KEEP:
+                annotations.append(self.annotation(op, body[i], word, new_words, len(noisy)))
+            noisy.extend(new_words)
+        return self._apply(x, has_eos, ops, replacements, insertions), noisy, annotations
+
+    def annotation(self, op, token, word, new_words, pos):
+        """Return the annotation of an edit, e.g. ``<DropPunc-[，]>|3``.
+
+        Args:
+            op (int): ``DROP``, ``REPLACE`` or ``INSERT``
+            token (int): the clean token id
+            word (str): the clean word
+            new_words (List[str]): the replacement or inserted words
+            pos (int): position of the first new word in the noisy sentence
+                (of the next word for ``DROP``)
+        """
+        raise NotImplementedError()
+
+    def _apply(self, x, has_eos, ops, replacements, insertions):
+        body = x[:-1] if has_eos else x
+        src1, ref1, src2, ref2 = [], [], [], []
+        pending = 0
+        for i, token in enumerate(body.tolist()):
+            op = ops[i]
+            if op == self.DROP:
+                pending = token
+            elif op == self.REPLACE:
+                src1.append(int(replacements[i]))
+                ref1.append(1)
+                pending = token
+            else:
+                src1.append(token)
+                ref1.append(0)
+                src2.append(token)
+                ref2.append(pending)
+                pending = 0
+                if op == self.INSERT:
+                    src1.extend(insertions[i])
+                    ref1.extend([1] * len(insertions[i]))
+        if has_eos:
+            src1.append(int(x[-1]))
+            ref1.append(0)
+            src2.append(int(x[-1]))
+            ref2.append(pending)
+
+        return (
+            torch.LongTensor(src1), torch.LongTensor(ref1),
+            torch.LongTensor(src2), torch.LongTensor(ref2),
+        )
+
+
+class WMTEditNoising(EditNoising):
+    """Random Delete, InsertRepeat and InsertRandom noise of
+    ``generate_data_wmt/rule.py``."""
+
+    RANDOM_WORDS = [
+        'the', ',', '.', 'of', 'and', 'to', 'in', 'a', 'is', 'that', 'for',
+        'on', 'with', 'be', 'are', 'The', 'I', 'as', 'this', 'it', 'we',
+    ]
+
+    def __init__(
+        self, dictionary, delete_prob=0.02, insert_prob=0.02, repeat_prob=0.7,
+        max_repeat=3, random_words=None, bpe_cont_marker="@@",
+    ):
+        super().__init__(dictionary, bpe_cont_marker)
+        self.delete_prob = delete_prob
+        self.insert_prob = insert_prob
+        self.repeat_prob = repeat_prob
+        self.max_repeat = max_repeat
+        self.random_words = self._indices(random_words or self.RANDOM_WORDS)
+        self.has_hyphen = np.array([
+            '-' in self.dictionary[i] for i in range(len(self.dictionary))
+        ])
+
+    def edits(self, x):
+        n = len(x)
+        present_bpe, prev_bpe = self._bpe_masks(x)
+        whole_word = ~present_bpe & ~prev_bpe
+        hyphen = self.has_hyphen[x]
+
+        drop = whole_word & ~hyphen & (np.random.rand(n) < self.delete_prob)
+        insert = whole_word & ~drop & (np.random.rand(n) < self.insert_prob)
+        repeat = ~hyphen & (np.random.rand(n) <= self.repeat_prob)
+        repeats = np.random.randint(1, self.max_repeat + 1, size=n)
+        randoms = self.random_words[np.random.randint(len(self.random_words), size=n)]
+
+        ops = np.full(n, self.KEEP)
+        ops[drop] = self.DROP
+        ops[insert] = self.INSERT
+        insertions = [
+            [int(x[i])] * int(repeats[i]) if repeat[i] else [int(randoms[i])]
+            for i in range(n)
+        ]
+        return ops, None, insertions
+
+    def annotation(self, op, token, word, new_words, pos):
+        if op == self.DROP:
+            return '<Delete-[{}]>|{}'.format(word, pos)
+        if all(w == word for w in new_words):
+            return '<InsertRepeat-[{}]>|{}to{}'.format(
+                '|'.join(new_words), pos, pos + len(new_words),
+            )
+        return '<InsertRandom-[{}]>|{}'.format(new_words[0], pos)
+
+
+class SpeechEditNoising(EditNoising):
+    """DropPunc, ReplacePunc and InsertSpoken noise of
+    ``generate_data_speech/rule.py``."""
+
+    PUNCS = ['，', '。']
+    SPOKEN_WORDS = ['这个', '那个', '就是', '然后', '其实', '的话']
+
+    def __init__(
+        self, dictionary, punc_prob=0.3, drop_punc_prob=0.6, spoken_prob=0.02,
+        spoken_words=None, bpe_cont_marker="@@",
+    ):
+        super().__init__(dictionary, bpe_cont_marker)
+        self.punc_prob = punc_prob
+        self.drop_punc_prob = drop_punc_prob
+        self.spoken_prob = spoken_prob
+        self.spoken_words = self._indices(spoken_words or self.SPOKEN_WORDS)
+        self.is_punc = self._mask(self.PUNCS)
+        # each punctuation is replaced by the other one
+        self.other_punc = np.arange(len(self.dictionary))
+        if self.is_punc.sum() == len(self.PUNCS):
+            comma, period = (self.dictionary.index(p) for p in self.PUNCS)
+            self.other_punc[comma], self.other_punc[period] = period, comma
+
+    def edits(self, x):
+        n = len(x)
+        present_bpe, prev_bpe = self._bpe_masks(x)
+
+        punc = self.is_punc[x] & (np.random.rand(n) < self.punc_prob)
+        drop = punc & (np.random.rand(n) < self.drop_punc_prob)
+        replace = punc & ~drop & (self.other_punc[x] != x)
+        insert = (
+            ~punc & ~present_bpe & ~prev_bpe
+            & (np.random.rand(n) < self.spoken_prob)
+        )
+        spoken = self.spoken_words[np.random.randint(len(self.spoken_words), size=n)]
+
+        ops = np.full(n, self.KEEP)
+        ops[drop] = self.DROP
+        ops[replace] = self.REPLACE
+        ops[insert] = self.INSERT
+        insertions = [[int(token)] for token in spoken]
+        return ops, self.other_punc[x], insertions
+
+    def annotation(self, op, token, word, new_words, pos):
+        if op == self.DROP:
+            return '<DropPunc-[{}]>|{}'.format(word, pos)
+        if op == self.REPLACE:
+            return '<ReplacePunc-[{}|{}]>|{}'.format(word, new_words[0], pos)
+        return '<InsertSpoken-[{}]>|{}'.format(new_words[0], pos)
+
+
+class DialogueEditNoising(EditNoising):
+    """DropPro, DropPunc and Wrong noise of ``generate_data_dialogue/rule.py``.
+
+    Wrong words are sampled from a character confusion table in the format of
+    ``generate_data_dialogue/confusion.filter.txt``. Only confusions that are
+    a single dictionary entry are used, since edits are made on token ids.
+    """
+
+    PRONOUNS = "我的 我 我们 我们的 你 你们 你自己 他们 他们的 他 他的 她 她的".split()
+    PUNCS = ['，', '。', '？']
+
+    def __init__(
+        self, dictionary, pro_prob=1.0, punc_prob=1.0, wrong_prob=0.01,
+        confusion_table=None, bpe_cont_marker="@@",
+    ):
+        super().__init__(dictionary, bpe_cont_marker)
+        self.pro_prob = pro_prob
+        self.punc_prob = punc_prob
+        self.wrong_prob = wrong_prob
+        self.is_pro = self._mask(self.PRONOUNS)
+        self.is_punc = self._mask(self.PUNCS)
+        self.keep = self._mask(['<SEP>'])
+        self.confusions = (
+            self._load_confusions(confusion_table)
+            if confusion_table is not None else {}
+        )
+
+    def _load_confusions(self, path):
+        table = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                k, vs = line.strip().split(':')
+                table[k] = vs
+        confusions = {}
+        for i, word in enumerate(self.dictionary.symbols):
+            if self.is_bpe[i]:
+                continue
+            candidates = {
+                word.replace(c, v)
+                for c in set(word) if c in table
+                for v in table[c]
+            }
+            candidates = self._indices(sorted(candidates))
+            if len(candidates) > 0:
+                confusions[i] = candidates
+        return confusions
+
+    def edits(self, x):
+        n = len(x)
+        present_bpe, _ = self._bpe_masks(x)
+
+        pro = self.is_pro[x] & (np.random.rand(n) < self.pro_prob)
+        punc = self.is_punc[x] & (np.random.rand(n) < self.punc_prob)
+        drop = (pro | punc) & ~self.keep[x]
+        wrong = ~drop & ~present_bpe & (np.random.rand(n) < self.wrong_prob)
+
+        ops = np.full(n, self.KEEP)
+        ops[drop] = self.DROP
+        replacements = x.copy()
+        for i in wrong.nonzero()[0]:
+            candidates = self.confusions.get(int(x[i]))
+            if candidates is not None:
+                replacements[i] = np.random.choice(candidates)
+                ops[i] = self.REPLACE
+        return ops, replacements, None
+
+    def annotation(self, op, token, word, new_words, pos):
+        if op == self.DROP:
+            tag = 'DropPro' if self.is_pro[token] else 'DropPunc'
+            return '<{}-[{}]>|{}'.format(tag, word, pos)
+        return '<Wrong-[{}]-[{}]-[0]>|{}'.format(word, new_words[0], pos)
+
+
+EDIT_NOISING = {
+    'wmt': WMTEditNoising,
+    'speech': SpeechEditNoising,
+    'dialogue': DialogueEditNoising,
+}
+
+
+class EditNoisingDataset(FairseqDataset):
+    """Generate the noise streams from a clean source dataset on the fly.
+
+    Items are ``(src1, ref1, src2, ref2, src3)`` tuples like those of
+    :class:`~fairseq.data.EditAnnotatedDataset`, with the clean sentence as
+    ``src3``. The noise of an example is determined by *seed*, the epoch and
+    its index, so it changes every epoch and does not depend on the data
+    loader worker.
+
+    Args:
+        src_dataset (~torch.utils.data.Dataset): clean source dataset
+        noiser (EditNoising): noise to apply
+        seed (int): seed to use when generating random noise
+    """
+
+    def __init__(self, src_dataset, noiser, seed=1):
+        super().__init__()
+        self.src_dataset = src_dataset
+        self.noiser = noiser
+        self.seed = seed
+        self.epoch = 1
+
+    def __getitem__(self, index):
+        src3 = self.src_dataset[index]
+        with data_utils.numpy_seed(self.seed, self.epoch, index):
+            src1, ref1, src2, ref2 = self.noiser.noising(src3)
+        return src1, ref1, src2, ref2, src3
+
+    def __len__(self):
+        return len(self.src_dataset)
+
+    @property
+    def sizes(self):
+        # the clean sizes; noise changes them by a few tokens at most
+        return self.src_dataset.sizes
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    @property
+    def supports_prefetch(self):
+        return getattr(self.src_dataset, 'supports_prefetch', False)
+
+    def prefetch(self, indices):
+        self.src_dataset.prefetch(indices)
@@ -6,6 +6,8 @@
 import numpy as np
 import torch.utils.data
 
+from fairseq.data import data_utils
+
 
 class EpochListening:
     """Mixin for receiving updates whenever the epoch increments."""
@@ -50,11 +52,46 @@ class FairseqDataset(torch.utils.data.Dataset, EpochListening):
         on this order."""
         return np.arange(len(self))
 
+    def filter_indices_by_size(self, indices, max_sizes):
+        """Filter a list of sample indices. Remove those that are longer than
+        specified in *max_sizes*.
+
+        The filtering is vectorized when ``self.sizes`` holds the sizes of
+        all the examples, either as a 1d array (for scalar *max_sizes*) or
+        as a 2d array whose rows are the tuples returned by :func:`size`.
+        Otherwise :func:`size` is called for every index.
+
+        Args:
+            indices (np.array): original array of sample indices
+            max_sizes (int or tuple): max sample size, can be defined
+                separately for the source and target sequences
+
+        Returns:
+            tuple: the filtered sample indices and the list of ignored
+            sample indices
+        """
+        if not isinstance(max_sizes, dict):
+            sizes = getattr(self, 'sizes', None)
+            if isinstance(sizes, list) and len(sizes) == 1:
+                sizes = sizes[0]
+            if isinstance(sizes, np.ndarray) and (
+                sizes.ndim == 2 or isinstance(max_sizes, (int, float))
+            ):
+                return data_utils.filter_by_size_vectorized(indices, sizes, max_sizes)
+        return data_utils._filter_by_size_dynamic(indices, self.size, max_sizes)
+
     @property
     def supports_prefetch(self):
         """Whether this dataset supports prefetching."""
         return False
 
+    @property
+    def can_reuse_epoch_itr_across_epochs(self):
+        """Whether the batches of an epoch can be reused in the following
+        epochs. This needs to return ``False`` if the sizes of the examples
+        change with :func:`set_epoch`, e.g., when they are resampled."""
+        return True
+
     def attr(self, attr: str, index: int):
         return getattr(self, attr, None)
 
@@ -3,7 +3,11 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+from array import array
+import fcntl
 from functools import lru_cache
+import glob
+import hashlib
 import os
 import shutil
 import struct
@@ -22,7 +26,7 @@ def __best_fitting_dtype(vocab_size=None):
 
 
 def get_available_dataset_impl():
-    return ['raw', 'lazy', 'cached', 'mmap']
+    return ['raw', 'lazy', 'cached', 'shm', 'mmap', 'edit']
 
 
 def infer_dataset_impl(path):
@@ -42,7 +46,7 @@ def infer_dataset_impl(path):
 
 
 def make_builder(out_file, impl, vocab_size=None):
-    if impl == 'mmap':
+    if impl in ('mmap', 'edit'):
         return MMapIndexedDatasetBuilder(out_file, dtype=__best_fitting_dtype(vocab_size))
     else:
         return IndexedDatasetBuilder(out_file)
@@ -56,15 +60,27 @@ def make_dataset(path, impl, fix_lua_indexing=False, dictionary=None):
         return IndexedDataset(path, fix_lua_indexing=fix_lua_indexing)
     elif impl == 'cached' and IndexedDataset.exists(path):
         return IndexedCachedDataset(path, fix_lua_indexing=fix_lua_indexing)
-    elif impl == 'mmap' and MMapIndexedDataset.exists(path):
+    elif impl == 'shm' and IndexedDataset.exists(path):
+        return IndexedSharedMemoryDataset(path, fix_lua_indexing=fix_lua_indexing)
+    elif impl in ('mmap', 'edit') and MMapIndexedDataset.exists(path):
         return MMapIndexedDataset(path)
     return None
 
 
+def make_noise_builder(out_prefix, impl, vocab_size=None, streams=None):
+    """Return a builder for the noise streams written by
+    :func:`Binarizer.binarize_noise` under *out_prefix*, only the given
+    *streams* if set (e.g. :data:`PAIR_STREAMS`)."""
+    if impl == 'edit':
+        assert streams is None, "the edit dataset impl stores all the noise streams"
+        return EditAnnotatedDatasetBuilder(out_prefix, vocab_size=vocab_size)
+    return NoiseStreamsBuilder(out_prefix, impl, vocab_size=vocab_size, streams=streams)
+
+
 def dataset_exists(path, impl):
     if impl == 'raw':
         return IndexedRawTextDataset.exists(path)
-    elif impl == 'mmap':
+    elif impl in ('mmap', 'edit'):
         return MMapIndexedDataset.exists(path)
     else:
         return IndexedDataset.exists(path)
@@ -227,6 +243,99 @@ class IndexedCachedDataset(IndexedDataset):
         return item
 
 
+class IndexedSharedMemoryDataset(IndexedDataset):
+    """Loader for TorchNet IndexedDataset cached in shared memory.
+
+    Unlike :class:`IndexedCachedDataset`, which reads its own copy of the
+    data in every DataLoader worker and every rank, the data file is copied
+    once per node to *cache_dir* (a tmpfs) and memory-mapped read-only by all
+    processes. The first process to need it makes the copy while holding a
+    lock, the others wait for it.
+
+    The copy is named after the path, size and modification time of the data
+    file, so later runs reuse it. Copies of older versions of the same file
+    are removed when it is copied again; use :func:`clear_cache` to remove
+    all the copies of a *cache_dir*.
+    """
+
+    def __init__(self, path, fix_lua_indexing=False, cache_dir='/dev/shm'):
+        super().__init__(path, fix_lua_indexing=fix_lua_indexing)
+        self.cache_dir = cache_dir
+        self._cache = None
+
+    def _cache_key(self):
+        path = os.path.abspath(data_file_path(self.path))
+        stat = os.stat(path)
+        return (
+            hashlib.sha1(path.encode('utf-8')).hexdigest()[:16],
+            hashlib.sha1(
+                '{}:{}'.format(stat.st_size, stat.st_mtime_ns).encode('utf-8')
+            ).hexdigest()[:16],
+        )
+
+    def cache_path(self):
+        return os.path.join(self.cache_dir, 'fairseq-{}-{}.bin'.format(*self._cache_key()))
+
+    def _populate_cache(self, path):
+        # a single process per node copies the data file, the others wait
+        with open(path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(path):
+                    return
+                # copies of older versions of this data file; processes
+                # still mapping them keep their pages until they exit
+                path_key, _ = self._cache_key()
+                stale = glob.glob(os.path.join(
+                    self.cache_dir, 'fairseq-{}-*.bin'.format(path_key)
+                ))
+                for stale_path in stale:
+                    os.remove(stale_path)
+                    if os.path.exists(stale_path + '.lock'):
+                        os.remove(stale_path + '.lock')
+                # the rename is atomic, so no process attaches a partial copy
+                tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+                shutil.copyfile(data_file_path(self.path), tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def clear_cache(cache_dir='/dev/shm'):
+        """Remove all the copies cached in *cache_dir*, e.g., when no
+        training is running."""
+        for path in glob.glob(os.path.join(cache_dir, 'fairseq-*.bin*')):
+            os.remove(path)
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            path = self.cache_path()
+            if not os.path.exists(path):
+                self._populate_cache(path)
+            if os.path.getsize(path) == 0:
+                self._cache = np.empty(0, dtype=self.dtype)
+            else:
+                self._cache = np.memmap(path, dtype=self.dtype, mode='r')
+        return self._cache
+
+    def __getstate__(self):
+        # attach the cache again after pickling, e.g., in DataLoader workers
+        state = self.__dict__.copy()
+        state['_cache'] = None
+        return state
+
+    @lru_cache(maxsize=8)
+    def __getitem__(self, i):
+        self.check_index(i)
+        tensor_size = self.sizes[self.dim_offsets[i]:self.dim_offsets[i + 1]]
+        a = np.array(self.cache[self.data_offsets[i]:self.data_offsets[i + 1]])
+        item = torch.from_numpy(a.reshape(tensor_size)).long()
+        if self.fix_lua_indexing:
+            item -= 1  # subtract 1 for 0-based indexing
+        return item
+
+
 class IndexedRawTextDataset(FairseqDataset):
     """Takes a text file as input and binarizes it in memory at instantiation.
     Original lines are also kept in memory"""
@@ -521,3 +630,286 @@ class MMapIndexedDatasetBuilder(object):
 
         with MMapIndexedDataset.Index.writer(index_file, self._dtype) as index:
             index.write(self._sizes)
+
+
+# streams written by Binarizer.binarize_noise, in consumer order
+NOISE_STREAMS = ['src1', 'ref1', 'src2', 'ref2', 'src3']
+# streams from which the others are derived when batching, see
+# LanguagePairDataset
+PAIR_STREAMS = ['src1', 'src3']
+
+
+def edit_counts_path(prefix_path):
+    return prefix_path + '.edits.npy'
+
+
+def load_edit_counts(prefix_path):
+    """Return the number of edits of each example written along the noise
+    streams under *prefix_path*, or ``None`` if they were not written."""
+    path = edit_counts_path(prefix_path)
+    if not os.path.exists(path):
+        return None
+    return np.load(path)
+
+
+class EditCountsBuilder(object):
+    """Writes the number of edits (deletions plus insertions) of each example
+    to ``{out_prefix}.edits.npy``, e.g., for sampling by noise level."""
+
+    def __init__(self, out_prefix):
+        self._out_prefix = out_prefix
+        self._counts = array('i')
+
+    def add_item(self, ref1, ref2):
+        self._counts.append(int(ref1.ne(0).sum()) + int(ref2.ne(0).sum()))
+
+    def merge_file_(self, another_prefix):
+        self._counts.frombytes(load_edit_counts(another_prefix).astype(np.int32).tobytes())
+
+    def finalize(self):
+        np.save(edit_counts_path(self._out_prefix), np.frombuffer(self._counts, dtype=np.int32))
+
+    @staticmethod
+    def remove(prefix):
+        os.remove(edit_counts_path(prefix))
+
+
+class NoiseStreamsBuilder(object):
+    """Writes each noise stream to its own indexed dataset
+    ``{out_prefix}.{stream}``.
+
+    Only *streams* are written if set, the edit counts are written when they
+    include ``ref1`` and ``ref2``.
+    """
+
+    def __init__(self, out_prefix, impl, vocab_size=None, streams=None):
+        self._out_prefix = out_prefix
+        self.streams = streams or NOISE_STREAMS
+        assert all(stream in NOISE_STREAMS for stream in self.streams)
+        self._builders = [
+            make_builder(
+                data_file_path('{}.{}'.format(out_prefix, stream)), impl,
+                vocab_size=2 if stream == 'ref1' else vocab_size,
+            )
+            for stream in self.streams
+        ]
+        self._edits = None
+        if 'ref1' in self.streams and 'ref2' in self.streams:
+            self._edits = EditCountsBuilder(out_prefix)
+
+    def consumers(self):
+        """Return the consumers expected by :func:`Binarizer.binarize_noise`,
+        ``None`` for the streams that are not written."""
+        builders = dict(zip(self.streams, self._builders))
+        consumers = [
+            builders[stream].add_item if stream in builders else None
+            for stream in NOISE_STREAMS
+        ]
+        if self._edits is None:
+            return consumers
+        ref1_idx, ref2_idx = NOISE_STREAMS.index('ref1'), NOISE_STREAMS.index('ref2')
+        pending_ref1 = []
+
+        def consume_ref1(t):
+            pending_ref1.append(t)
+            builders['ref1'].add_item(t)
+
+        def consume_ref2(t):
+            self._edits.add_item(pending_ref1.pop(), t)
+            builders['ref2'].add_item(t)
+
+        consumers[ref1_idx], consumers[ref2_idx] = consume_ref1, consume_ref2
+        return consumers
+
+    def merge_file_(self, another_prefix):
+        for stream, builder in zip(self.streams, self._builders):
+            builder.merge_file_('{}.{}'.format(another_prefix, stream))
+        if self._edits is not None:
+            self._edits.merge_file_(another_prefix)
+
+    def finalize(self):
+        for stream, builder in zip(self.streams, self._builders):
+            builder.finalize(index_file_path('{}.{}'.format(self._out_prefix, stream)))
+        if self._edits is not None:
+            self._edits.finalize()
+
+    def remove(self, prefix):
+        for stream in self.streams:
+            os.remove(data_file_path('{}.{}'.format(prefix, stream)))
+            os.remove(index_file_path('{}.{}'.format(prefix, stream)))
+        if self._edits is not None:
+            EditCountsBuilder.remove(prefix)
+
+
+# per-token edit flags of EditAnnotatedDataset
+EDIT_DELETE = 1  # delete label (ref1)
+EDIT_DROP = 2  # token is removed from src2
+EDIT_INSERT = 4  # a token is inserted before this one in src2 (ref2)
+
+# how EditAnnotatedDataset rebuilds src3
+SRC3_AS_SRC1 = 0
+SRC3_REPLAY = 1
+SRC3_STORED = 2
+
+EDIT_STREAMS = ['src1', 'ops', 'ins']
+
+
+def apply_insertions(tokens, insertions):
+    """Insert ``insertions[j]`` before ``tokens[j]`` wherever it is non-zero."""
+    mask = insertions.ne(0)
+    out = tokens.new_zeros(tokens.numel() + int(mask.sum()))
+    positions = torch.arange(tokens.numel()) + mask.long().cumsum(0)
+    out[positions] = tokens
+    out[positions[mask] - 1] = insertions[mask]
+    return out
+
+
+class EditAnnotatedDataset(torch.utils.data.Dataset):
+    """Noise streams stored as the noisy tokens plus per-token edit labels.
+
+    Instead of five parallel datasets, three mmap datasets share the prefix
+    *path*:
+
+    - ``{path}.src1``: the noisy input tokens
+    - ``{path}.ops``: one ``EDIT_*`` bit mask per input token, followed by a
+      ``SRC3_*`` mode telling how to rebuild ``src3``
+    - ``{path}.ins``: the inserted token ids in order, followed by the
+      ``src3`` tokens if they can not be rebuilt from the edits
+
+    Items are ``(src1, ref1, src2, ref2, src3)`` tuples, materialized when
+    indexed.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self._path = path
+        self._tokens = MMapIndexedDataset(path + '.src1')
+        self._ops = MMapIndexedDataset(path + '.ops')
+        self._ins = MMapIndexedDataset(path + '.ins')
+
+    def __getitem__(self, i):
+        src1 = self._tokens[i]
+        ops = self._ops[i]
+        mode, ops = ops[-1].item(), ops[:-1]
+
+        ref1 = ops & EDIT_DELETE
+        keep = (ops & EDIT_DROP).eq(0)
+        src2 = src1[keep]
+
+        ins = self._ins[i]
+        has_ins = (ops & EDIT_INSERT).ne(0)
+        n_ins = int(has_ins.sum())
+        ref2 = torch.zeros_like(src1)
+        ref2[has_ins] = ins[:n_ins]
+        ref2 = ref2[keep]
+
+        if mode == SRC3_AS_SRC1:
+            src3 = src1
+        elif mode == SRC3_REPLAY:
+            src3 = apply_insertions(src2, ref2)
+        else:
+            src3 = ins[n_ins:]
+        return src1, ref1, src2, ref2, src3
+
+    def __len__(self):
+        return len(self._tokens)
+
+    @property
+    def sizes(self):
+        return self._tokens.sizes
+
+    @property
+    def supports_prefetch(self):
+        return False
+
+    @staticmethod
+    def exists(path):
+        return all(
+            MMapIndexedDataset.exists('{}.{}'.format(path, stream))
+            for stream in EDIT_STREAMS
+        )
+
+
+class EditAnnotatedDatasetBuilder(object):
+    """Builds an :class:`EditAnnotatedDataset` from the noise streams."""
+
+    def __init__(self, out_prefix, vocab_size=None):
+        self._out_prefix = out_prefix
+        self._tokens = make_builder(
+            data_file_path(out_prefix + '.src1'), 'mmap', vocab_size=vocab_size
+        )
+        self._ops = MMapIndexedDatasetBuilder(data_file_path(out_prefix + '.ops'), dtype=np.uint8)
+        self._ins = make_builder(
+            data_file_path(out_prefix + '.ins'), 'mmap', vocab_size=vocab_size
+        )
+        self._pending = []
+        self._edits = EditCountsBuilder(out_prefix)
+
+    def add_item(self, src1, ref1, src2, ref2, src3):
+        self._edits.add_item(ref1, ref2)
+        src1, src2, ref2, src3 = src1.long(), src2.long(), ref2.long(), src3.long()
+        delete = ref1.ne(0)
+        keep = ~delete
+        if int(keep.sum()) != src2.numel() or not torch.equal(src1[keep], src2):
+            # src2 does not drop exactly the deleted tokens
+            keep = self._subsequence_mask(src1, src2)
+
+        ops = delete.to(torch.uint8) | (~keep).to(torch.uint8) * EDIT_DROP
+        has_ins = ref2.ne(0)
+        ops[keep.nonzero().view(-1)[has_ins]] |= EDIT_INSERT
+        ins = ref2[has_ins]
+
+        if torch.equal(src3, src1):
+            mode = SRC3_AS_SRC1
+        elif torch.equal(src3, apply_insertions(src2, ref2)):
+            mode = SRC3_REPLAY
+        else:
+            mode = SRC3_STORED
+            ins = torch.cat([ins, src3])
+
+        self._tokens.add_item(src1)
+        self._ops.add_item(torch.cat([ops, ops.new([mode])]))
+        self._ins.add_item(ins)
+
+    @staticmethod
+    def _subsequence_mask(tokens, subsequence):
+        keep = torch.zeros(tokens.numel(), dtype=torch.bool)
+        j = 0
+        for i, token in enumerate(tokens.tolist()):
+            if j < subsequence.numel() and token == subsequence[j]:
+                keep[i] = True
+                j += 1
+        assert j == subsequence.numel(), 'src2 is not a subsequence of src1'
+        return keep
+
+    def consumers(self):
+        """Return the consumers expected by :func:`Binarizer.binarize_noise`.
+
+        Each consumer receives one stream of the current example; the example
+        is added once its last stream (``src3``) is received.
+        """
+        def consumer(t):
+            self._pending.append(t)
+            if len(self._pending) == len(NOISE_STREAMS):
+                self.add_item(*self._pending)
+                self._pending = []
+        return [consumer for _ in NOISE_STREAMS]
+
+    def merge_file_(self, another_prefix):
+        self._tokens.merge_file_(another_prefix + '.src1')
+        self._ops.merge_file_(another_prefix + '.ops')
+        self._ins.merge_file_(another_prefix + '.ins')
+        self._edits.merge_file_(another_prefix)
+
+    def finalize(self):
+        assert len(self._pending) == 0
+        for stream, builder in zip(EDIT_STREAMS, [self._tokens, self._ops, self._ins]):
+            builder.finalize(index_file_path('{}.{}'.format(self._out_prefix, stream)))
+        self._edits.finalize()
+
+    @staticmethod
+    def remove(prefix):
+        for stream in EDIT_STREAMS:
+            os.remove(data_file_path('{}.{}'.format(prefix, stream)))
+            os.remove(index_file_path('{}.{}'.format(prefix, stream)))
+        EditCountsBuilder.remove(prefix)
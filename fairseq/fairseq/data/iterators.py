@@ -6,6 +6,8 @@
 import itertools
 import math
 import os
+import queue
+import threading
 
 import numpy as np
 import torch
@@ -178,11 +180,19 @@ class EpochBatchIterator(EpochBatchIterating):
             (default: 0).
         epoch (int, optional): the epoch to start the iterator from
             (default: 1).
+        buffer_size (int, optional): number of batches to prepare ahead in a
+            background thread, 0 to disable it, see :class:`PrefetchIterator`
+            (default: 0).
+        cuda (bool, optional): move the prefetched batches to the current
+            CUDA device (default: False).
+        pin_memory (bool, optional): copy the batches to pinned memory, in
+            the main process like :class:`~torch.utils.data.DataLoader` does
+            (default: False).
     """
 
     def __init__(
         self, dataset, collate_fn, batch_sampler, seed=1, num_shards=1, shard_id=0,
-        num_workers=0, epoch=1,
+        num_workers=0, epoch=1, buffer_size=0, cuda=False, pin_memory=False,
     ):
         assert isinstance(dataset, torch.utils.data.Dataset)
         self.dataset = dataset
@@ -192,6 +202,9 @@ class EpochBatchIterator(EpochBatchIterating):
         self.num_shards = num_shards
         self.shard_id = shard_id
         self.num_workers = num_workers
+        self.buffer_size = buffer_size
+        self.cuda = cuda
+        self.pin_memory = pin_memory
 
         self.epoch = max(epoch, 1)  # we use 1-based indexing for epochs
         self.shuffle = True
@@ -307,15 +320,17 @@ class EpochBatchIterator(EpochBatchIterating):
         if self.num_workers > 0:
             os.environ['PYTHONWARNINGS'] = 'ignore:semaphore_tracker:UserWarning'
 
-        return CountingIterator(
-            torch.utils.data.DataLoader(
-                self.dataset,
-                collate_fn=self.collate_fn,
-                batch_sampler=batches[offset:],
-                num_workers=self.num_workers,
-            ),
-            start=offset,
+        itr = torch.utils.data.DataLoader(
+            self.dataset,
+            collate_fn=self.collate_fn,
+            batch_sampler=batches[offset:],
+            num_workers=self.num_workers,
+            pin_memory=self.pin_memory,
         )
+        if self.buffer_size > 0:
+            itr = PrefetchIterator(itr, self.buffer_size, cuda=self.cuda)
+
+        return CountingIterator(itr, start=offset)
 
 
 class GroupedIterator(object):
@@ -349,6 +364,138 @@ class GroupedIterator(object):
         return chunk
 
 
+class PrefetchIterator(object):
+    """Wrapper around an iterable that prepares up to *buffer_size* items
+    ahead in a background thread.
+
+    With *cuda*, the tensors of each item are pinned and copied to the
+    current CUDA device on a side stream, so the copies overlap with the
+    computation on the default stream. Otherwise items are only loaded
+    ahead, e.g., collated while the previous batch is processed.
+
+    The thread stops when the iterator is exhausted, closed with
+    :func:`close` or garbage collected.
+
+    Args:
+        iterable (iterable): iterable to wrap
+        buffer_size (int): max number of items prepared ahead
+        cuda (bool, optional): move the tensors of each item to the current
+            CUDA device (default: False).
+    """
+
+    _END = object()
+
+    def __init__(self, iterable, buffer_size, cuda=False):
+        self.iterable = iterable
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.cuda = cuda
+        self.device = torch.cuda.current_device() if cuda else None
+        self.thread = None
+        self.stop = threading.Event()
+        self.exhausted = False
+
+    def __len__(self):
+        return len(self.iterable)
+
+    def __iter__(self):
+        return self
+
+    def __del__(self):
+        # the thread holds no reference to self, let it finish
+        self.stop.set()
+
+    @staticmethod
+    def _prefetch(iterable, items, stop, device):
+        from fairseq import utils
+
+        def put(item):
+            # give up once the iterator is closed
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def to_device(t):
+            if not t.is_pinned():
+                t = t.pin_memory()
+            return t.to(device, non_blocking=True)
+
+        try:
+            stream = None
+            if device is not None:
+                torch.cuda.set_device(device)
+                stream = torch.cuda.Stream()
+            for item in iterable:
+                event = None
+                if stream is not None:
+                    with torch.cuda.stream(stream):
+                        item = utils.apply_to_sample(to_device, item)
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                # the slot may have been freed by close()
+                if not put((item, event, None)) or stop.is_set():
+                    return
+        except Exception as e:
+            put((None, None, e))
+            return
+        put(PrefetchIterator._END)
+
+    def close(self):
+        """Stop the background thread and drop the items prepared ahead,
+        e.g., when the iteration is interrupted."""
+        self.exhausted = True
+        self.stop.set()
+        if self.thread is not None:
+            # unblock the thread if it is waiting for a free slot
+            self._drain()
+            self.thread.join()
+            self.thread = None
+            self._drain()
+
+    def _drain(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def __next__(self):
+        if self.exhausted:
+            raise StopIteration
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self._prefetch,
+                args=(self.iterable, self.queue, self.stop, self.device),
+                daemon=True,
+            )
+            self.thread.start()
+
+        item = self.queue.get()
+        if item is self._END:
+            self.close()
+            raise StopIteration
+        item, event, error = item
+        if error is not None:
+            self.close()
+            raise error
+        if event is not None:
+            from fairseq import utils
+
+            current_stream = torch.cuda.current_stream()
+            current_stream.wait_event(event)
+
+            def record_stream(t):
+                # the memory was allocated on the side stream
+                t.record_stream(current_stream)
+                return t
+
+            utils.apply_to_sample(record_stream, item)
+        return item
+
+
 class ShardedIterator(object):
     """A sharded wrapper around an iterable, padded to length.
 
@@ -8,6 +8,8 @@ import logging
 import numpy as np
 import torch
 
+from fairseq import edit_distance
+
 from . import data_utils, FairseqDataset
 
 
@@ -27,76 +29,121 @@ def collate(
             pad_idx, eos_idx, left_pad, move_eos_to_beginning,
         )
 
+    if 'src3' in samples[0] and 'src2' not in samples[0]:
+        samples = derive_edit_labels(samples)
+
+    if 'src2' in samples[0]:
+        return collate_streams(
+            samples, pad_idx, eos_idx, left_pad_source=left_pad_source,
+            left_pad_target=left_pad_target, input_feeding=input_feeding,
+        )
+
     id = torch.LongTensor([s['id'] for s in samples])
     src1_tokens = merge('src1', left_pad=left_pad_source)
-    if 'src2' in samples[0]:
-        src2_tokens = merge('src2', left_pad=left_pad_source)
-        src3_tokens = merge('src3', left_pad=left_pad_source)
     # sort by descending source length
-    if 'src2' in samples[0]:
-        src_lengths = torch.LongTensor([s['src3'].numel() for s in samples])
-    else:
-        src_lengths = torch.LongTensor([s['src1'].numel() for s in samples])
+    src_lengths = torch.LongTensor([s['src1'].numel() for s in samples])
     src_lengths, sort_order = src_lengths.sort(descending=True)
     id = id.index_select(0, sort_order)
     src1_tokens = src1_tokens.index_select(0, sort_order)
-    if 'src2' in samples[0]:
-        src2_tokens = src2_tokens.index_select(0, sort_order)
-        src3_tokens = src3_tokens.index_select(0, sort_order)
 
-    prev_output_tokens = None
-    target = None
+    ntokens = sum(len(s['src1']) for s in samples)
+    batch = {
+        'id': id,
+        'nsentences': len(samples),
+        'ntokens': ntokens,
+        'net_input': {
+            'src1_tokens': src1_tokens,
+            'src_lengths': src_lengths,
+        },
+        'target': None,
+    }
+    return batch
 
-    if 'src2' in samples[0]:
-        target = merge('ref3', left_pad=left_pad_target)
-        target = target.index_select(0, sort_order)
-        tgt_lengths = torch.LongTensor([s['ref3'].numel() for s in samples]).index_select(0, sort_order)
-        ntokens = sum(len(s['ref3']) for s in samples)
-
-        ref1_tokens = merge('ref1', left_pad=left_pad_source)
-        ref2_tokens = merge('ref2', left_pad=left_pad_source)
-        ref1_tokens = ref1_tokens.index_select(0, sort_order)
-        ref2_tokens = ref2_tokens.index_select(0, sort_order)
-
-        if input_feeding:
-            # we create a shifted version of targets for feeding the
-            # previous output token(s) into the next decoder step
-            prev_output_tokens = merge(
-                'ref3',
-                left_pad=left_pad_target,
-                move_eos_to_beginning=True,
-            )
-            prev_output_tokens = prev_output_tokens.index_select(0, sort_order)
-
-        batch = {
-            'id': id,
-            'nsentences': len(samples),
-            'ntokens': ntokens,
-            'net_input': {
-                'src1_tokens': src1_tokens,
-                'src2_tokens': src2_tokens,
-                'src3_tokens': src3_tokens,
-                'src_lengths': src_lengths,
-            },
-            'ref1': ref1_tokens,
+
+def derive_edit_labels(samples):
+    """Add to *samples* the ``ref1``, ``src2`` and ``ref2`` streams of the
+    edits turning their ``src1`` into their ``src3``, with a single call to
+    :func:`fairseq.edit_distance.batch_edit_ops` for the batch."""
+    samples = [dict(s) for s in samples]
+    # e.g. the noisy input copies of DuplicateViewDataset have no edits
+    edited = [
+        i for i, s in enumerate(samples) if not torch.equal(s['src1'], s['src3'])
+    ]
+    xs = [samples[i]['src1'].tolist() for i in edited]
+    ys = [samples[i]['src3'].tolist() for i in edited]
+    labels = {
+        i: edit_distance.edit_labels(ops, x, y)
+        for i, ops, x, y in zip(edited, edit_distance.batch_edit_ops(xs, ys), xs, ys)
+    }
+    for i, s in enumerate(samples):
+        src1 = s['src1']
+        if i in labels:
+            ref1, src2, ref2 = labels[i]
+            s['ref1'] = src1.new_tensor(ref1)
+            s['src2'] = src1.new_tensor(src2)
+            s['ref2'] = src1.new_tensor(ref2)
+        else:
+            s['ref1'] = torch.zeros_like(src1)
+            s['src2'] = src1
+            s['ref2'] = s['ref1']
+    return samples
+
+
+def collate_streams(
+    samples, pad_idx, eos_idx, left_pad_source=True, left_pad_target=False,
+    input_feeding=True,
+):
+    """Collate samples with all the Secoco streams.
+
+    The samples are sorted first and all streams are written into a single
+    buffer, see :func:`~fairseq.data.data_utils.collate_tokens_fused`.
+    """
+    # sort by descending source length
+    src_lengths = torch.LongTensor([s['src3'].numel() for s in samples])
+    src_lengths, sort_order = src_lengths.sort(descending=True)
+    samples = [samples[i] for i in sort_order.tolist()]
+
+    keys = ['src1', 'src2', 'src3', 'ref1', 'ref2', 'ref3']
+    left_pad = [left_pad_source] * 5 + [left_pad_target]
+    move_eos_to_beginning = [False] * 6
+    if input_feeding:
+        # we create a shifted version of targets for feeding the
+        # previous output token(s) into the next decoder step
+        keys.append('ref3')
+        left_pad.append(left_pad_target)
+        move_eos_to_beginning.append(True)
+    tensors = data_utils.collate_tokens_fused(
+        [[s[key] for s in samples] for key in keys],
+        pad_idx, eos_idx, left_pad, move_eos_to_beginning,
+    )
+    src1_tokens, src2_tokens, src3_tokens, ref1_tokens, ref2_tokens, target = tensors[:6]
+
+    batch = {
+        'id': torch.LongTensor([s['id'] for s in samples]),
+        'nsentences': len(samples),
+        'ntokens': sum(len(s['ref3']) for s in samples),
+        'net_input': {
+            'src1_tokens': src1_tokens,
+            'src2_tokens': src2_tokens,
+            'src3_tokens': src3_tokens,
+            'src_lengths': src_lengths,
+            # rows whose inputs are identical are only encoded once, see
+            # TransformerModel.forward()
+            'src2_is_src1': torch.BoolTensor(
+                [torch.equal(s['src2'], s['src1']) for s in samples]
+            ),
+            'src3_is_src1': torch.BoolTensor(
+                [torch.equal(s['src3'], s['src1']) for s in samples]
+            ),
+            # see TransformerModel.forward_insert_heads()
             'ref2': ref2_tokens,
-            'target': target,
-        }
-        if prev_output_tokens is not None:
-            batch['net_input']['prev_output_tokens'] = prev_output_tokens
-
-    else:
-        ntokens = sum(len(s['src1']) for s in samples)
-        batch = {
-            'id': id,
-            'nsentences': len(samples),
-            'ntokens': ntokens,
-            'net_input': {
-                'src1_tokens': src1_tokens,
-                'src_lengths': src_lengths,
-            },
-            'target': target,
-        }
+        },
+        'ref1': ref1_tokens,
+        'ref2': ref2_tokens,
+        'target': target,
+    }
+    if input_feeding:
+        batch['net_input']['prev_output_tokens'] = tensors[6]
     return batch
 
 
@@ -129,6 +176,20 @@ class LanguagePairDataset(FairseqDataset):
             target if it's absent (default: False).
         align_dataset (torch.utils.data.Dataset, optional): dataset
             containing alignments.
+        edits (~fairseq.data.EditAnnotatedDataset, optional): dataset of
+            ``(src1, ref1, src2, ref2, src3)`` tuples used instead of the
+            separate *src1*, *ref1*, *src2*, *ref2* and *src3* datasets.
+            When *src3* is given without *ref1*, *src2* and *ref2*, these are
+            derived from *src1* and *src3* by the collater, see
+            :func:`derive_edit_labels`.
+        src2_sizes (List[int], optional): src2 sentence lengths
+            (default: the src1 lengths).
+        src3_sizes (List[int], optional): src3 sentence lengths
+            (default: the src1 lengths).
+        token_cost (str, optional): number of tokens of an example used for
+            ``--max-tokens``: 'max' for the longest of its sentences, 'sum'
+            for the source tokens of the three encoder passes plus the target
+            tokens (default: 'max').
         append_bos (bool, optional): if set, appends bos to the beginning of
             source/target sentence.
     """
@@ -142,7 +203,8 @@ class LanguagePairDataset(FairseqDataset):
         shuffle=True, input_feeding=True,
         remove_eos_from_source=False, append_eos_to_target=False,
         align_dataset=None,
-        append_bos=False, eos=None
+        append_bos=False, eos=None, edits=None,
+        src2_sizes=None, src3_sizes=None, token_cost='max',
     ):
         if tgt_dict is not None:
             assert src_dict.pad() == tgt_dict.pad()
@@ -154,8 +216,15 @@ class LanguagePairDataset(FairseqDataset):
         self.ref2 = ref2
         self.src3 = src3
         self.ref3 = ref3
+        self.edits = edits
         self.src_sizes = np.array(src1_sizes)
         self.tgt_sizes = np.array(ref1_sizes) if ref1_sizes is not None else None
+        self.src2_sizes = np.array(src2_sizes) if src2_sizes is not None else self.src_sizes
+        self.src3_sizes = np.array(src3_sizes) if src3_sizes is not None else self.src_sizes
+        self.token_cost = token_cost
+        # rows of size_matrix are the sizes returned by size(), for filtering
+        self.costs, self.size_matrix = self.token_costs(self.src3_sizes)
+        self.max_src_sizes = self.size_matrix[:, 0]
         self.src_dict = src_dict
         self.tgt_dict = tgt_dict
         self.left_pad_source = left_pad_source
@@ -172,16 +241,40 @@ class LanguagePairDataset(FairseqDataset):
         self.append_bos = append_bos
         self.eos = (eos if eos is not None else src_dict.eos())
 
+    def token_costs(self, src3_sizes):
+        """Precompute the number of tokens (see :func:`num_tokens`) and the
+        sizes (see :func:`size`) of each example, given its *src3_sizes*.
+
+        Returns:
+            tuple: the array of costs and the ``(len(self), 2)`` array of
+            sizes
+        """
+        max_src_sizes = np.maximum(self.src_sizes, np.maximum(self.src2_sizes, src3_sizes))
+        tgt_sizes = self.tgt_sizes if self.tgt_sizes is not None else np.zeros_like(max_src_sizes)
+        if self.token_cost == 'sum':
+            costs = self.src_sizes + self.src2_sizes + src3_sizes + tgt_sizes
+        elif self.token_cost == 'max':
+            costs = np.maximum(max_src_sizes, tgt_sizes)
+        else:
+            raise ValueError('unknown token cost: {}'.format(self.token_cost))
+        return costs.astype(np.int64), np.stack([max_src_sizes, tgt_sizes], axis=1)
+
     def __getitem__(self, index):
-        if self.ref1 is not None:
+        if self.edits is not None:
+            src1_item, ref1_item, src2_item, ref2_item, src3_item = self.edits[index]
+            ref3_item = self.ref3[index]
+        elif self.ref1 is not None:
             ref1_item, ref2_item, ref3_item = self.ref1[index], self.ref2[index], self.ref3[index]
             src2_item, src3_item = self.src2[index], self.src3[index]
-        src1_item = self.src1[index]
+        elif self.src3 is not None:
+            src3_item, ref3_item = self.src3[index], self.ref3[index]
+        if self.edits is None:
+            src1_item = self.src1[index]
         # Append EOS to end of tgt sentence if it does not have an EOS and remove
         # EOS from end of src sentence if it exists. This is useful when we use
         # use existing datasets for opposite directions i.e., when we want to
         # use tgt_dataset as src_dataset and vice versa
-        if self.ref1 is not None:
+        if self.edits is not None or self.ref1 is not None:
             example = {
                 'id': index,
                 'src1': src1_item,
@@ -191,6 +284,14 @@ class LanguagePairDataset(FairseqDataset):
                 'src3': src3_item,
                 'ref3': ref3_item,
             }
+        elif self.src3 is not None:
+            # ref1, src2 and ref2 are derived by the collater
+            example = {
+                'id': index,
+                'src1': src1_item,
+                'src3': src3_item,
+                'ref3': ref3_item,
+            }
         else:
             example = {
                 'id': index,
@@ -200,7 +301,7 @@ class LanguagePairDataset(FairseqDataset):
         return example
 
     def __len__(self):
-        return len(self.src1)
+        return len(self.src_sizes)
 
     def collater(self, samples):
         """Merge a list of samples to form a mini-batch.
@@ -220,6 +321,12 @@ class LanguagePairDataset(FairseqDataset):
                     appear on the left if *left_pad_source* is ``True``.
                   - `src_lengths` (LongTensor): 1D Tensor of the unpadded
                     lengths of each source sentence of shape `(bsz)`
+                  - `src2_is_src1`, `src3_is_src1` (BoolTensor): 1D Tensors
+                    of shape `(bsz)` telling whether the `src2` (resp.
+                    `src3`) tokens of a sentence equal its `src1` tokens
+                  - `ref2` (LongTensor): the insertion labels of the `src2`
+                    tokens, to restrict the insert head to the positions it
+                    is trained on
                   - `prev_output_tokens` (LongTensor): a padded 2D Tensor of
                     tokens in the target sentence, shifted right by one
                     position for teacher forcing, of shape `(bsz, tgt_len)`.
@@ -237,15 +344,29 @@ class LanguagePairDataset(FairseqDataset):
             input_feeding=self.input_feeding,
         )
 
+    @property
+    def sizes(self):
+        return self.src_sizes
+
     def num_tokens(self, index):
         """Return the number of tokens in a sample. This value is used to
         enforce ``--max-tokens`` during batching."""
-        return max(self.src_sizes[index], self.tgt_sizes[index] if self.tgt_sizes is not None else 0)
+        return self.costs[index]
 
     def size(self, index):
         """Return an example's size as a float or tuple. This value is used when
         filtering a dataset with ``--max-positions``."""
-        return (self.src_sizes[index], self.tgt_sizes[index] if self.tgt_sizes is not None else 0)
+        return (
+            self.max_src_sizes[index],
+            self.tgt_sizes[index] if self.tgt_sizes is not None else 0,
+        )
+
+    def filter_indices_by_size(self, indices, max_sizes):
+        """Filter the indices of the examples larger than *max_sizes* with the
+        precomputed :attr:`size_matrix`, see :func:`size`."""
+        if isinstance(max_sizes, dict):
+            return super().filter_indices_by_size(indices, max_sizes)
+        return data_utils.filter_by_size_vectorized(indices, self.size_matrix, max_sizes)
 
     def ordered_indices(self):
         """Return an ordered list of indices. Batches will be constructed based
@@ -265,10 +386,12 @@ class LanguagePairDataset(FairseqDataset):
             and (getattr(self.ref1, 'supports_prefetch', False) or self.ref1 is None)
         )
 
+    def set_epoch(self, epoch):
+        super().set_epoch(epoch)
+        if hasattr(self.edits, 'set_epoch'):
+            self.edits.set_epoch(epoch)
+
     def prefetch(self, indices):
-        self.src1.prefetch(indices)
-        self.src2.prefetch(indices)
-        self.src3.prefetch(indices)
-        self.ref1.prefetch(indices)
-        self.ref2.prefetch(indices)
-        self.ref3.prefetch(indices)
+        for ds in [self.src1, self.src2, self.src3, self.ref1, self.ref2, self.ref3]:
+            if ds is not None:
+                ds.prefetch(indices)
@@ -99,6 +99,17 @@ class ResamplingDataset(BaseWrapperDataset):
         else:
             return np.arange(len(self))
 
+    def filter_indices_by_size(self, indices, max_sizes):
+        indices = np.asarray(indices, dtype=np.int64)
+        sampled = self._cur_indices.array[indices]
+        _, ignored = self.dataset.filter_indices_by_size(np.unique(sampled), max_sizes)
+        keep = ~np.isin(sampled, ignored)
+        return indices[keep], indices[~keep].tolist()
+
+    @property
+    def can_reuse_epoch_itr_across_epochs(self):
+        return False
+
     def prefetch(self, indices):
         self.dataset.prefetch(self._cur_indices.array[indices])
 
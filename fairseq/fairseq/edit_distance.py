@@ -0,0 +1,259 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Word-level edit scripts between noisy and clean sentences.
+
+An edit script turns a noisy sentence *x* into a clean sentence *y* with the
+unit-cost operations :data:`KEEP`, :data:`DELETE` (a token of *x*),
+:data:`SUBSTITUTE` (a token of *x* by a token of *y*) and :data:`INSERT` (a
+token of *y*). Among the optimal scripts, the one chosen is the one the
+backtrace of ``generate_data_withref/edit.py`` used to produce.
+
+Scripts are computed by ``libnat`` (see ``fairseq/clib/libnat/edit_dist.cpp``)
+when it is built, or by a bit-parallel algorithm [Hyyrö, 2003] in Python
+otherwise, which only takes O(len(x) + len(y)) interpreter steps per pair.
+"""
+
+from collections import deque
+from multiprocessing import Pool
+
+
+KEEP, DELETE, SUBSTITUTE, INSERT = 0, 1, 2, 3
+OP_SYMBOLS = 'edsi'
+
+CHUNK_SIZE = 10000
+
+
+def _load_libnat():
+    try:
+        from fairseq import libnat
+    except ImportError:
+        return None
+    # builds older than edit scripts
+    return libnat if hasattr(libnat, 'suggested_ed_ops') else None
+
+
+def edit_ops_dp(x, y):
+    """Edit script turning *x* into *y*, with the full dynamic programming
+    matrix. Quadratic in Python, this is only a reference for testing and
+    benchmarking :func:`edit_ops`."""
+    # d[i][j]: distance between x[:j] and y[:i]
+    d = [list(range(len(x) + 1))]
+    for i in range(1, len(y) + 1):
+        row = [i]
+        for j in range(1, len(x) + 1):
+            if y[i - 1] == x[j - 1]:
+                row.append(d[i - 1][j - 1])
+            else:
+                row.append(min(d[i - 1][j - 1], row[j - 1], d[i - 1][j]) + 1)
+        d.append(row)
+
+    i, j = len(y), len(x)
+    ops = []
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and d[i][j] == d[i - 1][j - 1] and y[i - 1] == x[j - 1]:
+            ops.append(KEEP)
+            i, j = i - 1, j - 1
+        elif j > 0 and d[i][j] == d[i][j - 1] + 1:
+            ops.append(DELETE)
+            j -= 1
+        elif i > 0 and j > 0 and d[i][j] == d[i - 1][j - 1] + 1:
+            ops.append(SUBSTITUTE)
+            i, j = i - 1, j - 1
+        else:
+            ops.append(INSERT)
+            i -= 1
+    return ops[::-1]
+
+
+def edit_ops(x, y):
+    """Edit script turning *x* into *y*, see the module documentation.
+
+    The columns of the distance matrix are computed as bit vectors of their
+    vertical and horizontal differences, and the backtrace follows these
+    differences, so that only O(len(x) + len(y)) big integer operations are
+    needed.
+
+    Args:
+        x (Sequence): noisy tokens, of any hashable type
+        y (Sequence): clean tokens
+
+    Returns:
+        List[int]: the operations, in order
+    """
+    m = len(y)
+    mask = (1 << m) - 1
+    peq = {}
+    for i, token in enumerate(y):
+        peq[token] = peq.get(token, 0) | (1 << i)
+
+    # bit i - 1 of vp[j] (vn[j]) is set iff d[i][j] - d[i - 1][j] is +1 (-1),
+    # bit i - 1 of hp[j] (hn[j]) is set iff d[i][j] - d[i][j - 1] is +1 (-1)
+    vp, vn, hp, hn = [mask], [0], [0], [0]
+    cur_vp, cur_vn = mask, 0
+    for token in x:
+        eq = peq.get(token, 0)
+        d0 = ((((eq & cur_vp) + cur_vp) & mask) ^ cur_vp) | eq | cur_vn
+        cur_hp = (cur_vn | ~(d0 | cur_vp)) & mask
+        cur_hn = cur_vp & d0
+        # the first row is d[0][j] = j
+        shifted_hp = ((cur_hp << 1) | 1) & mask
+        cur_vn = shifted_hp & d0
+        cur_vp = (((cur_hn << 1) & mask) | ~(shifted_hp | d0)) & mask
+        vp.append(cur_vp)
+        vn.append(cur_vn)
+        hp.append(cur_hp)
+        hn.append(cur_hn)
+
+    def vertical(i, j):
+        return ((vp[j] >> (i - 1)) & 1) - ((vn[j] >> (i - 1)) & 1)
+
+    def horizontal(i, j):
+        if i == 0:
+            return 1
+        return ((hp[j] >> (i - 1)) & 1) - ((hn[j] >> (i - 1)) & 1)
+
+    i, j = m, len(x)
+    ops = []
+    while i > 0 or j > 0:
+        if i > 0 and j > 0:
+            # d[i][j] - d[i - 1][j - 1]
+            diag = vertical(i, j) + horizontal(i - 1, j)
+            if diag == 0 and y[i - 1] == x[j - 1]:
+                ops.append(KEEP)
+                i, j = i - 1, j - 1
+                continue
+        if j > 0 and horizontal(i, j) == 1:
+            ops.append(DELETE)
+            j -= 1
+        elif i > 0 and j > 0 and diag == 1:
+            ops.append(SUBSTITUTE)
+            i, j = i - 1, j - 1
+        else:
+            ops.append(INSERT)
+            i -= 1
+    return ops[::-1]
+
+
+def batch_edit_ops(xs, ys, use_libnat=True):
+    """:func:`edit_ops` of every pair of *xs* and *ys*, with a single call to
+    ``libnat`` when it is available and *use_libnat* is set."""
+    assert len(xs) == len(ys)
+    libnat = _load_libnat() if use_libnat else None
+    if libnat is None:
+        return [edit_ops(x, y) for x, y in zip(xs, ys)]
+
+    # libnat works on integers
+    ids = {}
+    xs = [[ids.setdefault(t, len(ids)) for t in x] for x in xs]
+    ys = [[ids.setdefault(t, len(ids)) for t in y] for y in ys]
+    return libnat.suggested_ed_ops(xs, ys)
+
+
+def edit_labels(ops, x, y):
+    """Secoco labels of the edit script *ops* turning *x* into *y*, as the
+    noise of :mod:`fairseq.data.edit_noising` produces them:
+
+    - ``ref1``: 1 for the tokens of *x* that are deleted or substituted
+    - ``src2``: *x* without these tokens
+    - ``ref2``: the token of *y* to insert before each token of ``src2``, 0
+      for none (only the last one is kept when several are inserted at the
+      same position)
+
+    Tokens inserted at the end of *y* need a kept end marker (e.g. eos) to be
+    labeled.
+    """
+    ref1, src2, ref2 = [], [], []
+    pending = 0
+    i, j = 0, 0
+    for op in ops:
+        if op == KEEP:
+            ref1.append(0)
+            src2.append(x[j])
+            ref2.append(pending)
+            pending = 0
+            i, j = i + 1, j + 1
+        elif op == DELETE:
+            ref1.append(1)
+            j += 1
+        elif op == SUBSTITUTE:
+            ref1.append(1)
+            pending = y[i]
+            i, j = i + 1, j + 1
+        else:
+            pending = y[i]
+            i += 1
+    return ref1, src2, ref2
+
+
+def format_steps(ops, x, y):
+    """Format an edit script like ``generate_data_withref/edit.py``, e.g.
+    ``['e', 'd-a', 's-b||c', 'i-d']``."""
+    steps = []
+    i, j = 0, 0
+    for op in ops:
+        if op == KEEP:
+            steps.append('e')
+            i, j = i + 1, j + 1
+        elif op == DELETE:
+            steps.append('d-{}'.format(x[j]))
+            j += 1
+        elif op == SUBSTITUTE:
+            steps.append('s-{}||{}'.format(x[j], y[i]))
+            i, j = i + 1, j + 1
+        else:
+            steps.append('i-{}'.format(y[i]))
+            i += 1
+    return steps
+
+
+def edit_steps(pairs, use_libnat=True):
+    """Formatted edit scripts of (noisy line, clean line) *pairs*."""
+    xs = [noisy.split() for noisy, _ in pairs]
+    ys = [clean.split() for _, clean in pairs]
+    return [
+        format_steps(ops, x, y)
+        for ops, x, y in zip(batch_edit_ops(xs, ys, use_libnat), xs, ys)
+    ]
+
+
+def _chunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def imap_edit_steps(pairs, workers=1, chunk_size=CHUNK_SIZE, use_libnat=True):
+    """Yield the :func:`edit_steps` of (noisy line, clean line) *pairs* in
+    order, computed by chunks of *chunk_size* pairs with *workers* processes
+    and a bounded number of chunks in flight."""
+    chunks = _chunks(pairs, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from edit_steps(chunk, use_libnat)
+        return
+
+    pool = Pool(processes=workers)
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(edit_steps, (chunk, use_libnat)))
+        if len(pending) >= 2 * workers:
+            yield from pending.popleft().get()
+    while pending:
+        yield from pending.popleft().get()
+    pool.close()
+    pool.join()
+
+
+def edit_steps_files(noisy_path, clean_path, workers=1, chunk_size=CHUNK_SIZE):
+    """Yield the edit scripts between the lines of two aligned files."""
+    with open(noisy_path, 'r', encoding='utf-8') as noisy, \
+            open(clean_path, 'r', encoding='utf-8') as clean:
+        yield from imap_edit_steps(zip(noisy, clean), workers, chunk_size)
@@ -128,7 +128,7 @@ class GeneratorHubInterface(nn.Module):
     def sample(self, sentences: List[str], beam: int = 1, verbose: bool = False, **kwargs) -> List[str]:
         if isinstance(sentences, str):
             return self.sample([sentences], beam=beam, verbose=verbose, **kwargs)[0]
-        tokenized_sentences = [self.encode(sentence) for sentence in sentences]
+        tokenized_sentences = self.encode_batch(sentences)
         batched_hypos = self.generate(tokenized_sentences, beam, verbose, **kwargs)
         return [self.decode(hypos[0]['tokens']) for hypos in batched_hypos]
 
@@ -136,7 +136,7 @@ class GeneratorHubInterface(nn.Module):
         if isinstance(sentences, str):
             return self.score([sentences], **kwargs)[0]
         # NOTE: this doesn't support translation tasks currently
-        tokenized_sentences = [self.encode(sentence) for sentence in sentences]
+        tokenized_sentences = self.encode_batch(sentences)
         return [hypos[0] for hypos in self.generate(tokenized_sentences, score_reference=True, **kwargs)]
 
     def generate(
@@ -198,6 +198,11 @@ class GeneratorHubInterface(nn.Module):
         sentence = self.apply_bpe(sentence)
         return self.binarize(sentence)
 
+    def encode_batch(self, sentences: List[str]) -> List[torch.LongTensor]:
+        return self.binarize_batch([
+            self.apply_bpe(self.tokenize(sentence)) for sentence in sentences
+        ])
+
     def decode(self, tokens: torch.LongTensor) -> str:
         sentence = self.string(tokens)
         sentence = self.remove_bpe(sentence)
@@ -224,7 +229,11 @@ class GeneratorHubInterface(nn.Module):
         return sentence
 
     def binarize(self, sentence: str) -> torch.LongTensor:
-        return self.src_dict.encode_line(sentence, add_if_not_exist=False).long()
+        return self.binarize_batch([sentence])[0]
+
+    def binarize_batch(self, sentences: List[str]) -> List[torch.LongTensor]:
+        ids, offsets = self.src_dict.encode_lines(sentences)
+        return [t.long() for t in self.src_dict.split_encoded_lines(ids, offsets)]
 
     def string(self, tokens: torch.LongTensor) -> str:
         return self.tgt_dict.string(tokens)
@@ -0,0 +1,108 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import torch
+
+from fairseq.models import edit_utils
+from fairseq.models.fairseq_encoder import EncoderOut
+
+
+class IterativePreEditor(object):
+    def __init__(self, src_dict, models, max_iter=3):
+        """
+        Corrects noisy source sentences with the delete and insert heads of
+        the model before translation.
+
+        Each iteration predicts and applies deletions, then insertions.
+        A sentence is finalized as soon as an iteration predicts no edit
+        for it, so only the sentences still being edited are encoded again.
+        The edit passes also provide the encoder output of the edited
+        sentences for translation, see :func:`edit`.
+
+        Args:
+            src_dict: source dictionary
+            models: models whose first one predicts the edits
+            max_iter: maximum number of edit iterations
+        """
+        self.pad = src_dict.pad()
+        self.models = models
+        self.max_iter = max_iter
+
+    @torch.no_grad()
+    def edit(self, src_tokens):
+        """Pre-edit a batch of left-padded source tokens.
+
+        The encoder features of the final tokens are collected along the way
+        (from the insert pass of the iteration that finalized each sentence),
+        so they can be given to the generator instead of encoding the edited
+        sentences once more.
+
+        Returns:
+            tuple: the left-padded edited tokens, their lengths and the
+            :class:`EncoderOut` of the first model for them (``None`` if it
+            can not be built from the edit passes), in the order of
+            *src_tokens*
+        """
+        model = self.models[0]
+        bsz = src_tokens.size(0)
+        sent_idxs = torch.arange(bsz, device=src_tokens.device)
+        finalized = []
+
+        tokens = src_tokens
+        for _ in range(self.max_iter):
+            if tokens.size(0) == 0:
+                break
+
+            delete, delete_mask = model.forward_delete(tokens)
+            delete = delete.argmax(-1).masked_fill_(delete_mask, 0)
+            tokens, _ = edit_utils.apply_deletions(tokens, delete, self.pad)
+
+            features, insert_mask = model.encoder.extract_features(tokens)
+            insert = model.predict_insert(features).masked_fill_(insert_mask, 0)
+            edited_tokens, _ = edit_utils.apply_insertions(tokens, insert, self.pad)
+
+            is_edited = delete.ne(0).any(1) | (insert.ne(0) & insert.ne(self.pad)).any(1)
+            # without edits, the insert pass encoded the final tokens
+            is_final = ~is_edited
+            finalized.append((sent_idxs[is_final], tokens[is_final], features[is_final]))
+
+            sent_idxs = sent_idxs[is_edited]
+            tokens = self._strip_left_pad(edited_tokens[is_edited])
+        if tokens.size(0) > 0:
+            # edited in the last iteration, encode the final tokens
+            features, _ = model.encoder.extract_features(tokens)
+            finalized.append((sent_idxs, tokens, features))
+
+        max_len = max(t.size(1) for _, t, _ in finalized)
+        out = src_tokens.new_full((bsz, max_len), self.pad)
+        out_features = finalized[0][2].new_zeros(bsz, max_len, finalized[0][2].size(2))
+        for idxs, t, f in finalized:
+            out[idxs, max_len - t.size(1):] = t
+            out_features[idxs, max_len - t.size(1):] = f
+        lengths = out.ne(self.pad).long().sum(1)
+        start = max_len - int(lengths.max())
+        out, out_features = out[:, start:], out_features[:, start:]
+        return out, lengths, self._encoder_out(model, out, out_features)
+
+    def _encoder_out(self, model, tokens, features):
+        if getattr(model.encoder, 'layer_wise_attention', False):
+            # needs the states of all layers
+            return None
+        _, encoder_embedding = model.encoder.forward_embedding(tokens)
+        return EncoderOut(
+            encoder_out=features.transpose(0, 1),  # T x B x C
+            encoder_padding_mask=tokens.eq(self.pad),  # B x T
+            encoder_embedding=encoder_embedding,  # B x T x C
+            encoder_states=None,
+            src_tokens=None,
+            src_lengths=None,
+        )
+
+    def _strip_left_pad(self, tokens):
+        """Remove the leading columns that only contain padding."""
+        if tokens.size(0) == 0:
+            return tokens
+        max_len = int(tokens.ne(self.pad).long().sum(1).max())
+        return tokens[:, tokens.size(1) - max_len:]
@@ -0,0 +1,67 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Batched application of the delete/insert edits predicted by
+:class:`~fairseq.models.transformer.TransformerModel` to left-padded
+source tokens."""
+
+import torch
+
+
+def left_pack(tokens, keep, padding_idx):
+    """Move the *keep* elements of each row of *tokens* to the right,
+    preserving their order, and left-pad the rest.
+
+    Args:
+        tokens (LongTensor): ``(bsz, len)`` tokens
+        keep (BoolTensor): ``(bsz, len)`` mask of the tokens to keep
+        padding_idx (int): padding index
+
+    Returns:
+        tuple: the ``(bsz, max kept)`` packed tokens and their lengths
+    """
+    lengths = keep.sum(1)
+    max_len = int(lengths.max()) if lengths.numel() > 0 else 0
+    out = tokens.new_full((tokens.size(0), max_len), padding_idx)
+    # column of each kept token in the left-padded output
+    cols = (max_len - lengths).unsqueeze(1) + keep.long().cumsum(1) - 1
+    rows = torch.arange(tokens.size(0), device=tokens.device).unsqueeze(1).expand_as(keep)
+    out[rows[keep], cols[keep]] = tokens[keep]
+    return out, lengths
+
+
+def apply_deletions(tokens, delete, padding_idx):
+    """Remove the tokens where *delete* is set.
+
+    Args:
+        tokens (LongTensor): ``(bsz, len)`` left-padded tokens
+        delete (Tensor): ``(bsz, len)`` non-zero where a token is deleted
+        padding_idx (int): padding index
+
+    Returns:
+        tuple: the left-padded edited tokens and their lengths
+    """
+    keep = tokens.ne(padding_idx) & delete.eq(0)
+    return left_pack(tokens, keep, padding_idx)
+
+
+def apply_insertions(tokens, insert, padding_idx):
+    """Insert ``insert[b, j]`` before ``tokens[b, j]`` wherever it is neither
+    0 nor *padding_idx*.
+
+    Args:
+        tokens (LongTensor): ``(bsz, len)`` left-padded tokens
+        insert (LongTensor): ``(bsz, len)`` ids to insert
+        padding_idx (int): padding index
+
+    Returns:
+        tuple: the left-padded edited tokens and their lengths
+    """
+    has_token = tokens.ne(padding_idx)
+    has_insert = has_token & insert.ne(0) & insert.ne(padding_idx)
+    # interleave every token with the one inserted before it
+    expanded = torch.stack([insert.type_as(tokens), tokens], dim=2).view(tokens.size(0), -1)
+    keep = torch.stack([has_insert, has_token], dim=2).view(tokens.size(0), -1)
+    return left_pack(expanded, keep, padding_idx)
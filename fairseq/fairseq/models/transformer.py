@@ -162,6 +162,15 @@ class TransformerModel(FairseqEncoderDecoderModel):
                             help='add layernorm to embedding')
         parser.add_argument('--no-scale-embedding', action='store_true',
                             help='if True, dont scale embeddings')
+        parser.add_argument('--secoco-packed-encoder', action='store_true',
+                            help='encode the delete, insert and translation inputs'
+                                 ' with a single encoder call')
+        parser.add_argument('--factorized-insert', action='store_true',
+                            help='predict whether to insert a token before predicting'
+                                 ' which one, instead of scoring the vocabulary everywhere')
+        parser.add_argument('--insert-shortlist', type=str, metavar='FILE',
+                            help='only predict the insertion of the tokens listed in FILE'
+                                 ' (the insert_shortlist.txt written by preprocessing)')
         # fmt: on
 
     @classmethod
@@ -209,10 +218,31 @@ class TransformerModel(FairseqEncoderDecoderModel):
                 args, tgt_dict, args.decoder_embed_dim, args.decoder_embed_path
             )
 
+        insert_shortlist = None
+        if args.insert_shortlist and getattr(args, "insert_shortlist_len", None) is None:
+            # the shortlist is saved with the model, it is only read when
+            # training starts
+            insert_shortlist = cls.load_insert_shortlist(args.insert_shortlist, src_dict)
+            args.insert_shortlist_len = len(insert_shortlist)
+
         encoder = cls.build_encoder(args, src_dict, encoder_embed_tokens)
         decoder = cls.build_decoder(args, tgt_dict, decoder_embed_tokens)
+        if insert_shortlist is not None:
+            encoder.set_insert_shortlist(insert_shortlist)
         return cls(args, encoder, decoder)
 
+    @classmethod
+    def load_insert_shortlist(cls, path, dictionary):
+        """Load the dictionary ids of an insert shortlist, with 0 (no
+        insertion) first."""
+        ids = [0]
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                idx = dictionary.index(line.rstrip().rsplit(" ", 1)[0])
+                if idx != dictionary.unk() and idx not in ids:
+                    ids.append(idx)
+        return torch.LongTensor(ids)
+
     @classmethod
     def build_embedding(cls, args, dictionary, embed_dim, path=None):
         num_embeddings = len(dictionary)
@@ -252,36 +282,38 @@ class TransformerModel(FairseqEncoderDecoderModel):
         features_only: bool = False,
         alignment_layer: Optional[int] = None,
         alignment_heads: Optional[int] = None,
+        src2_is_src1: Optional[Tensor] = None,
+        src3_is_src1: Optional[Tensor] = None,
+        ref2: Optional[Tensor] = None,
     ):
         """
         Run the forward pass for an encoder-decoder model.
 
         Copied from the base class, but without ``**kwargs``,
         which are not supported by TorchScript.
-        """
-
-        # predict delete
-        features, encoder1_mask = self.encoder.extract_features(
-            src1_tokens
-        )
-        encoder1_out = self.encoder.delete_layer(features)
-        encoder1_out = F.log_softmax(encoder1_out, dim=-1)
-
-        # predict insert
-        features, encoder2_mask = self.encoder.extract_features(
-            src2_tokens
-        )
-        encoder2_out = torch.cat([torch.cat([torch.zeros_like(features[:, 0:1, :]), features[:, :-1, :]], 1), features], 2)
-        encoder2_out = self.encoder.insert_layer(encoder2_out)
-        encoder2_out = F.log_softmax(encoder2_out, dim=-1)
 
-        # predict translation
-        encoder_out = self.encoder(
+        The delete and insert heads are only applied to the non-pad positions
+        of their input, so their outputs are flat (N x V), in the order of
+        ``~mask``. Given the insertion labels *ref2*, the insert projection
+        is further restricted to the positions it is trained on, see
+        :func:`forward_insert_heads`.
+
+        *src2_is_src1* and *src3_is_src1* (BoolTensor, optional) flag the
+        sentences whose ``src2``/``src3`` tokens equal their ``src1`` tokens;
+        these are then encoded only once. With ``--secoco-packed-encoder``
+        the three inputs go through the encoder in a single call, see
+        :func:`TransformerEncoder.forward_sources`.
+        """
+        src1_out, src2_out, encoder_out = self.encoder.forward_sources(
+            src1_tokens,
+            src2_tokens,
             src3_tokens,
-            src_lengths=src_lengths,
-            cls_input=cls_input,
+            src2_is_src1=src2_is_src1,
+            src3_is_src1=src3_is_src1,
+            packed=getattr(self.args, 'secoco_packed_encoder', False),
             return_all_hiddens=return_all_hiddens,
         )
+
         decoder_out = self.decoder(
             prev_output_tokens,
             encoder_out=encoder_out,
@@ -291,21 +323,48 @@ class TransformerModel(FairseqEncoderDecoderModel):
             src_lengths=src_lengths,
             return_all_hiddens=return_all_hiddens,
         )
-        #return decoder_out
+        delete_mask = src1_out.encoder_padding_mask
+        insert_mask = src2_out.encoder_padding_mask
+        insert_out = self.forward_insert_heads(
+            src2_out.encoder_out.transpose(0, 1), insert_mask,
+            None if ref2 is None else self.insert_targets(ref2)[~insert_mask],
+        )
+        insert_out['mask'] = insert_mask
         return {
             'delete': {
-                'out': encoder1_out, 
-                'mask': encoder1_mask
-            },
-            'insert': {
-                'out': encoder2_out,
-                'mask': encoder2_mask
+                'out': self.output_delete(src1_out.encoder_out.transpose(0, 1)[~delete_mask]),
+                'mask': delete_mask
             },
+            'insert': insert_out,
             'translation': {
                 'out': decoder_out
             }
         }
 
+    def forward_insert_heads(self, features, mask, targets: Optional[Tensor] = None):
+        """Apply the insert heads to the encoder features (B x T x C) of the
+        input after deletion where *mask* is not set.
+
+        Returns a dict with the gate log-probs (``gate``, with
+        ``--factorized-insert``, ``None`` otherwise) and the token log-probs
+        (``out``). Given the classes *targets* of the non-pad positions (see
+        :func:`insert_targets`), returned as ``targets``, the tokens are only
+        scored where they can be predicted: inside the shortlist, and where
+        a token is inserted with ``--factorized-insert``.
+        """
+        features = self.insert_features(features)[~mask]
+        gate: Optional[Tensor] = None
+        if self.encoder.insert_gate is not None:
+            gate = self.output_insert_gate(features)
+        if targets is not None:
+            scored = targets.gt(0) if gate is not None else targets.ge(0)
+            features = features[scored]
+        return {
+            'out': self.output_insert_tokens(features),
+            'gate': gate,
+            'targets': targets,
+        }
+
     def forward_delete(
         self,
         src1_tokens
@@ -313,9 +372,7 @@ class TransformerModel(FairseqEncoderDecoderModel):
         features, encoder1_mask = self.encoder.extract_features(
             src1_tokens
         )
-        encoder1_out = self.encoder.delete_layer(features)
-        encoder1_out = F.log_softmax(encoder1_out, dim=-1)
-        return encoder1_out, encoder1_mask
+        return self.output_delete(features), encoder1_mask
     
     def forward_insert(
         self,
@@ -324,10 +381,74 @@ class TransformerModel(FairseqEncoderDecoderModel):
         features, encoder2_mask = self.encoder.extract_features(
             src2_tokens
         )
-        encoder2_out = torch.cat([torch.cat([torch.zeros_like(features[:, 0:1, :]), features[:, :-1, :]], 1), features], 2)
-        encoder2_out = self.encoder.insert_layer(encoder2_out)
-        encoder2_out = F.log_softmax(encoder2_out, dim=-1)
-        return encoder2_out, encoder2_mask
+        return self.output_insert(features), encoder2_mask
+
+    def output_delete(self, features):
+        """Delete log-probs of each token given the encoder features
+        (B x T x C) of the noisy input."""
+        encoder1_out = self.encoder.delete_layer(features)
+        return F.log_softmax(encoder1_out, dim=-1)
+
+    def insert_features(self, features):
+        """Features of the previous and the current token (B x T x 2C) given
+        the encoder features (B x T x C) of the input after deletion."""
+        return torch.cat([torch.cat([torch.zeros_like(features[:, 0:1, :]), features[:, :-1, :]], 1), features], 2)
+
+    def output_insert(self, features):
+        """Log-probs of the token to insert before each token given the
+        encoder features (B x T x C) of the input after deletion.
+
+        With ``--insert-shortlist``, these are over the shortlist instead of
+        the dictionary, see :func:`insert_targets`.
+        """
+        encoder2_out = self.insert_features(features)
+        if self.encoder.insert_gate is None:
+            return self.output_insert_tokens(encoder2_out)
+        # p(0) = p(no insert), p(v) = p(insert) * p(v | insert)
+        gate = self.output_insert_gate(encoder2_out)
+        lprobs = self.output_insert_tokens(encoder2_out) + gate[..., 1:]
+        return torch.cat([gate[..., :1], lprobs[..., 1:]], dim=-1)
+
+    def output_insert_gate(self, insert_features):
+        """Log-probs of inserting a token (index 1) or not (index 0) given
+        the :func:`insert_features`, with ``--factorized-insert``."""
+        return F.log_softmax(self.encoder.insert_gate(insert_features), dim=-1)
+
+    def output_insert_tokens(self, insert_features):
+        """Log-probs over the vocabulary given the :func:`insert_features`.
+        With ``--factorized-insert``, these are conditioned on inserting."""
+        return F.log_softmax(self.encoder.insert_layer(insert_features), dim=-1)
+
+    def insert_targets(self, ref2):
+        """Map insertion labels (dictionary ids) to the classes predicted by
+        the insert projection. Tokens outside the insert shortlist are
+        mapped to -1."""
+        if self.encoder.insert_shortlist is None:
+            return ref2
+        return self.encoder.insert_class[ref2]
+
+    def insert_ids(self, classes):
+        """Map classes of the insert projection to dictionary ids."""
+        if self.encoder.insert_shortlist is None:
+            return classes
+        return self.encoder.insert_shortlist[classes]
+
+    def predict_insert(self, features, threshold: float = 0.5):
+        """Id of the token to insert before each token (0 if none) given the
+        encoder features (B x T x C) of the input after deletion.
+
+        With ``--factorized-insert``, a token is inserted where the
+        probability of the gate exceeds *threshold* and the vocabulary is
+        only scored at these positions.
+        """
+        if self.encoder.insert_gate is None:
+            return self.insert_ids(self.output_insert(features).argmax(-1))
+        encoder2_out = self.insert_features(features)
+        gated = self.output_insert_gate(encoder2_out)[..., 1].exp().gt(threshold)
+        insert = gated.new_zeros(gated.size(), dtype=torch.long)
+        if gated.any():
+            insert[gated] = self.insert_ids(self.output_insert_tokens(encoder2_out[gated]).argmax(-1))
+        return insert
 
     # Since get_normalized_probs is in the Fairseq Model which is not scriptable,
     # I rewrite the get_normalized_probs from Base Class to call the
@@ -468,11 +589,32 @@ class TransformerEncoder(FairseqEncoder):
 
         # build Linear
         self.delete_layer = Linear(embed_dim, 2, False)
-        self.insert_layer = Linear(embed_dim*2, len(dictionary), False)
+        insert_shortlist_len = getattr(args, "insert_shortlist_len", None)
+        if insert_shortlist_len:
+            # dictionary id of each insert class and class of each id (-1 if
+            # not in the shortlist), see set_insert_shortlist()
+            self.register_buffer("insert_shortlist", torch.zeros(insert_shortlist_len, dtype=torch.long))
+            self.register_buffer("insert_class", torch.full((len(dictionary),), -1, dtype=torch.long))
+            self.insert_layer = Linear(embed_dim*2, insert_shortlist_len, False)
+        else:
+            self.insert_shortlist = None
+            self.insert_class = None
+            self.insert_layer = Linear(embed_dim*2, len(dictionary), False)
+        if getattr(args, "factorized_insert", False):
+            self.insert_gate = Linear(embed_dim*2, 2, False)
+        else:
+            self.insert_gate = None
 
     def build_encoder_layer(self, args):
         return TransformerEncoderLayer(args)
 
+    def set_insert_shortlist(self, shortlist):
+        """Set the dictionary ids (LongTensor) predicted by the insert
+        projection."""
+        self.insert_shortlist.copy_(shortlist)
+        self.insert_class.fill_(-1)
+        self.insert_class[shortlist] = torch.arange(len(shortlist), device=shortlist.device)
+
     def forward_embedding(self, src_tokens):
         # embed tokens and positions
         x = embed = self.embed_scale * self.embed_tokens(src_tokens)
@@ -575,6 +717,147 @@ class TransformerEncoder(FairseqEncoder):
         return x, encoder_padding_mask
 
 
+    def forward_sources(
+        self,
+        src1_tokens,
+        src2_tokens,
+        src3_tokens,
+        src2_is_src1: Optional[Tensor] = None,
+        src3_is_src1: Optional[Tensor] = None,
+        packed: bool = False,
+        return_all_hiddens: bool = False,
+    ):
+        """Encode the inputs of the delete, insert and translation sub-tasks.
+
+        Args:
+            src1_tokens, src2_tokens, src3_tokens (LongTensor): left-padded
+                inputs of the three sub-tasks of shape `(batch, src_len)`
+            src2_is_src1, src3_is_src1 (BoolTensor, optional): flag the
+                sentences whose ``src2`` (resp. ``src3``) tokens equal their
+                ``src1`` tokens. Their output is copied from the ``src1``
+                output instead of being computed again.
+            packed (bool, optional): concatenate the inputs along the batch
+                dimension and run the encoder once (default: False)
+            return_all_hiddens (bool, optional): also return all of the
+                intermediate hidden states (default: False).
+
+        Returns:
+            list: the :class:`EncoderOut` of each input
+        """
+        if self.layer_wise_attention:
+            return_all_hiddens = True
+
+        sources = [src1_tokens, src2_tokens, src3_tokens]
+        todos = [None] + [
+            None if is_dup is None else (~is_dup).nonzero().squeeze(1)
+            for is_dup in [src2_is_src1, src3_is_src1]
+        ]
+        inputs = [
+            tokens if todo is None else self._strip_left_pad(tokens.index_select(0, todo))
+            for tokens, todo in zip(sources, todos)
+        ]
+
+        if packed:
+            outs = self.forward_packed(inputs, return_all_hiddens=return_all_hiddens)
+        else:
+            outs = [
+                self.forward(tokens, src_lengths=None, return_all_hiddens=return_all_hiddens)
+                if tokens.size(0) > 0 else None
+                for tokens in inputs
+            ]
+
+        for i in range(1, len(sources)):
+            if todos[i] is not None:
+                outs[i] = self._copy_dup_rows(sources[i], todos[i], outs[i], outs[0])
+        return outs
+
+    def forward_packed(self, src_tokens_list: List[Tensor], return_all_hiddens: bool = False):
+        """Encode several batches of left-padded tokens with a single pass
+        through the encoder layers.
+
+        The batches are left-padded to a common length and concatenated
+        along the batch dimension. Positions do not depend on the amount of
+        left padding, so each output slice is the same as if its batch was
+        encoded on its own.
+
+        Returns:
+            list: the :class:`EncoderOut` of each batch
+        """
+        max_len = max(tokens.size(1) for tokens in src_tokens_list)
+        packed_out = self.forward(
+            torch.cat([
+                _left_pad_align(tokens, max_len, 1, self.padding_idx)
+                for tokens in src_tokens_list
+            ], dim=0),
+            src_lengths=None,
+            return_all_hiddens=return_all_hiddens,
+        )
+
+        outs = []
+        offset = 0
+        for tokens in src_tokens_list:
+            bsz, src_len = tokens.size()
+            encoder_states = packed_out.encoder_states
+            if encoder_states is not None:
+                encoder_states = [
+                    _left_pad_align(state.narrow(1, offset, bsz), src_len, 0)
+                    for state in encoder_states
+                ]
+            outs.append(EncoderOut(
+                encoder_out=_left_pad_align(packed_out.encoder_out.narrow(1, offset, bsz), src_len, 0),
+                encoder_padding_mask=tokens.eq(self.padding_idx),
+                encoder_embedding=_left_pad_align(packed_out.encoder_embedding.narrow(0, offset, bsz), src_len, 1),
+                encoder_states=encoder_states,
+                src_tokens=None,
+                src_lengths=None,
+            ))
+            offset += bsz
+        return outs
+
+    def _copy_dup_rows(
+        self,
+        src_tokens,
+        todo,
+        todo_out: Optional[EncoderOut],
+        dup_out: EncoderOut,
+    ):
+        """Build the output for *src_tokens* from *todo_out*, the output of
+        its rows *todo*, and *dup_out*, the output of other tokens that are
+        identical for the remaining rows."""
+        src_len = src_tokens.size(1)
+        x = _left_pad_align(dup_out.encoder_out, src_len, 0)
+        encoder_embedding = _left_pad_align(dup_out.encoder_embedding, src_len, 1)
+        encoder_states = dup_out.encoder_states
+        if encoder_states is not None:
+            encoder_states = [_left_pad_align(state, src_len, 0) for state in encoder_states]
+
+        if todo_out is not None:
+            x = x.index_copy(1, todo, _left_pad_align(todo_out.encoder_out, src_len, 0))
+            encoder_embedding = encoder_embedding.index_copy(
+                0, todo, _left_pad_align(todo_out.encoder_embedding, src_len, 1)
+            )
+            if encoder_states is not None and todo_out.encoder_states is not None:
+                encoder_states = [
+                    state.index_copy(1, todo, _left_pad_align(todo_state, src_len, 0))
+                    for state, todo_state in zip(encoder_states, todo_out.encoder_states)
+                ]
+
+        return EncoderOut(
+            encoder_out=x,  # T x B x C
+            encoder_padding_mask=src_tokens.eq(self.padding_idx),  # B x T
+            encoder_embedding=encoder_embedding,  # B x T x C
+            encoder_states=encoder_states,  # List[T x B x C]
+            src_tokens=None,
+            src_lengths=None,
+        )
+
+    def _strip_left_pad(self, src_tokens):
+        """Remove the leading columns that only contain padding."""
+        if src_tokens.size(0) == 0:
+            return src_tokens[:, :0]
+        max_len = int(src_tokens.ne(self.padding_idx).long().sum(1).max())
+        return src_tokens[:, src_tokens.size(1) - max_len:]
+
     @torch.jit.export
     def reorder_encoder_out(self, encoder_out: EncoderOut, new_order):
         """
@@ -1002,6 +1285,17 @@ class TransformerDecoder(FairseqIncrementalDecoder):
         return state_dict
 
 
+def _left_pad_align(x, length: int, dim: int, pad: int = 0):
+    """Drop or *pad* leading elements of *x* along *dim* to get *length*
+    elements, keeping left-padded sequences aligned to the right."""
+    diff = length - x.size(dim)
+    if diff <= 0:
+        return x.narrow(dim, -diff, length)
+    shape = list(x.size())
+    shape[dim] = diff
+    return torch.cat([x.new_full(shape, pad), x], dim=dim)
+
+
 def Embedding(num_embeddings, embedding_dim, padding_idx):
     m = nn.Embedding(num_embeddings, embedding_dim, padding_idx=padding_idx)
     nn.init.normal_(m.weight, mean=0, std=embedding_dim ** -0.5)
@@ -1060,6 +1354,9 @@ def base_architecture(args):
 
     args.no_scale_embedding = getattr(args, "no_scale_embedding", False)
     args.layernorm_embedding = getattr(args, "layernorm_embedding", False)
+    args.secoco_packed_encoder = getattr(args, "secoco_packed_encoder", False)
+    args.factorized_insert = getattr(args, "factorized_insert", False)
+    args.insert_shortlist = getattr(args, "insert_shortlist", None)
 
 
 @register_model_architecture("transformer", "transformer_iwslt_de_en")
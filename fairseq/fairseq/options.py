@@ -19,6 +19,12 @@ def get_preprocessing_parser(default_task="translation"):
     return parser
 
 
+def get_noise_generation_parser(default_task="translation"):
+    parser = get_parser("Noise generation", default_task)
+    add_noise_generation_args(parser)
+    return parser
+
+
 def get_training_parser(default_task="translation"):
     parser = get_parser("Trainer", default_task)
     add_dataset_args(parser, train=True)
@@ -296,6 +302,70 @@ def add_preprocess_args(parser):
                        help="Pad dictionary size to be multiple of N")
     group.add_argument("--workers", metavar="N", default=1, type=int,
                        help="number of parallel workers")
+    group.add_argument("--virtual-duplication", action="store_true",
+                       help="write each example once instead of twice; train "
+                            "with --virtual-duplication to restore the noisy "
+                            "input copy at load time")
+    group.add_argument("--clean-source", action="store_true",
+                       help="binarize only the clean source, for training "
+                            "with --online-noise")
+    group.add_argument("--withref-suffix", metavar="SUFFIX", default=None,
+                       help="binarize the source noise streams from the edits "
+                            "turning the noisy source {pref}.SUFFIX into the "
+                            "clean source {pref}.{src}, instead of the "
+                            ".tag.noise.zh and .pos files")
+    group.add_argument("--derive-edit-labels", action="store_true",
+                       help="with --withref-suffix, only binarize the noisy "
+                            "(src1) and clean (src3) sources; the edit labels "
+                            "are derived from them when batching")
+    group.add_argument("--insert-shortlist-size", metavar="N", default=0, type=int,
+                       help="number of most frequent insertion labels of the "
+                            "training data to write to insert_shortlist.txt "
+                            "(default: all of them)")
+    # fmt: on
+    return parser
+
+
+def add_noise_generation_args(parser):
+    from fairseq.data.edit_noising import EDIT_NOISING
+
+    group = parser.add_argument_group("Noise generation")
+    # fmt: off
+    group.add_argument("--input", metavar="FP", required=True,
+                       help="clean source file, tokenized like the dictionary")
+    group.add_argument("--noise", required=True, choices=list(EDIT_NOISING.keys()),
+                       help="apply the noise rules of the given domain")
+    group.add_argument("--noise-args", type=str, metavar="JSON",
+                       help="args for building the noise, e.g., '{\"delete_prob\": 0.05}'")
+    group.add_argument("--srcdict", metavar="FP", required=True,
+                       help="source dictionary")
+    group.add_argument("--output-noise", metavar="FP", default=None,
+                       help="write the noisy source to this file")
+    group.add_argument("--output-pos", metavar="FP", default=None,
+                       help="write the annotations of the edits to this file, in "
+                            "the format of generate_data_*/export_for_task.py")
+    group.add_argument("--destdir", metavar="DIR", default=None,
+                       help="write the binarized noise streams to this dir, the "
+                            "target is binarized by fairseq-preprocess")
+    group.add_argument("-s", "--source-lang", default=None, metavar="SRC",
+                       help="source language")
+    group.add_argument("-t", "--target-lang", default=None, metavar="TARGET",
+                       help="target language")
+    group.add_argument("--output-prefix", metavar="NAME", default="train",
+                       help="split name of the binarized streams")
+    parser.add_argument('--dataset-impl', metavar='FORMAT', default='mmap',
+                        choices=get_available_dataset_impl(),
+                        help='output dataset implementation')
+    group.add_argument("--virtual-duplication", action="store_true",
+                       help="write each example once instead of twice")
+    group.add_argument("--insert-shortlist-size", metavar="N", default=0, type=int,
+                       help="number of most frequent insertion labels to write to "
+                            "insert_shortlist.txt (train split only)")
+    group.add_argument("--workers", metavar="N", default=1, type=int,
+                       help="number of parallel workers")
+    group.add_argument("--chunk-size", metavar="N", default=10000, type=int,
+                       help="number of lines noised with the same seed; the output "
+                            "only depends on --seed and --chunk-size")
     # fmt: on
     return parser
 
@@ -305,6 +375,13 @@ def add_dataset_args(parser, train=False, gen=False):
     # fmt: off
     group.add_argument('--num-workers', default=1, type=int, metavar='N',
                        help='how many subprocesses to use for data loading')
+    group.add_argument('--prefetch-batches', default=0, type=int, metavar='N',
+                       help='prepare N batches ahead in a background thread, copying '
+                            'them to the GPU on a side CUDA stream')
+    group.add_argument('--pin-memory', action='store_true',
+                       help='copy the batches to pinned memory in the main process '
+                            'for asynchronous copies to the GPU (batches prefetched '
+                            'with --prefetch-batches are always pinned)')
     group.add_argument('--skip-invalid-size-inputs-valid-test', action='store_true',
                        help='ignore too long or too short lines in valid and test set')
     group.add_argument('--max-tokens', type=int, metavar='N',
@@ -570,6 +647,9 @@ def add_generation_args(parser):
     group.add_argument('--retain-iter-history', action='store_true',
                        help='if set, decoding returns the whole history of iterative refinement')
 
+    group.add_argument('--preedit-max-iter', default=3, type=int, metavar='N',
+                       help='maximum delete/insert iterations of the source pre-editing')
+
     # special decoding format for advanced decoding.
     group.add_argument('--decoding-format', default=None, type=str, choices=['unigram', 'ensemble', 'vote', 'dp', 'bs'])
     # fmt: on
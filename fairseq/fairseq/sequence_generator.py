@@ -155,6 +155,8 @@ class SequenceGenerator(nn.Module):
                 with these tokens
             bos_token (int, optional): beginning of sentence token
                 (default: self.eos)
+            encoder_outs (List[EncoderOut], optional): encoder output of each
+                model for the source tokens, computed if not given
         """
         self.model.reset_incremental_state()
         return self._generate(sample, **kwargs)
@@ -164,6 +166,7 @@ class SequenceGenerator(nn.Module):
         sample: Dict[str, Dict[str, Tensor]],
         prefix_tokens: Optional[Tensor] = None,
         bos_token: Optional[int] = None,
+        encoder_outs: Optional[List[EncoderOut]] = None,
     ):
 
         encoder_input: Dict[str, Tensor] = {}
@@ -194,10 +197,11 @@ class SequenceGenerator(nn.Module):
             self.min_len <= max_len
         ), "min_len cannot be larger than max_len, please adjust these!"
         # compute the encoder output for each beam
-        encoder_outs = self.model.forward_encoder(
-            src_tokens=encoder_input["src3_tokens"],
-            src_lengths=encoder_input["src_lengths"],
-        )
+        if encoder_outs is None:
+            encoder_outs = self.model.forward_encoder(
+                src_tokens=encoder_input["src3_tokens"],
+                src_lengths=encoder_input["src_lengths"],
+            )
 
         # placeholder of indices for bsz * beam_size to hold tokens and accumulative scores
         new_order = torch.arange(bsz).view(-1, 1).repeat(1, beam_size).view(-1)
@@ -117,6 +117,9 @@ class FairseqTask(object):
         shard_id=0,
         num_workers=0,
         epoch=1,
+        buffer_size=0,
+        cuda=False,
+        pin_memory=False,
     ):
         """
         Get an iterator that yields batches of data from the given dataset.
@@ -144,6 +147,12 @@ class FairseqTask(object):
                 (default: 0).
             epoch (int, optional): the epoch to start the iterator from
                 (default: 1).
+            buffer_size (int, optional): number of batches to prepare ahead
+                in a background thread (default: 0).
+            cuda (bool, optional): move the prepared batches to the current
+                CUDA device (default: False).
+            pin_memory (bool, optional): copy the batches to pinned memory in
+                the main process (default: False).
         Returns:
             ~fairseq.iterators.EpochBatchIterator: a batched iterator over the
                 given dataset split
@@ -151,7 +160,8 @@ class FairseqTask(object):
         # For default fairseq task, return same iterator across epochs
         # as datasets are not dynamic, can be overridden in task specific
         # setting.
-        if dataset in self.dataset_to_epoch_iter:
+        can_reuse_epoch_itr = getattr(dataset, 'can_reuse_epoch_itr_across_epochs', True)
+        if can_reuse_epoch_itr and dataset in self.dataset_to_epoch_iter:
             return self.dataset_to_epoch_iter[dataset]
 
         assert isinstance(dataset, FairseqDataset)
@@ -191,8 +201,12 @@ class FairseqTask(object):
             shard_id=shard_id,
             num_workers=num_workers,
             epoch=epoch,
+            buffer_size=buffer_size,
+            cuda=cuda,
+            pin_memory=pin_memory,
         )
-        self.dataset_to_epoch_iter[dataset] = epoch_iter
+        if can_reuse_epoch_itr:
+            self.dataset_to_epoch_iter[dataset] = epoch_iter
         return epoch_iter
 
     def build_model(self, args):
@@ -296,6 +296,7 @@ class MultiLingualMaskedLMTask(FairseqTask):
         self, dataset, max_tokens=None, max_sentences=None, max_positions=None,
         ignore_invalid_inputs=False, required_batch_size_multiple=1,
         seed=1, num_shards=1, shard_id=0, num_workers=0, epoch=1,
+        buffer_size=0, cuda=False, pin_memory=False,
     ):
         # Recreate epoch iterator every epoch cause the underlying
         # datasets are dynamic due to sampling.
@@ -304,6 +305,7 @@ class MultiLingualMaskedLMTask(FairseqTask):
             dataset, max_tokens, max_sentences, max_positions,
             ignore_invalid_inputs, required_batch_size_multiple,
             seed, num_shards, shard_id, num_workers, epoch,
+            buffer_size, cuda, pin_memory,
         )
         self.dataset_to_epoch_iter = {}
         return epoch_iter
@@ -16,13 +16,17 @@ from fairseq.data import (
     AppendTokenDataset,
     ConcatDataset,
     data_utils,
+    DuplicateViewDataset,
+    EditNoisingDataset,
     encoders,
     indexed_dataset,
     LanguagePairDataset,
     PrependTokenDataset,
+    ResamplingDataset,
     StripTokenDataset,
     TruncateDataset,
 )
+from fairseq.data.edit_noising import EDIT_NOISING
 
 from fairseq.tasks import FairseqTask, register_task
 
@@ -39,7 +43,9 @@ def load_langpair_dataset(
     combine, dataset_impl, upsample_primary,
     left_pad_source, left_pad_target, max_source_positions,
     max_target_positions, prepend_bos=False, load_alignments=False,
-    truncate_source=False, append_source_id=False
+    truncate_source=False, append_source_id=False, virtual_duplication=False,
+    noiser=None, seed=1, token_cost='max',
+    noisy_ratio=None, epoch_ratio=1.0, epoch=1,
 ):
 
     def split_exists(split, src, tgt, lang, data_path):
@@ -48,11 +54,14 @@ def load_langpair_dataset(
 
     src1_datasets, src2_datasets, src3_datasets = [], [], []
     ref1_datasets, ref2_datasets, ref3_datasets = [], [], []
+    edit_datasets = []
+    edit_counts = []
 
     for k in itertools.count():
         split_k = split + (str(k) if k > 0 else '')
 
-        if not split_exists(split_k, src, tgt, 'src1', data_path):
+        # with online noise only the clean source is binarized
+        if not split_exists(split_k, src, tgt, src if noiser is not None else 'src1', data_path):
             if k > 0:
                 break
             else:
@@ -60,22 +69,34 @@ def load_langpair_dataset(
 
         prefix = os.path.join(data_path, '{}.{}-{}.'.format(split_k, src, tgt))
 
-        src1_dataset = data_utils.load_indexed_dataset(prefix + 'src1', src_dict, dataset_impl)
-        src2_dataset = data_utils.load_indexed_dataset(prefix + 'src2', src_dict, dataset_impl)
-        src3_dataset = data_utils.load_indexed_dataset(prefix + 'src3', src_dict, dataset_impl)
+        if noiser is not None:
+            src_dataset = data_utils.load_indexed_dataset(prefix + src, src_dict, dataset_impl)
+            edit_datasets.append(EditNoisingDataset(src_dataset, noiser, seed=seed))
+            src1_datasets.append(edit_datasets[-1])
+        elif dataset_impl == 'edit':
+            edit_datasets.append(indexed_dataset.EditAnnotatedDataset(prefix[:-1]))
+            src1_datasets.append(edit_datasets[-1])
+        else:
+            src1_dataset = data_utils.load_indexed_dataset(prefix + 'src1', src_dict, dataset_impl)
+            src3_dataset = data_utils.load_indexed_dataset(prefix + 'src3', src_dict, dataset_impl)
 
-        src1_datasets.append(src1_dataset)
-        src2_datasets.append(src2_dataset)
-        src3_datasets.append(src3_dataset)
+            src1_datasets.append(src1_dataset)
+            src3_datasets.append(src3_dataset)
 
+            # without them (fairseq-preprocess --derive-edit-labels) the edit
+            # labels are derived from src1 and src3 by the collater
+            if indexed_dataset.dataset_exists(prefix + 'ref1', impl=dataset_impl):
+                src2_dataset = data_utils.load_indexed_dataset(prefix + 'src2', src_dict, dataset_impl)
+                ref1_dataset = data_utils.load_indexed_dataset(prefix + 'ref1', tgt_dict, dataset_impl)
+                ref2_dataset = data_utils.load_indexed_dataset(prefix + 'ref2', tgt_dict, dataset_impl)
 
-        ref1_dataset = data_utils.load_indexed_dataset(prefix + 'ref1', tgt_dict, dataset_impl)
-        ref2_dataset = data_utils.load_indexed_dataset(prefix + 'ref2', tgt_dict, dataset_impl)
-        ref3_dataset = data_utils.load_indexed_dataset(prefix + tgt, tgt_dict, dataset_impl)
+                src2_datasets.append(src2_dataset)
+                ref1_datasets.append(ref1_dataset)
+                ref2_datasets.append(ref2_dataset)
 
-        ref1_datasets.append(ref1_dataset)
-        ref2_datasets.append(ref2_dataset)
+        ref3_dataset = data_utils.load_indexed_dataset(prefix + tgt, tgt_dict, dataset_impl)
         ref3_datasets.append(ref3_dataset)
+        edit_counts.append(indexed_dataset.load_edit_counts(prefix[:-1]))
 
         logger.info('{} {} {}-{} {} examples'.format(
             data_path, split_k, src, tgt, len(src1_datasets[-1])
@@ -84,37 +105,109 @@ def load_langpair_dataset(
         if not combine:
             break
 
-    if len(src1_datasets) == 1:
-        src1_dataset = src1_datasets[0]
-        ref1_dataset = ref1_datasets[0]
-        src2_dataset = src2_datasets[0]
-        ref2_dataset = ref2_datasets[0]
-        src3_dataset = src3_datasets[0]
-        ref3_dataset = ref3_datasets[0]
-    else:
-        sample_ratios = [1] * len(src1_datasets)
-        sample_ratios[0] = upsample_primary
-        src1_dataset = ConcatDataset(src1_datasets, sample_ratios)
-        src2_dataset = ConcatDataset(src2_datasets, sample_ratios)
-        src3_dataset = ConcatDataset(src3_datasets, sample_ratios)
-
-        ref1_dataset = ConcatDataset(ref1_datasets, sample_ratios)
-        ref2_dataset = ConcatDataset(ref2_datasets, sample_ratios)
-        ref3_dataset = ConcatDataset(ref3_datasets, sample_ratios)
+    if len(ref1_datasets) not in (0, len(src1_datasets)):
+        raise ValueError(
+            'some shards of {} ({}) were binarized with --derive-edit-labels '
+            'and some without it'.format(split, data_path)
+        )
+    if len(src3_datasets) > 0 and len(ref1_datasets) == 0:
+        logger.info('deriving the edit labels of {} from src1 and src3'.format(split))
+
+    sample_ratios = [1] * len(src1_datasets)
+    sample_ratios[0] = upsample_primary
+
+    def concat(datasets):
+        if len(datasets) == 0:
+            return None
+        if len(datasets) == 1:
+            return datasets[0]
+        return ConcatDataset(datasets, sample_ratios)
+
+    src1_dataset = concat(src1_datasets)
+    src2_dataset = concat(src2_datasets)
+    src3_dataset = concat(src3_datasets)
+
+    ref1_dataset = concat(ref1_datasets)
+    ref2_dataset = concat(ref2_datasets)
+    ref3_dataset = concat(ref3_datasets)
+    edits_dataset = concat(edit_datasets)
 
     eos = None
 
-    ref1_dataset_sizes = ref1_dataset.sizes
-    return LanguagePairDataset(
-        src1_dataset, src1_dataset.sizes, src_dict,
-        ref1_dataset, ref1_dataset_sizes, tgt_dict,
+    # ref1 is aligned with src1, the target sizes are those of ref3. The
+    # sizes of src2 and src3 are only known when they are stored separately
+    src1_dataset_sizes = src1_dataset.sizes
+    if edits_dataset is not None:
+        src1_dataset = None
+    dataset = LanguagePairDataset(
+        src1_dataset, src1_dataset_sizes, src_dict,
+        ref1_dataset, ref3_dataset.sizes, tgt_dict,
         src2_dataset, src3_dataset,
         ref2_dataset, ref3_dataset,
         left_pad_source=left_pad_source,
         left_pad_target=left_pad_target,
         max_source_positions=max_source_positions,
         max_target_positions=max_target_positions,
-        align_dataset=None, eos=eos
+        align_dataset=None, eos=eos, edits=edits_dataset,
+        src2_sizes=src2_dataset.sizes if src2_dataset is not None else None,
+        src3_sizes=src3_dataset.sizes if src3_dataset is not None else None,
+        token_cost=token_cost,
+    )
+    if virtual_duplication:
+        # the data was binarized with --virtual-duplication
+        dataset = DuplicateViewDataset(dataset)
+
+    if noisy_ratio is not None or epoch_ratio != 1.0:
+        weights = None
+        if noisy_ratio is not None:
+            if noiser is not None or any(c is None for c in edit_counts):
+                raise ValueError(
+                    '--noisy-ratio needs the *.edits.npy counts written by '
+                    'fairseq-preprocess, which are not available with --online-noise '
+                    'or data binarized with --derive-edit-labels'
+                )
+            counts = np.concatenate([
+                np.tile(c, ratio) for c, ratio in zip(edit_counts, sample_ratios)
+            ])
+            if virtual_duplication:
+                counts = np.repeat(counts, 2)
+            weights = edit_sampling_weights(counts, noisy_ratio)
+        dataset = ResamplingDataset(
+            dataset,
+            weights=weights,
+            replace=(weights is not None or epoch_ratio >= 1.0),
+            size_ratio=epoch_ratio,
+            seed=seed,
+            epoch=epoch,
+        )
+    return dataset
+
+
+def edit_sampling_weights(edit_counts, noisy_ratio):
+    """Return the sampling weights giving a share *noisy_ratio* of the
+    examples with at least one edit, each group being sampled uniformly.
+
+    Args:
+        edit_counts (np.array): number of edits of each example
+        noisy_ratio (float): expected ratio of examples with edits
+    """
+    assert 0.0 <= noisy_ratio <= 1.0
+    has_edits = edit_counts > 0
+    num_noisy = int(has_edits.sum())
+    num_clean = len(edit_counts) - num_noisy
+    if num_noisy == 0 or num_clean == 0:
+        logger.warning(
+            'can not sample {:.0%} of examples with edits from {} noisy and {} clean '
+            'examples, sampling uniformly'.format(noisy_ratio, num_noisy, num_clean)
+        )
+        return None
+    logger.info('sampling {:.0%} of examples with edits instead of {:.0%}'.format(
+        noisy_ratio, num_noisy / len(edit_counts)
+    ))
+    return np.where(
+        has_edits,
+        noisy_ratio / num_noisy,
+        (1.0 - noisy_ratio) / num_clean,
     )
 
 
@@ -164,6 +257,28 @@ class TranslationTask(FairseqTask):
                             help='amount to upsample primary dataset')
         parser.add_argument('--truncate-source', action='store_true', default=False,
                             help='truncate source to max-source-positions')
+        parser.add_argument('--virtual-duplication', action='store_true', default=False,
+                            help='data was binarized with --virtual-duplication; '
+                                 'expose each example twice, the second time '
+                                 'with the noisy input as src3')
+        parser.add_argument('--online-noise', default=None, choices=list(EDIT_NOISING.keys()),
+                            help='generate the noisy source from the clean source '
+                                 'every epoch with the rules of the given domain '
+                                 '(data binarized with --clean-source)')
+        parser.add_argument('--online-noise-args', type=str, metavar='JSON',
+                            help='args for building the online noise, '
+                                 'e.g., \'{"delete_prob": 0.05}\'')
+        parser.add_argument('--secoco-token-cost', default='max', choices=['max', 'sum'],
+                            help='number of tokens of an example for --max-tokens: '
+                                 'its longest sentence (max) or the tokens of the three '
+                                 'encoder passes and of the decoder (sum)')
+        parser.add_argument('--noisy-ratio', type=float, metavar='R', default=None,
+                            help='resample the training examples every epoch so that '
+                                 'a ratio R of them has edits (needs the edit counts '
+                                 'written by fairseq-preprocess)')
+        parser.add_argument('--epoch-ratio', type=float, metavar='R', default=1.0,
+                            help='number of training examples sampled per epoch, '
+                                 'relative to the size of the training set')
 
         # options for reporting BLEU during validation
         parser.add_argument('--eval-bleu', action='store_true',
@@ -191,6 +306,11 @@ class TranslationTask(FairseqTask):
         self.src_dict = src_dict
         self.tgt_dict = tgt_dict
 
+        self.noiser = None
+        if getattr(args, 'online_noise', None) is not None:
+            noise_args = json.loads(getattr(args, 'online_noise_args', '{}') or '{}')
+            self.noiser = EDIT_NOISING[args.online_noise](src_dict, **noise_args)
+
     @classmethod
     def setup_task(cls, args, **kwargs):
         """Setup the task (e.g., load dictionaries).
@@ -233,6 +353,14 @@ class TranslationTask(FairseqTask):
         # infer langcode
         src, tgt = self.args.source_lang, self.args.target_lang
 
+        sampling_args = {}
+        if split == getattr(self.args, 'train_subset', 'train'):
+            sampling_args = dict(
+                noisy_ratio=getattr(self.args, 'noisy_ratio', None),
+                epoch_ratio=getattr(self.args, 'epoch_ratio', 1.0),
+                epoch=epoch,
+            )
+
         self.datasets[split] = load_langpair_dataset(
             data_path, split, src, self.src_dict, tgt, self.tgt_dict,
             combine=combine, dataset_impl=self.args.dataset_impl,
@@ -243,6 +371,10 @@ class TranslationTask(FairseqTask):
             max_target_positions=self.args.max_target_positions,
             load_alignments=self.args.load_alignments,
             truncate_source=self.args.truncate_source,
+            virtual_duplication=getattr(self.args, 'virtual_duplication', False),
+            noiser=self.noiser, seed=self.args.seed,
+            token_cost=getattr(self.args, 'secoco_token_cost', 'max'),
+            **sampling_args
         )
 
     def build_dataset_for_inference(self, src_tokens, src_lengths):
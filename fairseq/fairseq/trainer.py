@@ -283,6 +283,9 @@ class Trainer(object):
             shard_id=self.data_parallel_rank if shard_batch_itr else 0,
             num_workers=self.args.num_workers,
             epoch=epoch,
+            buffer_size=getattr(self.args, 'prefetch_batches', 0),
+            cuda=self.cuda,
+            pin_memory=self.cuda and getattr(self.args, 'pin_memory', False),
         )
 
     def get_valid_iterator(
@@ -304,6 +307,9 @@ class Trainer(object):
             num_shards=self.data_parallel_world_size,
             shard_id=self.data_parallel_rank,
             num_workers=self.args.num_workers,
+            buffer_size=getattr(self.args, 'prefetch_batches', 0),
+            cuda=self.cuda,
+            pin_memory=self.cuda and getattr(self.args, 'pin_memory', False),
         )
 
     @metrics.aggregate("train")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Generate noisy training data from a clean source file in a single pass.
+
+This replaces running ``generate_data_*/rule.py``, ``export_for_task.py``
+and ``fairseq-preprocess`` on the intermediate files: the noise rules of
+:mod:`fairseq.data.edit_noising` are applied to the clean source and the
+noisy source, the annotations of the edits and the binarized noise streams
+are written directly.
+"""
+
+from collections import Counter, deque
+import json
+import logging
+from multiprocessing import Pool
+import os
+import sys
+
+import torch
+
+from fairseq import options, tasks, utils
+from fairseq.binarizer import read_chunks
+from fairseq.data import data_utils, indexed_dataset
+from fairseq.data.edit_noising import EDIT_NOISING
+from fairseq.tokenizer import tokenize_line
+from fairseq_cli.preprocess import write_insert_shortlist
+
+
+logging.basicConfig(
+    format='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+    level=logging.INFO,
+    stream=sys.stdout,
+)
+logger = logging.getLogger('fairseq_cli.generate_noise')
+
+
+# noiser of the current process, see init_worker()
+_noiser = None
+
+
+def build_noiser(args):
+    task = tasks.get_task(args.task)
+    dictionary = task.load_dictionary(args.srcdict)
+    noise_args = json.loads(getattr(args, 'noise_args', '{}') or '{}')
+    return EDIT_NOISING[args.noise](dictionary, **noise_args)
+
+
+def init_worker(args, noiser=None):
+    global _noiser
+    _noiser = noiser if noiser is not None else build_noiser(args)
+
+
+def noise_chunk(args, chunk_id, lines):
+    """Noise a chunk of clean lines, with a seed depending only on
+    *chunk_id* so that the output does not depend on the number of workers.
+
+    Returns:
+        List[tuple]: the noisy line, the annotation line and the
+        ``(src1, ref1, src2, ref2, src3)`` arrays of every line
+    """
+    dictionary = _noiser.dictionary
+    ids = dictionary.split_encoded_lines(*dictionary.encode_lines(lines))
+    out = []
+    with data_utils.numpy_seed(args.seed, chunk_id):
+        for line, src3 in zip(lines, ids):
+            src3 = src3.long()
+            streams, noisy, annotations = _noiser.noising_with_annotations(
+                src3, tokenize_line(line),
+            )
+            out.append((
+                ' '.join(noisy), ' '.join(annotations),
+                tuple(t.numpy() for t in streams + (src3,)),
+            ))
+    return out
+
+
+def imap_chunks(args, chunks, noiser):
+    """Noise *chunks* with ``--workers`` processes, yielding the results in
+    order while keeping a bounded number of chunks in flight."""
+    if args.workers <= 1:
+        init_worker(args, noiser)
+        for chunk_id, lines in enumerate(chunks):
+            yield noise_chunk(args, chunk_id, lines)
+        return
+
+    pool = Pool(processes=args.workers, initializer=init_worker, initargs=(args,))
+    pending = deque()
+    for chunk_id, lines in enumerate(chunks):
+        pending.append(pool.apply_async(noise_chunk, (args, chunk_id, lines)))
+        if len(pending) >= 2 * args.workers:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+    pool.close()
+    pool.join()
+
+
+def main(args):
+    utils.import_user_module(args)
+    logger.info(args)
+
+    assert args.output_noise or args.output_pos or args.destdir, \
+        "nothing to write, set --output-noise, --output-pos or --destdir"
+
+    f_noise = open(args.output_noise, 'w', encoding='utf-8') if args.output_noise else None
+    f_pos = open(args.output_pos, 'w', encoding='utf-8') if args.output_pos else None
+    noiser = build_noiser(args)
+    ds, consumers = None, None
+    if args.destdir:
+        assert args.source_lang and args.target_lang, \
+            "--source-lang and --target-lang are required with --destdir"
+        os.makedirs(args.destdir, exist_ok=True)
+        out_prefix = os.path.join(args.destdir, '{}.{}-{}'.format(
+            args.output_prefix, args.source_lang, args.target_lang,
+        ))
+        ds = indexed_dataset.make_noise_builder(
+            out_prefix, impl=args.dataset_impl, vocab_size=len(noiser.dictionary),
+        )
+        consumers = ds.consumers()
+
+    nseq, nnoisy = 0, 0
+    inserted = Counter()
+    with open(args.input, 'r', encoding='utf-8') as f:
+        chunks = read_chunks(f, chunk_size=args.chunk_size)
+        for chunk in imap_chunks(args, chunks, noiser):
+            for noisy, annotations, streams in chunk:
+                nseq += 1
+                nnoisy += int(len(annotations) > 0)
+                if f_noise is not None:
+                    print(noisy, file=f_noise)
+                if f_pos is not None:
+                    print(annotations, file=f_pos)
+                if ds is None:
+                    continue
+                streams = [torch.from_numpy(t) for t in streams]
+                src1, ref1, src2, ref2, src3 = streams
+                inserted.update(ref2[ref2.ne(0)].tolist())
+                for consumer, t in zip(consumers, streams):
+                    consumer(t)
+                if not args.virtual_duplication:
+                    # noisy input -> noisy input copy, see Binarizer.binarize_noise
+                    for consumer, t in zip(consumers, (src1, ref1, src2, ref2, src1)):
+                        consumer(t)
+
+    for fp in [f_noise, f_pos]:
+        if fp is not None:
+            fp.close()
+    if ds is not None:
+        ds.finalize()
+        if args.output_prefix == 'train':
+            write_insert_shortlist(
+                inserted, noiser.dictionary,
+                os.path.join(args.destdir, 'insert_shortlist.txt'),
+                args.insert_shortlist_size,
+            )
+
+    logger.info('{}: {} sents, {} with noise ({:.3}%)'.format(
+        args.input, nseq, nnoisy, 100 * nnoisy / max(nseq, 1),
+    ))
+
+
+def cli_main():
+    parser = options.get_noise_generation_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
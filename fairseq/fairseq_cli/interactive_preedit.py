@@ -18,6 +18,7 @@ import torch
 
 from fairseq import checkpoint_utils, options, tasks, utils
 from fairseq.data import encoders
+from fairseq.iterative_preeditor import IterativePreEditor
 
 
 logging.basicConfig(
@@ -47,11 +48,11 @@ def buffered_read(input, buffer_size):
 
 
 def make_batches(lines, args, task, max_positions, encode_fn):
+    src_dict = task.source_dictionary
     tokens = [
-        task.source_dictionary.encode_line(
-            encode_fn(src_str), add_if_not_exist=False
-        ).long()
-        for src_str in lines
+        t.long() for t in src_dict.split_encoded_lines(
+            *src_dict.encode_lines([encode_fn(src_str) for src_str in lines])
+        )
     ]
     lengths = [t.numel() for t in tokens]
     itr = task.get_batch_iterator(
@@ -67,14 +68,6 @@ def make_batches(lines, args, task, max_positions, encode_fn):
             src1_tokens=batch['net_input']['src1_tokens'], src_lengths=batch['net_input']['src_lengths'],
         )
 
-def remake_batches(tokens, src_tokens, args, task, max_positions):
-    lengths = [t.numel() for t in tokens]
-    res = src_tokens[-1].new(len(tokens), max(lengths)).fill_(1)
-    for idx, token in enumerate(tokens):
-        res[idx, max(lengths)-lengths[idx]:].copy_(token)
-    res_lengths = torch.LongTensor(lengths)
-    return res, res_lengths
-
 
 def main(args):
     utils.import_user_module(args)
@@ -121,6 +114,7 @@ def main(args):
 
     # Initialize generator
     generator = task.build_generator(models, args)
+    preeditor = IterativePreEditor(src_dict, models, max_iter=args.preedit_max_iter)
 
     # Handle tokenization and BPE
     tokenizer = encoders.build_tokenizer(args)
@@ -165,50 +159,8 @@ def main(args):
                 src_tokens = src_tokens.cuda()
                 src_lengths = src_lengths.cuda()
             
-            for _ in range(3):
-                # predict delete
-                delete, delete_mask = models[0].forward_delete(src_tokens)
-                delete = torch.argmax(delete, dim=-1)
-                delete = delete*(~delete_mask)
-                #print(delete)
-                # edit src_tokens
-                src_tokens_list = src_tokens.tolist()
-                new_src_tokens_list = []
-                delete_list = delete.tolist()
-                for idx, line_delete in enumerate(delete_list):
-                    temp = []
-                    for jdx, token_delete in enumerate(line_delete):
-                        if token_delete == 1 or src_tokens_list[idx][jdx] == 1:
-                            continue
-                        else:
-                            temp.append(src_tokens_list[idx][jdx])
-                    new_src_tokens_list.append(torch.IntTensor(temp))
-                src_tokens, src_lengths = remake_batches(new_src_tokens_list, src_tokens, args, task, max_positions)
-                #print(src_tokens)
-                #print(task.source_dictionary.string(src_tokens))
-                #print('finish delete\n\n')
-
-                # predict insert
-                insert, insert_mask = models[0].forward_insert(src_tokens)
-                insert= torch.argmax(insert, dim=-1)
-                insert = (insert*(~insert_mask))
-                #print(insert)
-                # edit src_tokens
-                insert_list = insert.tolist()
-                src_tokens_list = src_tokens.tolist()
-                new_src_tokens_list = []
-                for idx, line_insert in enumerate(insert_list):
-                    temp = []
-                    for jdx, token_insert in enumerate(line_insert):
-                        if token_insert != 0:
-                            temp.append(token_insert)
-                        temp.append(src_tokens_list[idx][jdx])
-                    new_src_tokens_list.append(torch.IntTensor(temp))
-                src_tokens, src_lengths = remake_batches(new_src_tokens_list, src_tokens, args, task, max_positions)
-            #print(src_tokens)
-            #print(task.source_dictionary.string(src_tokens))
-            #print('finish insert\n\n')
-            
+            src_tokens, src_lengths, encoder_out = preeditor.edit(src_tokens)
+
             sample = {
                 'net_input': {
                     'src3_tokens': src_tokens,
@@ -216,7 +168,12 @@ def main(args):
                 },
             }
 
-            translations = task.inference_step(generator, models, sample)
+            if len(models) == 1 and encoder_out is not None:
+                # reuse the encoder pass of the pre-editing
+                with torch.no_grad():
+                    translations = generator.generate(models, sample, encoder_outs=[encoder_out])
+            else:
+                translations = task.inference_step(generator, models, sample)
             for i, (id, hypos) in enumerate(zip(batch.ids.tolist(), translations)):
                 src_tokens_i = utils.strip_pad(src_tokens[i], tgt_dict.pad())
                 results.append((start_id + id, src_tokens_i, hypos))
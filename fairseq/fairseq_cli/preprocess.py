@@ -41,6 +41,9 @@ def main(args):
 
     task = tasks.get_task(args.task)
 
+    assert not args.derive_edit_labels or args.withref_suffix, \
+        "--derive-edit-labels requires --withref-suffix"
+
     def train_path(lang):
         return "{}{}".format(args.trainpref, ("." + lang) if lang else "")
 
@@ -147,7 +150,7 @@ def main(args):
         merge_result(
             Binarizer.binarize(
                 input_file, vocab, lambda t: ds.add_item(t),
-                offset=0, end=offsets[1]
+                offset=0, end=offsets[1], duplicate=not args.virtual_duplication,
             )
         )
         if num_workers > 1:
@@ -172,49 +175,73 @@ def main(args):
             )
         )
 
-    def make_binary_dataset_noise(vocab, input_prefix, output_prefix, lang):
+    def make_binary_dataset_noise(vocab, input_prefix, output_prefix, lang, num_workers):
         logger.info("[{}] Dictionary: {} types".format(lang, len(vocab) - 1))
         n_seq_tok = [0, 0]
         replaced = Counter()
+        inserted = Counter()
 
         def merge_result(worker_result):
             replaced.update(worker_result["replaced"])
+            inserted.update(worker_result["inserted"])
             n_seq_tok[0] += worker_result["nseq"]
             n_seq_tok[1] += worker_result["ntok"]
 
-        input_file_noise = input_prefix + ".tag.noise.zh"
-        input_file_pos = input_prefix + ".tag.noise.zh.pos"
-        input_file = input_prefix + ".zh"
-        offsets = Binarizer.find_offsets(input_file, 1)
+        input_file = "{}.{}".format(input_prefix, lang)
+        if args.withref_suffix:
+            # the edit labels are computed from the noisy source
+            aligned_files = ["{}.{}".format(input_prefix, args.withref_suffix)]
+        else:
+            aligned_files = [input_prefix + ".tag.noise.zh", input_prefix + ".tag.noise.zh.pos"]
+        offsets = list(zip(*Binarizer.find_aligned_offsets(
+            input_file, aligned_files, num_workers
+        )))
 
-        ds_src1 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'src1', "bin"),
-                                          impl=args.dataset_impl, vocab_size=len(vocab))
-        ds_ref1 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'ref1', "bin"),
-                                          impl=args.dataset_impl, vocab_size=2)
-        ds_src2 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'src2', "bin"),
-                                          impl=args.dataset_impl, vocab_size=len(vocab))         
-        ds_ref2 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'ref2', "bin"),
-                                          impl=args.dataset_impl, vocab_size=len(vocab)) 
-        ds_src3 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'src3', "bin"),
-                                            impl=args.dataset_impl, vocab_size=len(vocab)) 
+        pool = None
+        if num_workers > 1:
+            pool = Pool(processes=num_workers - 1)
+            for worker_id in range(1, num_workers):
+                prefix = "{}{}".format(output_prefix, worker_id)
+                pool.apply_async(
+                    binarize_noise,
+                    (
+                        args,
+                        input_file,
+                        aligned_files,
+                        vocab,
+                        prefix,
+                        offsets[worker_id],
+                        offsets[worker_id + 1][0],
+                    ),
+                    callback=merge_result
+                )
+            pool.close()
+
+        ds = indexed_dataset.make_noise_builder(
+            dataset_dest_prefix(args, output_prefix, None),
+            impl=args.dataset_impl, vocab_size=len(vocab), streams=noise_streams(args),
+        )
         merge_result(
-            Binarizer.binarize_noise(
-                input_file, input_file_noise, 
-                input_file_pos, vocab, 
-                lambda t: ds_src1.add_item(t),
-                lambda t: ds_ref1.add_item(t),
-                lambda t: ds_src2.add_item(t),
-                lambda t: ds_ref2.add_item(t),
-                lambda t: ds_src3.add_item(t),
-                offset=0, end=offsets[1]
+            binarize_noise_streams(
+                args, input_file, aligned_files, vocab, ds.consumers(),
+                offsets[0], offsets[1][0],
             )
         )
+        if num_workers > 1:
+            pool.join()
+            for worker_id in range(1, num_workers):
+                prefix = "{}{}".format(output_prefix, worker_id)
+                temp_file_path = dataset_dest_prefix(args, prefix, None)
+                ds.merge_file_(temp_file_path)
+                ds.remove(temp_file_path)
+
+        ds.finalize()
 
-        ds_src1.finalize(dataset_dest_file(args, output_prefix, 'src1', "idx"))
-        ds_ref1.finalize(dataset_dest_file(args, output_prefix, 'ref1', "idx"))
-        ds_src2.finalize(dataset_dest_file(args, output_prefix, 'src2', "idx"))
-        ds_ref2.finalize(dataset_dest_file(args, output_prefix, 'ref2', "idx"))
-        ds_src3.finalize(dataset_dest_file(args, output_prefix, 'src3', "idx"))
+        if output_prefix == "train" and not args.derive_edit_labels:
+            write_insert_shortlist(
+                inserted, vocab, os.path.join(args.destdir, "insert_shortlist.txt"),
+                args.insert_shortlist_size,
+            )
 
         logger.info(
             "[{}] {}: {} sents, {} tokens, {:.3}% replaced by {}".format(
@@ -290,8 +317,10 @@ def main(args):
             )
             shutil.copyfile(file_name(input_prefix, lang), output_text_file)
         else:
-            if lang == 'zh':
-                make_binary_dataset_noise(vocab, input_prefix, output_prefix, lang)
+            if args.withref_suffix and lang == args.source_lang:
+                make_binary_dataset_noise(vocab, input_prefix, output_prefix, lang, num_workers)
+            elif lang == 'zh' and not args.clean_source:
+                make_binary_dataset_noise(vocab, input_prefix, output_prefix, lang, num_workers)
             else:
                 make_binary_dataset(vocab, input_prefix, output_prefix, lang, num_workers)
 
@@ -374,11 +403,62 @@ def binarize(args, filename, vocab, output_prefix, lang, offset, end, append_eos
         ds.add_item(tensor)
 
     res = Binarizer.binarize(filename, vocab, consumer, append_eos=append_eos,
-                             offset=offset, end=end)
+                             offset=offset, end=end,
+                             duplicate=not args.virtual_duplication)
     ds.finalize(dataset_dest_file(args, output_prefix, lang, "idx"))
     return res
 
 
+def noise_streams(args):
+    """Streams written by :func:`binarize_noise_streams`, ``None`` for all."""
+    return indexed_dataset.PAIR_STREAMS if args.derive_edit_labels else None
+
+
+def binarize_noise(args, filename, aligned_filenames, vocab, output_prefix, offsets, end):
+    ds = indexed_dataset.make_noise_builder(
+        dataset_dest_prefix(args, output_prefix, None),
+        impl=args.dataset_impl, vocab_size=len(vocab), streams=noise_streams(args),
+    )
+    res = binarize_noise_streams(
+        args, filename, aligned_filenames, vocab, ds.consumers(), offsets, end,
+    )
+    ds.finalize()
+    return res
+
+
+def binarize_noise_streams(args, filename, aligned_filenames, vocab, consumers, offsets, end):
+    """Binarize the noise streams of the clean source *filename*, from the
+    noisy source with ``--withref-suffix`` and from the noisy source and
+    the pos file otherwise. *offsets* are those of *filename* followed by
+    those of *aligned_filenames*."""
+    if args.withref_suffix:
+        filename_noise, = aligned_filenames
+        offset, noise_offset = offsets
+        return Binarizer.binarize_withref(
+            filename, filename_noise, vocab,
+            *consumers,
+            offset=offset, end=end, noise_offset=noise_offset,
+            duplicate=not args.virtual_duplication,
+            labels=not args.derive_edit_labels,
+        )
+
+    filename_noise, filename_pos = aligned_filenames
+    offset, noise_offset, pos_offset = offsets
+    return Binarizer.binarize_noise(
+        filename, filename_noise, filename_pos, vocab,
+        *consumers,
+        offset=offset, end=end, noise_offset=noise_offset, pos_offset=pos_offset,
+        duplicate=not args.virtual_duplication,
+    )
+
+
+def write_insert_shortlist(inserted, vocab, path, size=0):
+    """Write the most frequent insertion labels in the format of dict.txt."""
+    with open(path, "w", encoding="utf-8") as f:
+        for idx, count in inserted.most_common(size or None):
+            print("{} {}".format(vocab[idx], count), file=f)
+
+
 def binarize_alignments(args, filename, parse_alignment, output_prefix, offset, end):
     ds = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, None, "bin"),
                                       impl=args.dataset_impl, vocab_size=None)
@@ -15,7 +15,7 @@ import os
 import shutil
 import sys
 
-from fairseq import options, tasks, utils
+from fairseq import binarizer, options, tasks, utils
 from fairseq.data import indexed_dataset
 from fairseq.binarizer_ende import Binarizer
 
@@ -41,6 +41,12 @@ def main(args):
 
     task = tasks.get_task(args.task)
 
+    # the noise streams are always read from the .tag.noise and .pos files
+    assert not args.withref_suffix, \
+        "--withref-suffix is only supported by fairseq_cli/preprocess.py"
+    assert not args.derive_edit_labels, \
+        "--derive-edit-labels is only supported by fairseq_cli/preprocess.py"
+
     def train_path(lang):
         return "{}{}".format(args.trainpref, ("." + lang) if lang else "")
 
@@ -147,7 +153,7 @@ def main(args):
         merge_result(
             Binarizer.binarize(
                 input_file, vocab, lambda t: ds.add_item(t),
-                offset=0, end=offsets[1]
+                offset=0, end=offsets[1], duplicate=not args.virtual_duplication,
             )
         )
         if num_workers > 1:
@@ -172,49 +178,75 @@ def main(args):
             )
         )
 
-    def make_binary_dataset_noise(vocab, input_prefix, output_prefix, lang):
+    def make_binary_dataset_noise(vocab, input_prefix, output_prefix, lang, num_workers):
         logger.info("[{}] Dictionary: {} types".format(lang, len(vocab) - 1))
         n_seq_tok = [0, 0]
         replaced = Counter()
+        inserted = Counter()
 
         def merge_result(worker_result):
             replaced.update(worker_result["replaced"])
+            inserted.update(worker_result["inserted"])
             n_seq_tok[0] += worker_result["nseq"]
             n_seq_tok[1] += worker_result["ntok"]
 
         input_file_noise = input_prefix + ".tag.noise.en"
         input_file_pos = input_prefix + ".tag.noise.en.pos"
         input_file = input_prefix + ".en"
-        offsets = Binarizer.find_offsets(input_file, 1)
+        offsets, noise_offsets, pos_offsets = binarizer.Binarizer.find_aligned_offsets(
+            input_file, [input_file_noise, input_file_pos], num_workers
+        )
 
-        ds_src1 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'src1', "bin"),
-                                          impl=args.dataset_impl, vocab_size=len(vocab))
-        ds_ref1 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'ref1', "bin"),
-                                          impl=args.dataset_impl, vocab_size=2)
-        ds_src2 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'src2', "bin"),
-                                          impl=args.dataset_impl, vocab_size=len(vocab))         
-        ds_ref2 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'ref2', "bin"),
-                                          impl=args.dataset_impl, vocab_size=len(vocab)) 
-        ds_src3 = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, 'src3', "bin"),
-                                            impl=args.dataset_impl, vocab_size=len(vocab)) 
+        pool = None
+        if num_workers > 1:
+            pool = Pool(processes=num_workers - 1)
+            for worker_id in range(1, num_workers):
+                prefix = "{}{}".format(output_prefix, worker_id)
+                pool.apply_async(
+                    binarize_noise,
+                    (
+                        args,
+                        input_file,
+                        input_file_noise,
+                        input_file_pos,
+                        vocab,
+                        prefix,
+                        (offsets[worker_id], noise_offsets[worker_id], pos_offsets[worker_id]),
+                        offsets[worker_id + 1],
+                    ),
+                    callback=merge_result
+                )
+            pool.close()
+
+        ds = indexed_dataset.make_noise_builder(
+            dataset_dest_prefix(args, output_prefix, None),
+            impl=args.dataset_impl, vocab_size=len(vocab),
+        )
         merge_result(
             Binarizer.binarize_noise(
-                input_file, input_file_noise, 
-                input_file_pos, vocab, 
-                lambda t: ds_src1.add_item(t),
-                lambda t: ds_ref1.add_item(t),
-                lambda t: ds_src2.add_item(t),
-                lambda t: ds_ref2.add_item(t),
-                lambda t: ds_src3.add_item(t),
-                offset=0, end=offsets[1]
+                input_file, input_file_noise,
+                input_file_pos, vocab,
+                *ds.consumers(),
+                offset=0, end=offsets[1],
+                noise_offset=0, pos_offset=0,
+                duplicate=not args.virtual_duplication,
             )
         )
+        if num_workers > 1:
+            pool.join()
+            for worker_id in range(1, num_workers):
+                prefix = "{}{}".format(output_prefix, worker_id)
+                temp_file_path = dataset_dest_prefix(args, prefix, None)
+                ds.merge_file_(temp_file_path)
+                ds.remove(temp_file_path)
+
+        ds.finalize()
 
-        ds_src1.finalize(dataset_dest_file(args, output_prefix, 'src1', "idx"))
-        ds_ref1.finalize(dataset_dest_file(args, output_prefix, 'ref1', "idx"))
-        ds_src2.finalize(dataset_dest_file(args, output_prefix, 'src2', "idx"))
-        ds_ref2.finalize(dataset_dest_file(args, output_prefix, 'ref2', "idx"))
-        ds_src3.finalize(dataset_dest_file(args, output_prefix, 'src3', "idx"))
+        if output_prefix == "train":
+            write_insert_shortlist(
+                inserted, vocab, os.path.join(args.destdir, "insert_shortlist.txt"),
+                args.insert_shortlist_size,
+            )
 
         logger.info(
             "[{}] {}: {} sents, {} tokens, {:.3}% replaced by {}".format(
@@ -290,8 +322,8 @@ def main(args):
             )
             shutil.copyfile(file_name(input_prefix, lang), output_text_file)
         else:
-            if lang == 'en':
-                make_binary_dataset_noise(vocab, input_prefix, output_prefix, lang)
+            if lang == 'en' and not args.clean_source:
+                make_binary_dataset_noise(vocab, input_prefix, output_prefix, lang, num_workers)
             else:
                 make_binary_dataset(vocab, input_prefix, output_prefix, lang, num_workers)
 
@@ -374,11 +406,36 @@ def binarize(args, filename, vocab, output_prefix, lang, offset, end, append_eos
         ds.add_item(tensor)
 
     res = Binarizer.binarize(filename, vocab, consumer, append_eos=append_eos,
-                             offset=offset, end=end)
+                             offset=offset, end=end,
+                             duplicate=not args.virtual_duplication)
     ds.finalize(dataset_dest_file(args, output_prefix, lang, "idx"))
     return res
 
 
+def binarize_noise(args, filename, filename_noise, filename_pos, vocab, output_prefix, offsets, end):
+    offset, noise_offset, pos_offset = offsets
+    ds = indexed_dataset.make_noise_builder(
+        dataset_dest_prefix(args, output_prefix, None),
+        impl=args.dataset_impl, vocab_size=len(vocab),
+    )
+
+    res = Binarizer.binarize_noise(
+        filename, filename_noise, filename_pos, vocab,
+        *ds.consumers(),
+        offset=offset, end=end, noise_offset=noise_offset, pos_offset=pos_offset,
+        duplicate=not args.virtual_duplication,
+    )
+    ds.finalize()
+    return res
+
+
+def write_insert_shortlist(inserted, vocab, path, size=0):
+    """Write the most frequent insertion labels in the format of dict.txt."""
+    with open(path, "w", encoding="utf-8") as f:
+        for idx, count in inserted.most_common(size or None):
+            print("{} {}".format(vocab[idx], count), file=f)
+
+
 def binarize_alignments(args, filename, parse_alignment, output_prefix, offset, end):
     ds = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, None, "bin"),
                                       impl=args.dataset_impl, vocab_size=None)
@@ -260,6 +260,9 @@ def validate(args, trainer, task, epoch_itr, subsets):
             num_shards=args.distributed_world_size,
             shard_id=args.distributed_rank,
             num_workers=args.num_workers,
+            buffer_size=args.prefetch_batches,
+            cuda=trainer.cuda,
+            pin_memory=trainer.cuda and args.pin_memory,
         ).next_epoch_itr(shuffle=False)
         progress = progress_bar.progress_bar(
             itr,
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Benchmark the edit script implementations of :mod:`fairseq.edit_distance`
+against the quadratic dynamic programming of ``generate_data_withref/edit.py``
+and check that they agree, on aligned noisy/clean files or on random pairs.
+"""
+
+import argparse
+import random
+import time
+
+from fairseq import edit_distance
+
+
+def random_pairs(num_pairs, length, noise_rate, vocab_size, seed):
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(num_pairs):
+        clean = [rng.randrange(vocab_size) for _ in range(rng.randint(1, 2 * length))]
+        noisy = []
+        for token in clean:
+            r = rng.random()
+            if r < noise_rate / 3:
+                continue  # dropped
+            elif r < 2 * noise_rate / 3:
+                noisy.append(rng.randrange(vocab_size))  # replaced
+            elif r < noise_rate:
+                noisy.extend([token, token])  # repeated
+            else:
+                noisy.append(token)
+        pairs.append((noisy, clean))
+    return pairs
+
+
+def timeit(name, fn, num_pairs):
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    print('| {:<16} {:8.3f}s {:10.0f} pairs/s'.format(name, elapsed, num_pairs / elapsed))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--noisy', help='noisy file, aligned with --clean')
+    parser.add_argument('--clean', help='clean file, aligned with --noisy')
+    parser.add_argument('--num-pairs', type=int, default=10000)
+    parser.add_argument('--length', type=int, default=30,
+                        help='average length of the random clean sentences')
+    parser.add_argument('--noise-rate', type=float, default=0.1)
+    parser.add_argument('--vocab-size', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.noisy and args.clean:
+        with open(args.noisy, encoding='utf-8') as noisy, \
+                open(args.clean, encoding='utf-8') as clean:
+            pairs = [
+                (n.split(), c.split())
+                for n, c, _ in zip(noisy, clean, range(args.num_pairs))
+            ]
+    else:
+        pairs = random_pairs(
+            args.num_pairs, args.length, args.noise_rate, args.vocab_size, args.seed,
+        )
+    xs = [x for x, _ in pairs]
+    ys = [y for _, y in pairs]
+    print('| {} pairs, {:.1f} clean tokens per pair'.format(
+        len(pairs), sum(len(y) for y in ys) / max(len(ys), 1),
+    ))
+
+    expected = timeit(
+        'dp (edit.py)', lambda: [edit_distance.edit_ops_dp(x, y) for x, y in pairs],
+        len(pairs),
+    )
+    results = {
+        'bit-parallel': timeit(
+            'bit-parallel', lambda: edit_distance.batch_edit_ops(xs, ys, use_libnat=False),
+            len(pairs),
+        ),
+    }
+    if edit_distance._load_libnat() is not None:
+        results['libnat'] = timeit(
+            'libnat', lambda: edit_distance.batch_edit_ops(xs, ys), len(pairs),
+        )
+    else:
+        print('| libnat is not built, run `python setup.py build_ext --inplace`')
+
+    lines = [(' '.join(map(str, x)), ' '.join(map(str, y))) for x, y in pairs]
+    results['formatted'] = timeit(
+        'formatted x{}'.format(args.workers),
+        lambda: list(edit_distance.imap_edit_steps(lines, args.workers, chunk_size=1000)),
+        len(pairs),
+    )
+    expected_steps = [
+        edit_distance.format_steps(ops, x.split(), y.split())
+        for ops, (x, y) in zip(expected, lines)
+    ]
+
+    for name, out in results.items():
+        ok = out == (expected_steps if name == 'formatted' else expected)
+        print('| {}: {}'.format(name, 'same edits' if ok else 'DIFFERENT EDITS'))
+
+
+if __name__ == '__main__':
+    main()
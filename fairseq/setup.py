@@ -150,6 +150,7 @@ setup(
         'console_scripts': [
             'fairseq-eval-lm = fairseq_cli.eval_lm:cli_main',
             'fairseq-generate = fairseq_cli.generate:cli_main',
+            'fairseq-generate-noise = fairseq_cli.generate_noise:cli_main',
             'fairseq-interactive = fairseq_cli.interactive:cli_main',
             'fairseq-preprocess = fairseq_cli.preprocess:cli_main',
             'fairseq-score = fairseq_cli.score:cli_main',
@@ -0,0 +1,65 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import tempfile
+import unittest
+
+from fairseq.binarizer import Binarizer, read_chunks
+
+
+class TestFindAlignedOffsets(unittest.TestCase):
+
+    def setUp(self):
+        # a clean file and its noise and pos files, with lines of different
+        # (multi-byte) lengths in each
+        self.files = {
+            'clean': ['我们 明天 见', '你好', '今天 天气 很 好 ， 我们 去 公园 吧', '谢谢', '好的 。'],
+            'noise': [
+                '<DropPro-[我们]> 明天 见', '你好', '今天 天气 很 好 <DropPunc-[，]> 我们 去 公园 吧',
+                '<Wrong-[谢]-[射]-[0]> 谢', '好的 。',
+            ],
+            'pos': ['0', '', '4', '0', ''],
+        }
+
+    def _read_chunk(self, path, offset, end):
+        with open(path, 'r', encoding='utf-8') as f:
+            f.seek(offset)
+            return [line for chunk in read_chunks(f, end) for line in chunk]
+
+    def test_find_aligned_offsets(self):
+        with tempfile.TemporaryDirectory('test_find_aligned_offsets') as dirname:
+            paths = []
+            for name, lines in self.files.items():
+                paths.append(os.path.join(dirname, name))
+                with open(paths[-1], 'w', encoding='utf-8') as f:
+                    f.writelines(line + '\n' for line in lines)
+
+            # more chunks than lines leaves some of them empty
+            for num_chunks in [1, 2, 3, 8]:
+                all_offsets = Binarizer.find_aligned_offsets(paths[0], paths[1:], num_chunks)
+                self.assertEqual(len(all_offsets), len(paths))
+                chunks = [
+                    [
+                        self._read_chunk(path, offsets[i], offsets[i + 1])
+                        for i in range(num_chunks)
+                    ]
+                    for path, offsets in zip(paths, all_offsets)
+                ]
+                for path, lines, path_chunks in zip(paths, self.files.values(), chunks):
+                    # every line is read once, by a single worker
+                    self.assertEqual(
+                        [line.rstrip('\n') for chunk in path_chunks for line in chunk], lines,
+                    )
+                # and the workers read the same lines of every file
+                for path_chunks in chunks[1:]:
+                    self.assertEqual(
+                        [len(chunk) for chunk in path_chunks],
+                        [len(chunk) for chunk in chunks[0]],
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,10 +3,12 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+from collections import Counter
 import io
 import tempfile
 import unittest
 
+import numpy as np
 import torch
 
 from fairseq.data import Dictionary
@@ -66,6 +68,29 @@ class TestDictionary(unittest.TestCase):
             assertMatch(reload_ids, ref_ids2)
             assertMatch(finalized_ids, reload_ids)
 
+    def test_encode_lines(self):
+        d = Dictionary()
+        for line in ['A B C D', 'B C D']:
+            d.encode_line(line, add_if_not_exist=True)
+        txt = ['A B C', '', 'D E <unk> A', 'C']
+
+        for append_eos in [True, False]:
+            for reverse_order in [True, False]:
+                replaced = Counter()
+                ids, offsets = d.encode_lines(
+                    txt, append_eos=append_eos, reverse_order=reverse_order,
+                    replaced=replaced,
+                )
+                self.assertEqual(ids.dtype, np.int32)
+                self.assertEqual(len(offsets), len(txt) + 1)
+                self.assertEqual(replaced, Counter(['E']))
+                for line, toks in zip(txt, d.split_encoded_lines(ids, offsets)):
+                    ref_toks = d.encode_line(
+                        line, add_if_not_exist=False, append_eos=append_eos,
+                        reverse_order=reverse_order,
+                    )
+                    self.assertEqual(toks.tolist(), ref_toks.tolist())
+
     def test_overwrite(self):
         # for example, Camembert overwrites <unk>, <s> and </s>
         dict_file = io.StringIO(
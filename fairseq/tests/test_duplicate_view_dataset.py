@@ -0,0 +1,75 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import numpy as np
+import torch
+from fairseq.data import DuplicateViewDataset, LanguagePairDataset
+from tests.test_train import mock_dict
+
+
+class TestDuplicateViewDataset(unittest.TestCase):
+    def setUp(self):
+        d = mock_dict()
+        src1 = [torch.LongTensor([4, 5, 2]), torch.LongTensor([6, 2])]
+        ref1 = [torch.LongTensor([1, 0, 0]), torch.LongTensor([0, 0])]
+        src2 = [torch.LongTensor([5, 2]), torch.LongTensor([6, 2])]
+        ref2 = [torch.LongTensor([7, 0]), torch.LongTensor([0, 0])]
+        src3 = [torch.LongTensor([7, 5, 2]), torch.LongTensor([6, 2])]
+        ref3 = [torch.LongTensor([8, 9, 2]), torch.LongTensor([9, 2])]
+        sizes = [len(t) for t in src1]
+        self.dataset = LanguagePairDataset(
+            src1, sizes, d, ref1, sizes, d, src2, src3, ref2, ref3, shuffle=False,
+        )
+
+    def test_views(self):
+        ds = DuplicateViewDataset(self.dataset, shuffle=False)
+        self.assertEqual(len(ds), 4)
+        for i in range(len(ds)):
+            example = ds[i]
+            original = self.dataset[i // 2]
+            self.assertEqual(example['id'], i)
+            self.assertTrue(torch.equal(example['src1'], original['src1']))
+            self.assertTrue(torch.equal(example['ref3'], original['ref3']))
+            expected_src3 = original['src1'] if i % 2 == 1 else original['src3']
+            self.assertTrue(torch.equal(example['src3'], expected_src3))
+
+    def test_sizes(self):
+        ds = DuplicateViewDataset(self.dataset, shuffle=False)
+        self.assertEqual(ds.sizes.tolist(), [3, 3, 2, 2])
+        self.assertEqual(ds.num_tokens(1), self.dataset.num_tokens(0))
+        self.assertEqual(sorted(ds.ordered_indices().tolist()), [0, 1, 2, 3])
+        self.assertEqual(ds.ordered_indices().tolist()[:2], [2, 3])
+
+    def test_view_costs(self):
+        d = mock_dict()
+        src1 = [torch.LongTensor([4, 5, 2]), torch.LongTensor([6, 2])]
+        src2 = [torch.LongTensor([5, 2]), torch.LongTensor([6, 2])]
+        src3 = [torch.LongTensor([7, 8, 5, 2]), torch.LongTensor([6, 2])]
+        ref3 = [torch.LongTensor([8, 9, 2]), torch.LongTensor([9, 2])]
+        dataset = LanguagePairDataset(
+            src1, [len(t) for t in src1], d, None, [len(t) for t in ref3], d,
+            src3=src3, ref3=ref3, shuffle=False,
+            src2_sizes=[len(t) for t in src2], src3_sizes=[len(t) for t in src3],
+            token_cost='sum',
+        )
+        ds = DuplicateViewDataset(dataset)
+        # the odd views have src1 as src3
+        self.assertEqual([ds.num_tokens(i) for i in range(len(ds))], [12, 11, 8, 8])
+        self.assertEqual([ds.size(i) for i in range(len(ds))], [(4, 3), (3, 3), (2, 2), (2, 2)])
+        kept, ignored = ds.filter_indices_by_size(np.arange(len(ds)), (3, 3))
+        self.assertEqual(kept.tolist(), [1, 2, 3])
+        self.assertEqual(ignored, [0])
+
+    def test_shuffle(self):
+        self.assertFalse(DuplicateViewDataset(self.dataset).shuffle)
+        self.dataset.shuffle = True
+        self.assertTrue(DuplicateViewDataset(self.dataset).shuffle)
+        self.assertFalse(DuplicateViewDataset(self.dataset, shuffle=False).shuffle)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import random
+import tempfile
+import unittest
+
+from fairseq import edit_distance
+from fairseq.binarizer import Binarizer
+from fairseq.data import Dictionary
+from fairseq.edit_distance import DELETE, INSERT, KEEP, SUBSTITUTE
+
+
+class TestEditDistance(unittest.TestCase):
+
+    def _random_pairs(self, num_pairs, max_len, vocab_size, seed=1):
+        rng = random.Random(seed)
+        return [
+            (
+                [rng.randrange(vocab_size) for _ in range(rng.randint(0, max_len))],
+                [rng.randrange(vocab_size) for _ in range(rng.randint(0, max_len))],
+            )
+            for _ in range(num_pairs)
+        ]
+
+    def test_edit_ops(self):
+        x = 'the the cat sit on mat'.split()
+        y = 'the cat sat on the mat'.split()
+        self.assertEqual(
+            edit_distance.edit_ops(x, y),
+            [DELETE, KEEP, KEEP, SUBSTITUTE, KEEP, INSERT, KEEP],
+        )
+        self.assertEqual(edit_distance.edit_ops([], ['a', 'b']), [INSERT, INSERT])
+        self.assertEqual(edit_distance.edit_ops(['a', 'b'], []), [DELETE, DELETE])
+        self.assertEqual(edit_distance.edit_ops([], []), [])
+
+    def test_edit_ops_matches_dp(self):
+        for vocab_size in [2, 5, 100]:
+            for x, y in self._random_pairs(500, 12, vocab_size):
+                self.assertEqual(
+                    edit_distance.edit_ops(x, y), edit_distance.edit_ops_dp(x, y),
+                )
+
+    def test_long_sentences(self):
+        # more than 255 edits, which overflowed the uint8 matrix of edit.py
+        x, y = self._random_pairs(1, 400, 1000)[0]
+        x, y = x + list(range(300)), y + list(range(1000, 1300))
+        self.assertEqual(edit_distance.edit_ops(x, y), edit_distance.edit_ops_dp(x, y))
+
+    def test_batch_edit_ops(self):
+        pairs = self._random_pairs(50, 20, 5)
+        xs = [[str(t) for t in x] for x, _ in pairs]
+        ys = [[str(t) for t in y] for _, y in pairs]
+        expected = [edit_distance.edit_ops_dp(x, y) for x, y in zip(xs, ys)]
+        for use_libnat in [False, True]:
+            self.assertEqual(
+                [list(ops) for ops in edit_distance.batch_edit_ops(xs, ys, use_libnat)],
+                expected,
+            )
+
+    def test_edit_labels(self):
+        x = 'the the cat sit on mat </s>'.split()
+        y = 'the cat sat on the mat </s>'.split()
+        ref1, src2, ref2 = edit_distance.edit_labels(edit_distance.edit_ops(x, y), x, y)
+        self.assertEqual(ref1, [1, 0, 0, 1, 0, 0, 0])
+        self.assertEqual(src2, ['the', 'cat', 'on', 'mat', '</s>'])
+        self.assertEqual(ref2, [0, 0, 'sat', 'the', 0])
+
+    def test_binarize_withref(self):
+        d = Dictionary()
+        for word in 'the cat sat sit on mat'.split():
+            d.add_symbol(word)
+        clean = ['the cat sat on the mat', 'the cat']
+        noisy = ['the the cat sit on mat', 'the cat']
+        with tempfile.TemporaryDirectory('test_binarize_withref') as dirname:
+            paths = []
+            for name, lines in [('clean', clean), ('noisy', noisy)]:
+                paths.append(os.path.join(dirname, name))
+                with open(paths[-1], 'w', encoding='utf-8') as f:
+                    f.writelines(line + '\n' for line in lines)
+            streams = [[] for _ in range(5)]
+            res = Binarizer.binarize_withref(
+                *paths, d, *[s.append for s in streams], duplicate=False,
+            )
+            # the noisy input repeat is counted as written
+            res_duplicate = Binarizer.binarize_withref(
+                *paths, d, *[lambda t: None] * 5, duplicate=True,
+            )
+        self.assertEqual(res['nseq'], 2)
+        src1, ref1, src2, ref2, src3 = [[t.tolist() for t in s] for s in streams]
+        self.assertEqual(res['ntok'], sum(len(t) for t in src1))
+        self.assertEqual(res_duplicate['nseq'], 4)
+        self.assertEqual(res_duplicate['ntok'], 2 * res['ntok'])
+        self.assertEqual(src1, [d.encode_line(line).tolist() for line in noisy])
+        self.assertEqual(src3, [d.encode_line(line).tolist() for line in clean])
+        self.assertEqual(ref1, [[1, 0, 0, 1, 0, 0, 0], [0, 0, 0]])
+        self.assertEqual(src2[0], [d.index(w) for w in 'the cat on mat'.split()] + [d.eos()])
+        self.assertEqual(ref2, [[0, 0, d.index('sat'), d.index('the'), 0], [0, 0, 0]])
+        self.assertEqual(res['inserted'][d.index('sat')], 1)
+
+    def test_format_steps(self):
+        x = 'the the cat sit on mat'.split()
+        y = 'the cat sat on the mat'.split()
+        self.assertEqual(
+            edit_distance.format_steps(edit_distance.edit_ops(x, y), x, y),
+            ['d-the', 'e', 'e', 's-sit||sat', 'e', 'i-the', 'e'],
+        )
+
+    def test_edit_steps_files(self):
+        pairs = self._random_pairs(30, 10, 4)
+        lines = [
+            (' '.join(map(str, x)), ' '.join(map(str, y))) for x, y in pairs
+        ]
+        expected = edit_distance.edit_steps(lines)
+        with tempfile.TemporaryDirectory('test_edit_distance') as dirname:
+            noisy, clean = os.path.join(dirname, 'noisy'), os.path.join(dirname, 'clean')
+            for path, k in [(noisy, 0), (clean, 1)]:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.writelines(line[k] + '\n' for line in lines)
+            for workers in [1, 2]:
+                self.assertEqual(
+                    list(edit_distance.edit_steps_files(noisy, clean, workers, chunk_size=7)),
+                    expected,
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
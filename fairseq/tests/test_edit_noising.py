@@ -0,0 +1,116 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import tempfile
+import unittest
+
+import torch
+from fairseq import options
+from fairseq.data import Dictionary, EditNoisingDataset
+from fairseq.data.edit_noising import SpeechEditNoising, WMTEditNoising
+from fairseq_cli import generate_noise
+
+
+class TestEditNoising(unittest.TestCase):
+    def _get_test_data(self):
+        d = Dictionary()
+        for word in ['the', 'cat', 'sat', 'on', 'mat', 'mo@@', '，', '。', '其实']:
+            d.add_symbol(word)
+        src = [
+            d.encode_line('the cat sat on the mo@@ mat', add_if_not_exist=False),
+            d.encode_line('the cat ， sat 。', add_if_not_exist=False),
+        ]
+        return d, src
+
+    def assert_consistent_views(self, src1, ref1, src2, ref2, src3, eos):
+        self.assertEqual(src1.size(), ref1.size())
+        self.assertEqual(src2.size(), ref2.size())
+        self.assertTrue(torch.equal(src1[ref1.eq(0)], src2))
+        self.assertEqual(src1[-1], eos)
+        self.assertEqual(src2[-1], eos)
+        # every clean token is kept or restored by an insertion
+        self.assertLessEqual(src3.numel(), src2.numel() + ref2.ne(0).sum())
+
+    def test_wmt_noising(self):
+        d, src = self._get_test_data()
+        noiser = WMTEditNoising(d, delete_prob=0.3, insert_prob=0.3)
+        ds = EditNoisingDataset(src, noiser, seed=1)
+        for epoch in range(1, 4):
+            ds.set_epoch(epoch)
+            for i in range(len(ds)):
+                src1, ref1, src2, ref2, src3 = ds[i]
+                self.assertTrue(torch.equal(src3, src[i]))
+                self.assert_consistent_views(src1, ref1, src2, ref2, src3, d.eos())
+
+    def test_speech_noising(self):
+        d, src = self._get_test_data()
+        noiser = SpeechEditNoising(d, punc_prob=1.0, drop_punc_prob=0.0, spoken_prob=0.0)
+        src1, ref1, src2, ref2 = noiser.noising(src[1])
+        comma, period = d.index('，'), d.index('。')
+        # punctuations are swapped and restored by insertions
+        self.assertEqual(src1.tolist().count(comma), 1)
+        self.assertEqual(ref1.sum().item(), 2)
+        self.assertEqual(sorted(ref2[ref2.ne(0)].tolist()), sorted([comma, period]))
+        self.assert_consistent_views(src1, ref1, src2, ref2, src[1], d.eos())
+
+    def test_seeding(self):
+        d, src = self._get_test_data()
+        noiser = WMTEditNoising(d, delete_prob=0.3, insert_prob=0.3)
+        ds = EditNoisingDataset(src, noiser, seed=1)
+        first = [t.tolist() for t in ds[0]]
+        self.assertEqual(first, [t.tolist() for t in ds[0]])
+
+    def test_annotations(self):
+        d, src = self._get_test_data()
+        noiser = SpeechEditNoising(d, punc_prob=1.0, drop_punc_prob=0.0, spoken_prob=0.0)
+        streams, noisy, annotations = noiser.noising_with_annotations(
+            src[1], 'the cat ， sat 。'.split(),
+        )
+        self.assertEqual(noisy, 'the cat 。 sat ，'.split())
+        self.assertEqual(annotations, ['<ReplacePunc-[，|。]>|2', '<ReplacePunc-[。|，]>|4'])
+        for t, expected in zip(streams, noiser.noising(src[1])):
+            self.assertTrue(torch.equal(t, expected))
+
+        noiser = WMTEditNoising(d, delete_prob=0.0, insert_prob=1.0, repeat_prob=1.0)
+        streams, noisy, annotations = noiser.noising_with_annotations(
+            torch.LongTensor([d.index('the'), d.eos()]), ['the'],
+        )
+        self.assertEqual(noisy[0], 'the')
+        self.assertTrue(all(w == 'the' for w in noisy))
+        self.assertEqual(annotations, ['<InsertRepeat-[{}]>|1to{}'.format(
+            '|'.join(noisy[1:]), len(noisy),
+        )])
+
+    def test_generate_noise_workers(self):
+        d, _ = self._get_test_data()
+        with tempfile.TemporaryDirectory() as dirname:
+            d.save(os.path.join(dirname, 'dict.txt'))
+            with open(os.path.join(dirname, 'clean.txt'), 'w', encoding='utf-8') as f:
+                for i in range(50):
+                    print('the cat sat on the mo@@ mat' if i % 2 else 'the cat ， sat 。', file=f)
+
+            outputs = []
+            for workers in [1, 3]:
+                out = os.path.join(dirname, str(workers))
+                parser = options.get_noise_generation_parser()
+                args = parser.parse_args([
+                    '--input', os.path.join(dirname, 'clean.txt'),
+                    '--srcdict', os.path.join(dirname, 'dict.txt'),
+                    '--noise', 'wmt', '--noise-args', '{"delete_prob": 0.2, "insert_prob": 0.2}',
+                    '--output-noise', out + '.noise', '--output-pos', out + '.pos',
+                    '--destdir', out, '-s', 'src', '-t', 'tgt',
+                    '--workers', str(workers), '--chunk-size', '7',
+                ])
+                generate_noise.main(args)
+                with open(out + '.noise') as f_noise, open(out + '.pos') as f_pos:
+                    outputs.append((f_noise.read(), f_pos.read()))
+                self.assertTrue(os.path.exists(os.path.join(out, 'train.src-tgt.src1.bin')))
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertEqual(len(outputs[0][0].splitlines()), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import torch
+from fairseq.models import edit_utils
+
+
+PAD = 1
+
+
+class TestEditUtils(unittest.TestCase):
+
+    def assertTensorEqual(self, t1, t2):
+        self.assertEqual(t1.size(), t2.size(), "size mismatch")
+        self.assertEqual(t1.ne(t2).long().sum(), 0)
+
+    def test_apply_deletions(self):
+        tokens = torch.LongTensor([
+            [1, 1, 4, 5, 2],
+            [6, 7, 8, 9, 2],
+        ])
+        delete = torch.LongTensor([
+            [0, 0, 1, 0, 0],
+            [0, 1, 0, 1, 0],
+        ])
+        out, lengths = edit_utils.apply_deletions(tokens, delete, PAD)
+        self.assertTensorEqual(out, torch.LongTensor([
+            [1, 5, 2],
+            [6, 8, 2],
+        ]))
+        self.assertTensorEqual(lengths, torch.LongTensor([2, 3]))
+
+    def test_apply_insertions(self):
+        tokens = torch.LongTensor([
+            [1, 1, 4, 5, 2],
+            [6, 7, 8, 9, 2],
+        ])
+        insert = torch.LongTensor([
+            [0, 0, 10, 0, 11],
+            [0, 0, 0, 0, 0],
+        ])
+        out, lengths = edit_utils.apply_insertions(tokens, insert, PAD)
+        self.assertTensorEqual(out, torch.LongTensor([
+            [1, 1, 10, 4, 5, 11, 2],
+            [1, 1, 6, 7, 8, 9, 2],
+        ]))
+        self.assertTensorEqual(lengths, torch.LongTensor([5, 5]))
+
+
+if __name__ == '__main__':
+    unittest.main()
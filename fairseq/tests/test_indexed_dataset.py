@@ -0,0 +1,115 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import torch
+from fairseq.data import indexed_dataset
+
+
+class TestIndexedSharedMemoryDataset(unittest.TestCase):
+
+    def _build(self, dirname, items):
+        prefix = os.path.join(dirname, 'train')
+        builder = indexed_dataset.make_builder(
+            indexed_dataset.data_file_path(prefix), impl='lazy',
+        )
+        for item in items:
+            builder.add_item(item)
+        builder.finalize(indexed_dataset.index_file_path(prefix))
+        return prefix
+
+    def test_shared_cache(self):
+        items = [torch.IntTensor([4, 5, 2]), torch.IntTensor([6, 2]), torch.IntTensor([2])]
+        with tempfile.TemporaryDirectory() as dirname:
+            prefix = self._build(dirname, items)
+            cache_dir = os.path.join(dirname, 'shm')
+            os.mkdir(cache_dir)
+
+            ds = indexed_dataset.IndexedSharedMemoryDataset(
+                prefix, fix_lua_indexing=True, cache_dir=cache_dir,
+            )
+            for i, item in enumerate(items):
+                self.assertEqual(ds[i].tolist(), item.tolist())
+            self.assertEqual(self._cached(cache_dir), [os.path.basename(ds.cache_path())])
+
+            # a copy attaches to the same cache
+            other = pickle.loads(pickle.dumps(ds))
+            self.assertIsNone(other._cache)
+            self.assertEqual(other[1].tolist(), [6, 2])
+            self.assertEqual(len(self._cached(cache_dir)), 1)
+
+    def _cached(self, cache_dir):
+        return [name for name in os.listdir(cache_dir) if name.endswith('.bin')]
+
+    def test_stale_cache(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            cache_dir = os.path.join(dirname, 'shm')
+            os.mkdir(cache_dir)
+            prefix = self._build(dirname, [torch.IntTensor([4, 5, 2])])
+            ds = indexed_dataset.IndexedSharedMemoryDataset(prefix, cache_dir=cache_dir)
+            self.assertEqual(ds[0].tolist(), [4, 5, 2])
+
+            # binarizing the data again replaces its copy
+            self._build(dirname, [torch.IntTensor([6, 7, 8, 2])])
+            os.utime(indexed_dataset.data_file_path(prefix), ns=(0, 0))
+            ds = indexed_dataset.IndexedSharedMemoryDataset(prefix, cache_dir=cache_dir)
+            self.assertEqual(ds[0].tolist(), [6, 7, 8, 2])
+            self.assertEqual(self._cached(cache_dir), [os.path.basename(ds.cache_path())])
+
+            indexed_dataset.IndexedSharedMemoryDataset.clear_cache(cache_dir)
+            self.assertEqual(os.listdir(cache_dir), [])
+
+
+class TestEditCounts(unittest.TestCase):
+
+    def _add(self, builder, ref1, ref2):
+        src = torch.IntTensor([4] * len(ref1))
+        streams = [src, torch.IntTensor(ref1), src, torch.IntTensor(ref2), src]
+        for consumer, t in zip(builder.consumers(), streams):
+            consumer(t)
+
+    def test_noise_builder(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            for impl in ['lazy', 'edit']:
+                prefix = os.path.join(dirname, impl)
+                builder = indexed_dataset.make_noise_builder(prefix, impl=impl)
+                self._add(builder, [0, 0, 0], [0, 0, 0])
+                self._add(builder, [1, 0, 0], [0, 5, 0])
+
+                # a worker's chunk
+                builder1 = indexed_dataset.make_noise_builder(prefix + '1', impl=impl)
+                self._add(builder1, [1, 1, 0], [0, 0, 0])
+                builder1.finalize()
+                builder.merge_file_(prefix + '1')
+                builder.remove(prefix + '1')
+                builder.finalize()
+
+                self.assertEqual(indexed_dataset.load_edit_counts(prefix).tolist(), [0, 2, 2])
+                self.assertIsNone(indexed_dataset.load_edit_counts(prefix + '1'))
+
+    def test_pair_streams(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            prefix = os.path.join(dirname, 'train')
+            builder = indexed_dataset.make_noise_builder(
+                prefix, impl='mmap', streams=indexed_dataset.PAIR_STREAMS,
+            )
+            consumers = builder.consumers()
+            self.assertEqual([c is not None for c in consumers], [True, False, False, False, True])
+            consumers[0](torch.IntTensor([4, 5, 2]))
+            consumers[4](torch.IntTensor([5, 2]))
+            builder.finalize()
+
+            self.assertEqual(sorted(os.listdir(dirname)), [
+                'train.src1.bin', 'train.src1.idx', 'train.src3.bin', 'train.src3.idx',
+            ])
+            self.assertIsNone(indexed_dataset.load_edit_counts(prefix))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import torch
+import torch.nn.functional as F
+from fairseq.iterative_preeditor import IterativePreEditor
+from tests.test_train import mock_dict
+
+
+class DeleteTokenModel(object):
+    """Deletes every occurrence of one token, one per call, and never
+    inserts."""
+
+    def __init__(self, token, vocab_size):
+        self.token = token
+        self.vocab_size = vocab_size
+        self.delete_batch_sizes = []
+
+        self.encoder = self
+
+    def forward_delete(self, tokens):
+        self.delete_batch_sizes.append(tokens.size(0))
+        is_token = tokens.eq(self.token)
+        # only the first occurrence of the token in each row
+        delete = is_token & (is_token.long().cumsum(1) == 1)
+        return F.one_hot(delete.long(), 2).float().log(), tokens.eq(1)
+
+    def forward_embedding(self, tokens):
+        embed = F.one_hot(tokens, self.vocab_size).float()
+        return embed, embed
+
+    def extract_features(self, tokens):
+        return self.forward_embedding(tokens)[0], tokens.eq(1)
+
+    def predict_insert(self, features):
+        return features.new_zeros(features.size()[:2]).long()
+
+
+class TestIterativePreEditor(unittest.TestCase):
+
+    def test_active_set_shrinks(self):
+        src_tokens = torch.LongTensor([
+            [1, 1, 4, 6, 2],
+            [1, 5, 4, 6, 2],
+            [5, 5, 4, 6, 2],
+        ])
+        model = DeleteTokenModel(5, vocab_size=8)
+        preeditor = IterativePreEditor(mock_dict(), [model], max_iter=5)
+        tokens, lengths, encoder_out = preeditor.edit(src_tokens)
+
+        self.assertEqual(tokens.tolist(), [[4, 6, 2]] * 3)
+        self.assertEqual(lengths.tolist(), [3, 3, 3])
+        # sentences leave the batch once no edit is predicted for them
+        self.assertEqual(model.delete_batch_sizes, [3, 2, 1])
+        # the encoder output matches the final tokens
+        self.assertEqual(
+            encoder_out.encoder_out.argmax(-1).t().tolist(), tokens.tolist()
+        )
+        self.assertFalse(encoder_out.encoder_padding_mask.any())
+
+    def test_max_iter(self):
+        src_tokens = torch.LongTensor([[5, 5, 4, 2]])
+        model = DeleteTokenModel(5, vocab_size=8)
+        preeditor = IterativePreEditor(mock_dict(), [model], max_iter=1)
+        tokens, lengths, encoder_out = preeditor.edit(src_tokens)
+        self.assertEqual(tokens.tolist(), [[5, 4, 2]])
+        self.assertEqual(encoder_out.encoder_out.argmax(-1).t().tolist(), tokens.tolist())
+        self.assertEqual(lengths.tolist(), [3])
+
+
+if __name__ == '__main__':
+    unittest.main()
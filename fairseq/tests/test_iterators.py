@@ -22,6 +22,55 @@ class TestIterators(unittest.TestCase):
         self.assertEqual(next(itr), 9)
         self.assertFalse(itr.has_next())
 
+    def test_prefetch_iterator(self):
+        x = list(range(10))
+        itr = iterators.CountingIterator(iterators.PrefetchIterator(x, buffer_size=3))
+        self.assertEqual(len(itr), 10)
+        self.assertEqual(next(itr), 0)
+        itr.skip(3)
+        self.assertEqual(next(itr), 4)
+        # items prepared ahead are not counted as consumed
+        self.assertEqual(itr.count, 5)
+        self.assertEqual(list(itr), [5, 6, 7, 8, 9])
+        self.assertFalse(itr.has_next())
+
+    def test_prefetch_iterator_error(self):
+        def gen():
+            yield 0
+            raise ValueError('bad batch')
+
+        itr = iterators.PrefetchIterator(gen(), buffer_size=2)
+        self.assertEqual(next(itr), 0)
+        with self.assertRaises(ValueError):
+            next(itr)
+
+    def test_prefetch_iterator_exhausted(self):
+        itr = iterators.PrefetchIterator([0, 1], buffer_size=2)
+        self.assertEqual(list(itr), [0, 1])
+        self.assertIsNone(itr.thread)
+        # does not wait for the thread again
+        with self.assertRaises(StopIteration):
+            next(itr)
+
+    def test_prefetch_iterator_close(self):
+        produced = []
+
+        def gen():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        itr = iterators.PrefetchIterator(gen(), buffer_size=2)
+        self.assertEqual(next(itr), 0)
+        thread = itr.thread
+        itr.close()
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(itr.queue.empty())
+        # at most the buffered items and the one the thread was putting
+        self.assertLessEqual(len(produced), 4)
+        with self.assertRaises(StopIteration):
+            next(itr)
+
 
 if __name__ == '__main__':
     unittest.main()
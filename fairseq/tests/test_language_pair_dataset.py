@@ -0,0 +1,107 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import torch
+from fairseq.data import data_utils, LanguagePairDataset
+from tests.test_train import mock_dict
+
+
+class TestLanguagePairDataset(unittest.TestCase):
+    def _get_dataset(self, token_cost):
+        d = mock_dict()
+        src1 = [torch.LongTensor([4, 5, 2]), torch.LongTensor([6, 2])]
+        ref1 = [torch.LongTensor([1, 0, 0]), torch.LongTensor([0, 0])]
+        src2 = [torch.LongTensor([5, 2]), torch.LongTensor([6, 2])]
+        ref2 = [torch.LongTensor([7, 0]), torch.LongTensor([0, 0])]
+        src3 = [torch.LongTensor([7, 5, 2]), torch.LongTensor([6, 2])]
+        ref3 = [torch.LongTensor([8, 9, 9, 9, 2]), torch.LongTensor([9, 2])]
+        return LanguagePairDataset(
+            src1, [len(t) for t in src1], d,
+            ref1, [len(t) for t in ref3], d,
+            src2, src3, ref2, ref3,
+            shuffle=False,
+            src2_sizes=[len(t) for t in src2],
+            src3_sizes=[len(t) for t in src3],
+            token_cost=token_cost,
+        )
+
+    def test_max_token_cost(self):
+        ds = self._get_dataset('max')
+        self.assertEqual([ds.num_tokens(i) for i in range(len(ds))], [5, 2])
+        self.assertEqual(ds.size(0), (3, 5))
+
+    def test_sum_token_cost(self):
+        ds = self._get_dataset('sum')
+        self.assertEqual([ds.num_tokens(i) for i in range(len(ds))], [13, 8])
+        self.assertEqual(ds.size(1), (2, 2))
+
+    def test_filter_by_size(self):
+        ds = self._get_dataset('max')
+        indices = ds.ordered_indices()
+        for max_positions in [(3, 5), (3, 4), (2, None), (None, 2), 2]:
+            expected, expected_ignored = data_utils._filter_by_size_dynamic(
+                indices, ds.size, max_positions,
+            )
+            kept, ignored = ds.filter_indices_by_size(indices, max_positions)
+            self.assertEqual(kept.tolist(), expected.tolist())
+            self.assertEqual(ignored, expected_ignored)
+        self.assertEqual(data_utils.filter_by_size(indices, ds, (3, 4)).tolist(), [1])
+        with self.assertRaises(Exception):
+            data_utils.filter_by_size(indices, ds, (3, 4), raise_exception=True)
+
+    def test_collater(self):
+        ds = self._get_dataset('max')
+        samples = [ds[0], ds[1]]
+        batch = ds.collater(samples)
+        pad, eos = ds.src_dict.pad(), ds.src_dict.eos()
+
+        # sorted by descending src3 length
+        self.assertEqual(batch['id'].tolist(), [0, 1])
+        for key, tokens in [
+            ('src1', batch['net_input']['src1_tokens']),
+            ('src2', batch['net_input']['src2_tokens']),
+            ('src3', batch['net_input']['src3_tokens']),
+            ('ref1', batch['ref1']),
+            ('ref2', batch['ref2']),
+        ]:
+            expected = data_utils.collate_tokens([s[key] for s in samples], pad, left_pad=True)
+            self.assertTrue(torch.equal(tokens, expected))
+            self.assertTrue(tokens.is_contiguous())
+        expected = data_utils.collate_tokens([s['ref3'] for s in samples], pad)
+        self.assertTrue(torch.equal(batch['target'], expected))
+        expected = data_utils.collate_tokens(
+            [s['ref3'] for s in samples], pad, eos, move_eos_to_beginning=True,
+        )
+        self.assertTrue(torch.equal(batch['net_input']['prev_output_tokens'], expected))
+        self.assertEqual(batch['net_input']['src3_is_src1'].tolist(), [False, True])
+
+    def test_collater_derives_edit_labels(self):
+        ds = self._get_dataset('max')
+        derived = LanguagePairDataset(
+            ds.src1, ds.src_sizes, ds.src_dict,
+            None, ds.tgt_sizes, ds.tgt_dict,
+            src3=ds.src3, ref3=ds.ref3, shuffle=False,
+            src3_sizes=ds.src3_sizes,
+        )
+        self.assertNotIn('ref1', derived[0])
+        expected = ds.collater([ds[0], ds[1]])
+        batch = derived.collater([derived[0], derived[1]])
+        for key in ['ref1', 'ref2', 'target']:
+            self.assertTrue(torch.equal(batch[key], expected[key]))
+        for key, value in expected['net_input'].items():
+            self.assertTrue(torch.equal(batch['net_input'][key], value))
+
+    def test_collater_sorts(self):
+        ds = self._get_dataset('max')
+        batch = ds.collater([ds[1], ds[0]])
+        self.assertEqual(batch['id'].tolist(), [0, 1])
+        self.assertEqual(batch['net_input']['src_lengths'].tolist(), [3, 2])
+        self.assertEqual(batch['net_input']['src1_tokens'][1].tolist(), [1, 6, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
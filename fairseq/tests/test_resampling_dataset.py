@@ -99,6 +99,26 @@ class TestResamplingDataset(unittest.TestCase):
         # Allow tolerance in distribution error of 2%.
         assert results["max_distribution_diff"] < 0.02
 
+    def test_filter_indices_by_size(self):
+        resampling_dataset = ResamplingDataset(
+            self.dataset, self.weights, size_ratio=self.size_ratio, seed=0,
+        )
+        indices = resampling_dataset.ordered_indices()
+        kept, ignored = resampling_dataset.filter_indices_by_size(indices, 2)
+        assert all(resampling_dataset.size(i) <= 2 for i in kept)
+        assert all(resampling_dataset.size(i) > 2 for i in ignored)
+        assert len(kept) + len(ignored) == len(indices)
+        assert not resampling_dataset.can_reuse_epoch_itr_across_epochs
+
+    def test_edit_sampling_weights(self):
+        from fairseq.tasks.translation import edit_sampling_weights
+
+        edit_counts = np.array([0, 0, 0, 2, 1, 0])
+        weights = edit_sampling_weights(edit_counts, 0.5)
+        assert np.isclose(weights[edit_counts > 0].sum(), 0.5)
+        assert np.isclose(weights.sum(), 1.0)
+        assert edit_sampling_weights(np.zeros(3, dtype=np.int64), 0.5) is None
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,165 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import copy
+import os
+import tempfile
+import unittest
+
+import torch
+from fairseq.criterions.label_smoothed_cross_entropy import (
+    LabelSmoothedCrossEntropyCriterion,
+    label_smoothed_nll_loss,
+    nll_loss,
+)
+from fairseq.data import LanguagePairDataset
+from fairseq.models.transformer import TransformerModel
+from tests.test_sequence_generator import get_dummy_task_and_parser
+
+
+class TestSecocoEncoder(unittest.TestCase):
+    def setUp(self):
+        task, parser = get_dummy_task_and_parser()
+        TransformerModel.add_args(parser)
+        args = parser.parse_args([])
+        args.encoder_layers = 2
+        args.decoder_layers = 1
+        self.task, self.args = task, copy.deepcopy(args)
+        self.model = TransformerModel.build_model(args, task)
+        self.model.eval()
+        args.factorized_insert = True
+        self.factorized_model = TransformerModel.build_model(args, task)
+        self.factorized_model.eval()
+        self.pad = task.source_dictionary.pad()
+        eos = task.source_dictionary.eos()
+
+        # left-padded, src2 and src3 are src1 for the first sentence
+        self.src1 = torch.LongTensor([[4, 5, 6, eos], [self.pad, 7, 8, eos]])
+        self.src2 = torch.LongTensor([[4, 5, 6, eos], [self.pad, self.pad, 8, eos]])
+        self.src3 = torch.LongTensor([[self.pad, 4, 5, 6, eos], [9, 10, 7, 8, eos]])
+        self.is_dup = torch.BoolTensor([True, False])
+
+    def assertEncoderOutEqual(self, out, expected):
+        self.assertTrue(torch.equal(out.encoder_padding_mask, expected.encoder_padding_mask))
+        mask = ~expected.encoder_padding_mask
+        self.assertTrue(torch.allclose(
+            out.encoder_out.transpose(0, 1)[mask],
+            expected.encoder_out.transpose(0, 1)[mask],
+            atol=1e-5,
+        ))
+        self.assertTrue(torch.allclose(out.encoder_embedding, expected.encoder_embedding))
+
+    def _separate(self):
+        return [
+            self.model.encoder(tokens, src_lengths=None)
+            for tokens in [self.src1, self.src2, self.src3]
+        ]
+
+    def test_packed(self):
+        outs = self.model.encoder.forward_sources(
+            self.src1, self.src2, self.src3, packed=True,
+        )
+        for out, expected in zip(outs, self._separate()):
+            self.assertEncoderOutEqual(out, expected)
+
+    def test_dedup(self):
+        for packed in [False, True]:
+            outs = self.model.encoder.forward_sources(
+                self.src1, self.src2, self.src3,
+                src2_is_src1=self.is_dup, src3_is_src1=self.is_dup, packed=packed,
+            )
+            for out, expected in zip(outs, self._separate()):
+                self.assertEncoderOutEqual(out, expected)
+
+    def test_factorized_insert(self):
+        model = self.factorized_model
+        features, _ = model.encoder.extract_features(self.src1)
+        tokens = model.output_insert_tokens(model.insert_features(features)).argmax(-1)
+        self.assertTrue(torch.equal(model.predict_insert(features, threshold=0.0), tokens))
+        self.assertFalse(model.predict_insert(features, threshold=1.0).any())
+
+        # the gate gives the probability of not inserting
+        gate = model.output_insert_gate(model.insert_features(features))
+        lprobs = model.output_insert(features)
+        self.assertEqual(lprobs.size(-1), len(model.encoder.dictionary))
+        self.assertTrue(torch.allclose(lprobs[..., 0], gate[..., 0]))
+
+    def test_insert_shortlist(self):
+        d = self.task.source_dictionary
+        with tempfile.TemporaryDirectory() as dirname:
+            path = os.path.join(dirname, 'insert_shortlist.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('{} 10\n{} 3\n'.format(d[7], d[5]))
+            args = copy.deepcopy(self.args)
+            args.insert_shortlist = path
+            model = TransformerModel.build_model(args, self.task)
+        model.eval()
+        self.assertEqual(model.encoder.insert_shortlist.tolist(), [0, 7, 5])
+        ref2 = torch.LongTensor([[0, 5, 7, 9]])
+        self.assertEqual(model.insert_targets(ref2).tolist(), [[0, 2, 1, -1]])
+
+        features, _ = model.encoder.extract_features(self.src1)
+        self.assertEqual(model.output_insert(features).size(-1), 3)
+        self.assertTrue(all(
+            idx in [0, 7, 5] for idx in model.predict_insert(features).view(-1).tolist()
+        ))
+
+        # the shortlist is restored from the checkpoint without the file
+        restored = TransformerModel.build_model(copy.deepcopy(args), self.task)
+        restored.load_state_dict(model.state_dict())
+        self.assertEqual(restored.encoder.insert_shortlist.tolist(), [0, 7, 5])
+        self.assertEqual(restored.insert_targets(ref2).tolist(), [[0, 2, 1, -1]])
+
+    def _sample(self):
+        d = self.task.source_dictionary
+        src1 = [torch.LongTensor([4, 5, 6, 2]), torch.LongTensor([7, 8, 2]), torch.LongTensor([9, 2])]
+        ref1 = [torch.LongTensor([1, 0, 0, 0]), torch.LongTensor([0, 0, 0]), torch.LongTensor([0, 0])]
+        src2 = [torch.LongTensor([5, 6, 2]), torch.LongTensor([7, 8, 2]), torch.LongTensor([9, 2])]
+        ref2 = [torch.LongTensor([10, 0, 11]), torch.LongTensor([0, 0, 0]), torch.LongTensor([0, 0])]
+        src3 = [torch.LongTensor([10, 5, 6, 11, 2]), torch.LongTensor([7, 8, 2]), torch.LongTensor([9, 2])]
+        ref3 = [torch.LongTensor([12, 13, 2]), torch.LongTensor([14, 15, 16, 2]), torch.LongTensor([17, 2])]
+        ds = LanguagePairDataset(
+            src1, [len(t) for t in src1], d,
+            ref1, [len(t) for t in ref3], d,
+            src2, src3, ref2, ref3, shuffle=False,
+        )
+        return ds.collater([ds[i] for i in range(len(ds))])
+
+    def _full_vocab_loss(self, model, sample, eps):
+        # the loss with the heads applied to all the positions
+        net_output = model(**sample['net_input'])
+        lprobs = model.get_normalized_probs(net_output['translation']['out'], log_probs=True)
+        loss, _ = label_smoothed_nll_loss(
+            lprobs.view(-1, lprobs.size(-1)), sample['target'].view(-1, 1), eps,
+            ignore_index=self.pad,
+        )
+        net_input = sample['net_input']
+        for forward, tokens, ref in [
+            (model.forward_delete, net_input['src1_tokens'], sample['ref1']),
+            (model.forward_insert, net_input['src2_tokens'], sample['ref2']),
+        ]:
+            lprobs, mask = forward(tokens)
+            loss = loss + nll_loss(lprobs[~mask], ref[~mask])
+        return loss
+
+    def test_criterion(self):
+        sample = self._sample()
+        criterion = LabelSmoothedCrossEntropyCriterion(self.task, False, 0.1)
+        for model in [self.model, self.factorized_model]:
+            loss, _, logging_output = criterion(model, sample)
+            expected = self._full_vocab_loss(model, sample, 0.1)
+            self.assertAlmostEqual(loss.item(), expected.item(), places=4)
+
+            # every head is trained
+            model.zero_grad()
+            loss.backward()
+            encoder = model.encoder
+            for layer in [encoder.delete_layer, encoder.insert_layer, encoder.insert_gate]:
+                if layer is not None:
+                    self.assertIsNotNone(layer.weight.grad)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+'''
+batched and memoized fastBPE for the generate_data_* scripts
+
+BPE segments every word independently, so the segmentation of each distinct
+word is computed once, in a single fastBPE.apply call per batch, and kept in
+an LRU cache since words repeat heavily across lines.
+'''
+
+from collections import OrderedDict
+import re
+
+import fastBPE
+
+
+# tags of the rule.py scripts, e.g. <DropPro-[他]> or <Wrong-[幸]-[辛]-[0]>
+TAG_PATTERN = r'<[SEP|DropPro|DropPunc|Wrong].*?>'
+
+# number of lines read at once by the scripts
+CHUNK_SIZE = 10000
+
+
+class BPE(object):
+    def __init__(self, codes, cache_size=1000000):
+        self.bpe = fastBPE.fastBPE(codes)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def apply_words(self, words):
+        '''segmentations of words, with a single fastBPE call for the words
+        that are not cached'''
+        out = []
+        missing = []
+        for word in words:
+            seg = self.cache.get(word)
+            if seg is None:
+                missing.append(word)
+            else:
+                self.cache.move_to_end(word)
+            out.append(seg)
+
+        if len(missing) > 0:
+            missing = list(OrderedDict.fromkeys(missing))
+            segs = dict(zip(missing, self.bpe.apply(missing)))
+            for word, seg in segs.items():
+                self.cache[word] = seg
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            out = [segs[word] if seg is None else seg for word, seg in zip(words, out)]
+        return out
+
+    def apply(self, sentences):
+        '''same as fastBPE.apply'''
+        sentences_words = [sentence.split() for sentence in sentences]
+        segs = iter(self.apply_words([w for words in sentences_words for w in words]))
+        return [' '.join(next(segs) for _ in words) for words in sentences_words]
+
+    def apply_tagged(self, lines, pattern=TAG_PATTERN):
+        '''
+        split lines around the tags matching pattern and apply BPE to the
+        stripped segments between them, with a single call for all the lines
+
+        return, for every line, the list of its BPE segments (one more than
+        its tags) and the list of its tags
+        '''
+        lines_segs, lines_tags = [], []
+        for line in lines:
+            lines_tags.append(re.findall(pattern, line))
+            lines_segs.append([seg.strip() for seg in re.split(pattern, line)])
+            assert len(lines_segs[-1]) == len(lines_tags[-1]) + 1
+        segs = iter(self.apply([seg for segs in lines_segs for seg in segs]))
+        return [[next(segs) for _ in line_segs] for line_segs in lines_segs], lines_tags
+
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    '''yield lists of up to chunk_size lines of f'''
+    chunk = []
+    for line in f:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
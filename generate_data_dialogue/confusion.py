@@ -1,59 +1,45 @@
-import random
+import numpy as np
+
+from confusion_index import ConfusionIndex
+
 
 class Confusion(object):
-    def __init__(self):
-        self.tables = {}
-        name = 'generate_data_dialogue/confusion.filter.txt'
-        with open(name) as f:
-            for line in f:
-                k, vs = line.strip().split(':')
-                self.tables[k] = vs
-        self.tables_keys = list(self.tables.keys())
-    
+    '''
+    character confusions of confusion.filter.txt, backed by the compiled
+    ConfusionIndex (confusion.filter.idx, built on first use and rebuilt for
+    another vocab, the words whose table positions are precomputed)
+    '''
+    def __init__(self, name='generate_data_dialogue/confusion.filter.txt', vocab=None, seed=None):
+        self.index = ConfusionIndex.load_or_build(name, vocab=vocab)
+        self.rng = np.random.default_rng(seed)
+
     def getwords(self, key):
-        return self.tables[key]
+        return self.index.confusions(key)
 
     def getword(self, key):
-        return self.tables[key][random.randint(0, len(self.tables[key])-1)]
+        words = self.getwords(key)
+        return words[self.rng.integers(len(words))]
 
     def getrandword(self):
-        return self.tables_keys[random.randint(0, len(self.tables)-1)]
-    
-    def changeword(self, x):
-        x_len = len(x)
-        try_times = 0
-        while try_times < x_len:
-            try_times += 1
-            try_word = x[random.randint(0, len(x)-1)]
-            if try_word in self.tables:
-                rep_word = self.getword(try_word)
-                return x.replace(try_word, rep_word)
+        return chr(self.index.keys[self.rng.integers(len(self.index))])
 
-        return x
+    def changeword(self, x):
+        return self.index.change_words([x], self.rng, rand_prob=0.0)[0]
 
     def changerandword(self, x):
-        x_len = len(x)
-        try_times = 0
-        while try_times < x_len:
-            try_times += 1
-            try_word = x[random.randint(0, len(x)-1)]
-            if try_word in self.tables:
-                rep_word = self.getrandword()
-                return x.replace(try_word, rep_word)
-
-        return x
+        return self.index.change_words([x], self.rng, rand_prob=1.0)[0]
 
     def changeword_28(self, x):
-        if random.random()<0.2:
-            return self.changerandword(x)
-        else:
-            return self.changeword(x)
+        return self.changewords_28([x])[0]
+
+    def changewords_28(self, xs):
+        # changerandword for 20% of the words, changeword for the others
+        return self.index.change_words(xs, self.rng, rand_prob=0.2)
 
 if __name__ == '__main__':
     sent = '这是 一个 安静 的 早上 。'
     words = sent.split()
     confusion = Confusion()
-    for word in words:
-        ret = confusion.changeword_28(word)
+    for word, ret in zip(words, confusion.changewords_28(words)):
         if ret != word:
             print(ret)
@@ -0,0 +1,291 @@
+'''
+compiled index of the character confusion table (confusion.filter.txt)
+
+the table is parsed once and saved to a single file that every process
+memory-maps, see ConfusionIndex.load(). replacements for many words are
+picked at once with a numpy Generator, see ConfusionIndex.change_words().
+'''
+
+import hashlib
+import os
+
+import numpy as np
+
+
+MAGIC = b'CONFIDX\x00'
+VERSION = 2
+
+# name and dtype of the arrays of the index file, in order
+ARRAYS = [
+    # code points of the table characters, sorted
+    ('keys', np.uint32),
+    # confusions of keys[i]: candidates[cand_offsets[i]:cand_offsets[i + 1]]
+    ('cand_offsets', np.int64),
+    ('candidates', np.uint32),
+    # code points of the vocabulary words
+    ('vocab_offsets', np.int64),
+    ('vocab', np.uint32),
+    # positions of the table characters in each vocabulary word, and the
+    # index of these characters in keys
+    ('pos_offsets', np.int64),
+    ('positions', np.int32),
+    ('position_keys', np.int32),
+]
+
+
+def read_table(path):
+    table = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            k, vs = line.strip().split(':')
+            if len(vs) > 0:
+                table[k] = vs
+    return table
+
+
+def code_points(s):
+    return np.frombuffer(s.encode('utf-32-le'), dtype=np.uint32)
+
+
+def vocab_hash(vocab):
+    '''64-bit hash of the vocabulary words, in order'''
+    digest = hashlib.sha1('\n'.join(vocab).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def read_header(path):
+    '''version and vocabulary hash of the index file, None if it is not one'''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        header = np.frombuffer(f.read(16), dtype=np.uint64)
+    if len(header) < 2:
+        return None
+    return int(header[0]), int(header[1])
+
+
+class ConfusionIndex(object):
+
+    def __init__(self, arrays, vocab_hash=0):
+        for name, _ in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.vocab_hash = vocab_hash
+        self._key_ids = None
+        self._word_ids = None
+        # table positions of the words outside of vocab, see word_positions()
+        self._word_positions = {}
+
+    @classmethod
+    def build(cls, table_path, vocab=()):
+        '''
+        compile the table, precomputing the positions of its characters in
+        the words of vocab (words outside of it are handled at sampling time)
+        '''
+        table = read_table(table_path)
+        keys = sorted(table.keys())
+        key_ids = {k: i for i, k in enumerate(keys)}
+
+        arrays = {
+            'keys': code_points(''.join(keys)),
+            'cand_offsets': np.cumsum([0] + [len(table[k]) for k in keys]),
+            'candidates': code_points(''.join(table[k] for k in keys)),
+        }
+
+        vocab = list(vocab)
+        positions, position_keys, pos_sizes = [], [], []
+        for word in vocab:
+            word_positions = [i for i, c in enumerate(word) if c in key_ids]
+            positions.extend(word_positions)
+            position_keys.extend(key_ids[word[i]] for i in word_positions)
+            pos_sizes.append(len(word_positions))
+        arrays['vocab_offsets'] = np.cumsum([0] + [len(w) for w in vocab])
+        arrays['vocab'] = code_points(''.join(vocab))
+        arrays['pos_offsets'] = np.cumsum([0] + pos_sizes)
+        arrays['positions'] = np.array(positions, dtype=np.int32)
+        arrays['position_keys'] = np.array(position_keys, dtype=np.int32)
+
+        return cls(
+            {name: np.asarray(arrays[name], dtype=dtype) for name, dtype in ARRAYS},
+            vocab_hash(vocab),
+        )
+
+    def save(self, path):
+        # write to a temporary file first, other processes may be loading
+        tmp_path = '{}.{}'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            header = [VERSION, self.vocab_hash]
+            header += [len(getattr(self, name)) for name, _ in ARRAYS]
+            f.write(np.array(header, dtype=np.uint64).tobytes())
+            for name, dtype in ARRAYS:
+                f.write(np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes())
+                # keep the following arrays aligned
+                f.write(b'\x00' * (-f.tell() % 8))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        buf = np.memmap(path, dtype=np.uint8, mode='r')
+        assert bytes(buf[:len(MAGIC)]) == MAGIC, 'not a confusion index: {}'.format(path)
+        offset = len(MAGIC)
+        header = np.frombuffer(buf, dtype=np.uint64, count=len(ARRAYS) + 2, offset=offset)
+        assert header[0] == VERSION, 'unsupported confusion index version'
+        offset += header.nbytes
+
+        arrays = {}
+        for (name, dtype), count in zip(ARRAYS, header[2:].tolist()):
+            arrays[name] = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+            offset += arrays[name].nbytes
+            offset += -offset % 8
+        return cls(arrays, int(header[1]))
+
+    @classmethod
+    def load_or_build(cls, table_path, index_path=None, vocab=None):
+        '''
+        load the index compiled from table_path, compiling it first if it is
+        missing, older than the table, or compiled for another vocab (any
+        vocab is accepted if vocab is None)
+        '''
+        index_path = index_path or os.path.splitext(table_path)[0] + '.idx'
+        header = read_header(index_path) if os.path.exists(index_path) else None
+        if (
+            header is None
+            or header[0] != VERSION
+            or (vocab is not None and header[1] != vocab_hash(vocab))
+            or os.path.getmtime(index_path) < os.path.getmtime(table_path)
+        ):
+            cls.build(table_path, vocab or ()).save(index_path)
+        return cls.load(index_path)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def key_id(self, c):
+        '''index of the character c in keys, or -1'''
+        if self._key_ids is None:
+            self._key_ids = {chr(k): i for i, k in enumerate(self.keys.tolist())}
+        return self._key_ids.get(c, -1)
+
+    def lookup(self, words):
+        '''vocabulary ids of words, -1 for unknown words'''
+        if self._word_ids is None:
+            offsets = self.vocab_offsets.tolist()
+            text = self.vocab.tobytes().decode('utf-32-le')
+            self._word_ids = {
+                text[offsets[i]:offsets[i + 1]]: i for i in range(len(offsets) - 1)
+            }
+        return np.array([self._word_ids.get(w, -1) for w in words], dtype=np.int64)
+
+    def confusions(self, c):
+        '''the confusions of the character c, as a string'''
+        i = self.key_id(c)
+        if i < 0:
+            return ''
+        cands = self.candidates[self.cand_offsets[i]:self.cand_offsets[i + 1]]
+        return cands.tobytes().decode('utf-32-le')
+
+    def sample(self, lengths, starts, counts, positions, position_keys, rng, rand_prob=0.2):
+        '''
+        pick a character to replace and its replacement in n words
+
+        the k-th word has lengths[k] characters, counts[k] of them are in the
+        table, at positions[starts[k]:starts[k] + counts[k]]. like
+        Confusion.changeword, which probes up to len(word) random characters,
+        a word is changed with probability 1 - (1 - counts / lengths) ** lengths.
+        the replacement is a confusion of the character, or with probability
+        rand_prob any table character (Confusion.changerandword).
+
+        return the changed mask, the position of the replaced character (-1
+        if unchanged) and the code point of the replacement
+        '''
+        n = len(lengths)
+        lengths = np.maximum(lengths, 1)
+        changed = (counts > 0) & (rng.random(n) >= (1.0 - counts / lengths) ** lengths)
+        if not changed.any():
+            return changed, np.full(n, -1, dtype=np.int64), np.zeros(n, dtype=np.uint32)
+
+        pick = starts + (rng.random(n) * counts).astype(np.int64)
+        pick = np.where(changed, pick, 0)
+        char_pos = np.where(changed, positions[pick], -1).astype(np.int64)
+        keys = position_keys[pick]
+
+        cand_start = self.cand_offsets[keys]
+        num_cands = self.cand_offsets[keys + 1] - cand_start
+        replacement = self.candidates[cand_start + (rng.random(n) * num_cands).astype(np.int64)]
+        rand = rng.random(n) < rand_prob
+        random_keys = self.keys[rng.integers(len(self.keys), size=n)]
+        replacement = np.where(rand, random_keys, replacement)
+        return changed, char_pos, replacement
+
+    def sample_ids(self, word_ids, rng, rand_prob=0.2):
+        '''sample() for vocabulary words'''
+        word_ids = np.asarray(word_ids, dtype=np.int64)
+        starts = self.pos_offsets[word_ids]
+        return self.sample(
+            self.vocab_offsets[word_ids + 1] - self.vocab_offsets[word_ids],
+            starts,
+            self.pos_offsets[word_ids + 1] - starts,
+            self.positions,
+            self.position_keys,
+            rng,
+            rand_prob,
+        )
+
+    def word_positions(self, word):
+        '''
+        positions of the table characters in word and their key ids, computed
+        once per word like the precomputed ones of the vocab words
+        '''
+        keys = self._word_positions.get(word)
+        if keys is None:
+            keys = [(i, self.key_id(c)) for i, c in enumerate(word)]
+            keys = [(i, k) for i, k in keys if k >= 0]
+            self._word_positions[word] = keys
+        return keys
+
+    def sample_words(self, words, rng, rand_prob=0.2):
+        '''sample() for any words, see word_positions()'''
+        positions, position_keys, counts = [], [], []
+        for word in words:
+            keys = self.word_positions(word)
+            positions.extend(i for i, _ in keys)
+            position_keys.extend(k for _, k in keys)
+            counts.append(len(keys))
+        counts = np.array(counts, dtype=np.int64)
+        return self.sample(
+            np.array([len(w) for w in words], dtype=np.int64),
+            np.cumsum(counts) - counts,
+            counts,
+            np.array(positions + [0], dtype=np.int64),
+            np.array(position_keys + [0], dtype=np.int64),
+            rng,
+            rand_prob,
+        )
+
+    def change_words(self, words, rng, rand_prob=0.2):
+        '''
+        batched Confusion.changeword_28: return words with a character replaced
+        by one of its confusions (or any table character with probability
+        rand_prob), every occurrence of it being replaced like str.replace.
+        words without table characters may be returned unchanged.
+        '''
+        words = list(words)
+        ids = self.lookup(words) if len(self.vocab_offsets) > 1 else np.full(len(words), -1)
+        changed = np.zeros(len(words), dtype=bool)
+        char_pos = np.full(len(words), -1, dtype=np.int64)
+        replacement = np.zeros(len(words), dtype=np.uint32)
+
+        known = ids >= 0
+        if known.any():
+            changed[known], char_pos[known], replacement[known] = \
+                self.sample_ids(ids[known], rng, rand_prob)
+        if not known.all():
+            unknown = [w for w, k in zip(words, known) if not k]
+            changed[~known], char_pos[~known], replacement[~known] = \
+                self.sample_words(unknown, rng, rand_prob)
+
+        out = list(words)
+        for k in changed.nonzero()[0].tolist():
+            word = words[k]
+            out[k] = word.replace(word[char_pos[k]], chr(replacement[k]))
+        return out
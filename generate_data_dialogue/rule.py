@@ -1,60 +1,93 @@
 import sys
-import random
-
-import fastBPE
 
+from bpe_utils import BPE, CHUNK_SIZE, read_chunks
 from confusion import Confusion
 
 SUBS = set("我的 我 我们 我们的 你 你们 你自己 他们 他们的 他 他的 她 她的".split())
 PUNCS = set("， 。 ？".split())
+
+
+def is_candidate(token):
+    # tokens that may be replaced by a wrong word
+    return (
+        token not in SUBS and token not in PUNCS and token != '<SEP>'
+        and not token.endswith('@@')
+    )
+
+
+# the table positions of the words outside of the index vocab are computed
+# when they are first sampled, chunk by chunk, see ConfusionIndex.word_positions()
 confusion = Confusion()
-bpe = fastBPE.fastBPE('chat_translation_dialogue/exp_data/bpe.zh')
+bpe = BPE('chat_translation_dialogue/exp_data/bpe.zh')
 
-f = open(sys.argv[1])
 
-for zh in f:
-    zh = zh.strip()
-    # zh_tokens = [token for token in jieba.cut(zh) if len(token.strip())>0]
-    zh_tokens = [token for token in zh.split() if len(token.strip())>0]
-
-    # pro
-    temp = []
-    for token in zh_tokens:
-        # pros
-        if token in SUBS:
-            symbol = f'<DropPro-[{token}]>'
-            temp.append(symbol)
-        # puncs
-        elif token in PUNCS:
-            symbol = f'<DropPunc-[{token}]>'
-            temp.append(symbol)
-        # generate some wrong words
-        elif token == '<SEP>':
-            temp.append(token)
-        elif random.random() < 0.01 and not token.endswith('@@'):
-            rep = confusion.changeword_28(token)
-            i = 0
-            if rep != token:
-                rep_bpe = bpe.apply([rep])[0]
-                # 他们 -》 他@@ 门
-                rep_bpes = rep_bpe.split()
-                if len(rep_bpes) > 1:
-                    rep_bpes_len = len(rep_bpes)
-                    j = 0
-                    for i in range(rep_bpes_len):
-                        rep_bpe_char = rep_bpes[i].replace('@@', '')
-                        rep_bpe_char_len = len(rep_bpe_char)
-                        if rep_bpe_char != token[j:j+rep_bpe_char_len]:
-                            break
-                        j += rep_bpe_char_len
-
-                symbol = f"<Wrong-[{token}]-[{'|'.join(rep_bpes)}]-[{i}]>"
+def wrong_words(lines_tokens):
+    # generate some wrong words, for all the lines at once
+    candidates = [
+        (i, j)
+        for i, zh_tokens in enumerate(lines_tokens)
+        for j, token in enumerate(zh_tokens)
+        if is_candidate(token)
+    ]
+    selected = confusion.rng.random(len(candidates)) < 0.01
+    candidates = [c for c, s in zip(candidates, selected) if s]
+    reps = confusion.changewords_28([lines_tokens[i][j] for i, j in candidates])
+    reps_bpe = bpe.apply(reps)
+    return dict(zip(candidates, zip(reps, reps_bpe)))
+
+
+def process(lines):
+    lines_tokens = []
+    for zh in lines:
+        zh = zh.strip()
+        # zh_tokens = [token for token in jieba.cut(zh) if len(token.strip())>0]
+        lines_tokens.append([token for token in zh.split() if len(token.strip())>0])
+    wrongs = wrong_words(lines_tokens)
+
+    for line_idx, zh_tokens in enumerate(lines_tokens):
+        # pro
+        temp = []
+        for token_idx, token in enumerate(zh_tokens):
+            # pros
+            if token in SUBS:
+                symbol = f'<DropPro-[{token}]>'
+                temp.append(symbol)
+            # puncs
+            elif token in PUNCS:
+                symbol = f'<DropPunc-[{token}]>'
+                temp.append(symbol)
+            elif token == '<SEP>':
+                temp.append(token)
+            elif (line_idx, token_idx) in wrongs:
+                rep, rep_bpe = wrongs[(line_idx, token_idx)]
+                i = 0
+                if rep != token:
+                    # 他们 -》 他@@ 门
+                    rep_bpes = rep_bpe.split()
+                    if len(rep_bpes) > 1:
+                        rep_bpes_len = len(rep_bpes)
+                        j = 0
+                        for i in range(rep_bpes_len):
+                            rep_bpe_char = rep_bpes[i].replace('@@', '')
+                            rep_bpe_char_len = len(rep_bpe_char)
+                            if rep_bpe_char != token[j:j+rep_bpe_char_len]:
+                                break
+                            j += rep_bpe_char_len
+
+                    symbol = f"<Wrong-[{token}]-[{'|'.join(rep_bpes)}]-[{i}]>"
+                else:
+                    symbol = token
+                temp.append(symbol)
             else:
-                symbol = token
-            temp.append(symbol)
-        else:
-            temp.append(token)
+                temp.append(token)
+
+        sys.stdout.write(f"{' '.join(temp)}\n")
+
+
+f = open(sys.argv[1])
 
-    sys.stdout.write(f"{' '.join(temp)}\n")
+# wrong words and their BPE are computed for CHUNK_SIZE lines at once
+for lines in read_chunks(f, CHUNK_SIZE):
+    process(lines)
 
-f.close()
\ No newline at end of file
+f.close()
@@ -1,9 +1,10 @@
 import jieba
 import random
 import re
-import fastBPE
 
-zh_bpe = fastBPE.fastBPE('synthetic/bpe.zh')
+from bpe_utils import BPE, read_chunks
+
+zh_bpe = BPE('synthetic/bpe.zh')
 
 allowed_en = set("my i me we us you your yourself they their them he him his she her".split())
 allowed_zh = set("我的 我 我们 我们的 你 你们 你自己 他们 他们的 他 他的 她 她的".split())
@@ -20,7 +21,7 @@ for name in names:
 def rep_punc(matched):
     return matched.group()[0].strip()
 
-for zh in f_zh:
+def make_towrite(zh):
     zh = zh.strip()
     zh = zh.replace(',', '，').replace('?', '？')
     zh = re.sub(r'[。，？]\s+', rep_punc, zh)
@@ -42,10 +43,15 @@ for zh in f_zh:
     dpq_src = dp_src
     dpq_trg = dq_trg
 
-    towrite = [dp_src, dp_trg, dq_src, dq_trg, dpq_src, dpq_trg]
-    bpe_towrite = [zh_bpe.apply([s])[0] for s in towrite]
+    return [dp_src, dp_trg, dq_src, dq_trg, dpq_src, dpq_trg]
+
+for lines in read_chunks(f_zh):
+    chunk_towrite = [make_towrite(zh) for zh in lines]
+    # one BPE call for the six sentences of all the lines
+    bpe_towrite = iter(zh_bpe.apply([s for towrite in chunk_towrite for s in towrite]))
 
-    for i, name in enumerate(names):
-        bpe_name = name.replace('src', 'bpe.src').replace('trg', 'bpe.trg')
-        locals()[name].write(towrite[i]+'\n')
-        locals()[bpe_name].write(bpe_towrite[i]+'\n')
\ No newline at end of file
+    for towrite in chunk_towrite:
+        for i, name in enumerate(names):
+            bpe_name = name.replace('src', 'bpe.src').replace('trg', 'bpe.trg')
+            locals()[name].write(towrite[i]+'\n')
+            locals()[bpe_name].write(next(bpe_towrite)+'\n')
\ No newline at end of file